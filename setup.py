@@ -18,9 +18,15 @@ setup(
     python_requires='>=3.6',
     py_modules=['Qommute'],
     package_dir={'':'src'},
+    entry_points={
+        'console_scripts': [
+            'qommute=Qommute.bus.placement.batch:main',
+        ],
+    },
     install_requires = [
         'pytorch',
-        'qiskit',
+        # SeededSPSA in solve_context.py overrides SPSA internals of this release, see requirements.txt
+        'qiskit==0.44.1',
         'rustworkx',
         'pyqubo', 
         'sklearn'
@@ -0,0 +1,225 @@
+import json
+import os
+
+import numpy as np
+
+from qiskit_optimization import QuadraticProgram
+
+
+def interpolate_angles(point, reps):
+    """
+    Interpolates optimized QAOA angles of depth p into a starting point of depth p + 1
+
+    Parameters
+    ----------
+    point : list
+        The optimized angles of depth p, ordered as [beta_1 .. beta_p, gamma_1 .. gamma_p] like qiskit's QAOA ansatz
+    reps : int
+        The depth p the angles were optimized for
+
+    Returns
+    -------
+    new_point : list
+        The interpolated angles of depth p + 1, in the same order
+    """
+    point = np.asarray(point, dtype=float)
+    betas, gammas = point[:reps], point[reps:]
+
+    # pad both ends with zero so that angle i of the new schedule mixes angles i - 1 and i of the old one
+    i = np.arange(1, reps + 2)
+    padded_betas = np.concatenate(([0.0], betas, [0.0]))
+    padded_gammas = np.concatenate(([0.0], gammas, [0.0]))
+
+    new_betas = (i - 1) / reps * padded_betas[i - 1] + (reps - i + 1) / reps * padded_betas[i]
+    new_gammas = (i - 1) / reps * padded_gammas[i - 1] + (reps - i + 1) / reps * padded_gammas[i]
+
+    return list(np.concatenate((new_betas, new_gammas)))
+
+
+class AngleCache:
+    def __init__(self, file_path, max_distance=1.0):
+        """
+        A store of optimized variational parameters, keyed by problem size, circuit depth and normalized coefficient statistics
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the json file holding the stored parameters, created on the first store. Caches of
+            different problem families, e.g. bike placement and bus routing, are best kept in separate files
+        max_distance : float
+            The largest feature distance at which a stored entry is still used to seed a new run
+        """
+        self.file_path = file_path
+        self.max_distance = max_distance
+        self.entries = []
+
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as fp:
+                self.entries = json.load(fp)["entries"]
+
+    def problem_features(self, qp: QuadraticProgram):
+        """
+        Takes a quadratic program as input and returns its scale-free coefficient statistics
+
+        Parameters
+        ----------
+        qp : QuadraticProgram
+            The problem to describe
+
+        Returns
+        -------
+        features : numpy.ndarray
+            Mean and standard deviation of the linear and off-diagonal quadratic coefficients, divided by the largest absolute coefficient, and the coupling density
+        """
+        linear = qp.objective.linear.to_array()
+        quadratic = qp.objective.quadratic.to_array(symmetric=True)
+        n = len(linear)
+
+        # diagonal quadratic terms act as linear terms on binary variables
+        linear = linear + np.diag(quadratic)
+        couplings = quadratic[np.triu_indices(n, k=1)]
+
+        scale = max(np.max(np.abs(linear), initial=0.0), np.max(np.abs(couplings), initial=0.0))
+        if scale == 0:
+            scale = 1.0
+
+        linear = linear / scale
+        couplings = couplings / scale
+        nonzero = couplings[couplings != 0]
+
+        return np.array([
+            np.mean(linear) if n else 0.0,
+            np.std(linear) if n else 0.0,
+            np.mean(nonzero) if len(nonzero) else 0.0,
+            np.std(nonzero) if len(nonzero) else 0.0,
+            len(nonzero) / max(len(couplings), 1),
+        ])
+
+    def lookup(self, qp: QuadraticProgram, reps, num_parameters=None):
+        """
+        Finds the stored parameters of the nearest matching problem
+
+        Parameters
+        ----------
+        qp : QuadraticProgram
+            The problem about to be solved
+        reps : int
+            The circuit depth
+        num_parameters : int
+            If given, only entries with exactly this many parameters are considered
+
+        Returns
+        -------
+        point : list or None
+            The stored parameters, or None if no entry is close enough
+        """
+        n = qp.get_num_vars()
+        features = self.problem_features(qp)
+
+        best_point, best_distance = None, None
+        for entry in self.entries:
+            if entry["reps"] != reps:
+                continue
+            if num_parameters is not None and len(entry["point"]) != num_parameters:
+                continue
+
+            # relative size difference counts like a coefficient statistic
+            distance = np.linalg.norm(features - np.array(entry["features"]))
+            distance += abs(entry["num_qubits"] - n) / max(entry["num_qubits"], n, 1)
+
+            if best_distance is None or distance < best_distance:
+                best_point, best_distance = entry["point"], distance
+
+        if best_distance is None or best_distance > self.max_distance:
+            return None
+
+        return list(best_point)
+
+    def initial_point(self, qp: QuadraticProgram, reps):
+        """
+        Returns a QAOA starting point for the problem, trying in order: a stored point of the same depth,
+        a stored point of depth reps - 1 interpolated to depth reps, and all zeros
+
+        Parameters
+        ----------
+        qp : QuadraticProgram
+            The problem about to be solved
+        reps : int
+            The QAOA depth
+
+        Returns
+        -------
+        point : list
+            A list of 2 * reps angles
+        """
+        point = self.lookup(qp, reps, num_parameters=2 * reps)
+        if point is not None:
+            return point
+
+        if reps > 1:
+            point = self.lookup(qp, reps - 1, num_parameters=2 * (reps - 1))
+            if point is not None:
+                return interpolate_angles(point, reps - 1)
+
+        return [0.0] * 2 * reps
+
+    def store(self, qp: QuadraticProgram, reps, point, evals=None):
+        """
+        Saves optimized parameters for the problem and writes the cache to disk
+
+        Parameters
+        ----------
+        qp : QuadraticProgram
+            The problem that was solved
+        reps : int
+            The circuit depth
+        point : list
+            The optimized parameters
+        evals : int
+            The number of cost function evaluations the optimizer used
+        """
+        self.entries.append({
+            "num_qubits": qp.get_num_vars(),
+            "reps": reps,
+            "features": [float(f) for f in self.problem_features(qp)],
+            "point": [float(p) for p in point],
+            "evals": evals,
+        })
+
+        with open(self.file_path, 'w') as fp:
+            json.dump({"entries": self.entries}, fp)
+
+
+def benchmark_warm_start(solve, qp: QuadraticProgram, angle_cache: AngleCache):
+    """
+    Solves the problem once from scratch and once seeded from the cache, and reports the optimizer evaluations saved
+
+    Parameters
+    ----------
+    solve : callable
+        Called as solve(qp, angle_cache) with angle_cache either None or the cache, returns a MinimumEigenOptimizationResult
+    qp : QuadraticProgram
+        The problem to solve
+    angle_cache : AngleCache
+        The cache used for the warm start
+
+    Returns
+    -------
+    report : dict
+        The evaluation counts and objective values of the cold and warm runs
+    """
+    cold = solve(qp, None)
+    warm = solve(qp, angle_cache)
+
+    cold_evals = cold.min_eigen_solver_result.cost_function_evals
+    warm_evals = warm.min_eigen_solver_result.cost_function_evals
+
+    return {
+        "num_qubits": qp.get_num_vars(),
+        "cold_evals": cold_evals,
+        "warm_evals": warm_evals,
+        "saved_evals": cold_evals - warm_evals,
+        "saved_fraction": (cold_evals - warm_evals) / cold_evals if cold_evals else 0.0,
+        "cold_fval": cold.fval,
+        "warm_fval": warm.fval,
+    }
@@ -0,0 +1,178 @@
+import math
+import time
+
+import numpy as np
+import neal
+
+from .solve_context import SolveContext
+from .sample_processing import bqm_to_arrays, sampleset_to_arrays
+
+
+class AnnealTuner:
+    def __init__(self, confidence=0.99, batch_reads=16, max_reads=1000, min_sweeps=64, max_sweeps=4096,
+                 min_success=0.1, excitation_rate=0.01):
+        """
+        Picks the annealing schedule, sweep count and read count of neal from the problem instead of fixed values
+
+        Parameters
+        ----------
+        confidence : float
+            The target probability of having seen the best energy at least once before sampling stops
+        batch_reads : int
+            The number of reads sampled between two stopping checks
+        max_reads : int
+            The largest number of reads, sampling stops there whatever the confidence
+        min_sweeps : int
+            The number of sweeps of the first batch
+        max_sweeps : int
+            The largest number of sweeps per read
+        min_success : float
+            The sweep count is doubled while fewer reads than this reach the best energy
+        excitation_rate : float
+            The probability of a single flip of the smallest energy gap being accepted at the cold end of the schedule
+        """
+        self.confidence = confidence
+        self.batch_reads = batch_reads
+        self.max_reads = max_reads
+        self.min_sweeps = min_sweeps
+        self.max_sweeps = max_sweeps
+        self.min_success = min_success
+        self.excitation_rate = excitation_rate
+
+    def beta_range(self, linear, coupling):
+        """
+        Derives the hot and cold inverse temperatures from the coefficient distribution
+
+        Parameters
+        ----------
+        linear : numpy.ndarray
+            The linear coefficients
+        coupling : numpy.ndarray
+            The symmetric quadratic coefficients with a zero diagonal
+
+        Returns
+        -------
+        beta_range : tuple
+            At the hot end the largest possible single flip is accepted with probability 1/2.
+            At the cold end a move across the smallest typical gap is accepted with probability excitation_rate / n
+        """
+        n = len(linear)
+        abs_coupling = np.abs(coupling)
+
+        # the largest energy change a single flip can cause
+        largest = np.max(np.abs(linear) + abs_coupling.sum(axis=1), initial=0.0)
+
+        # the smallest non-zero coefficient of every variable, a low percentile of those is the typical smallest gap
+        magnitudes = np.where(abs_coupling > 0, abs_coupling, np.inf)
+        smallest = np.minimum(np.min(magnitudes, axis=1, initial=np.inf), np.where(linear != 0, np.abs(linear), np.inf))
+        smallest = smallest[np.isfinite(smallest)]
+
+        if largest == 0 or len(smallest) == 0:
+            return 0.1, 1.0
+
+        gap = np.percentile(smallest, 5)
+
+        # under a cardinality penalty the low lying states differ by swaps, whose gaps are differences of linear biases
+        differences = np.diff(np.sort(linear + coupling.sum(axis=1) / 2))
+        differences = differences[differences > 0]
+        if len(differences):
+            gap = min(gap, np.median(differences))
+
+        hot = math.log(2) / largest
+        cold = math.log(max(n, 1) / self.excitation_rate) / gap
+
+        return hot, max(cold, hot)
+
+    def sample(self, bqm, variables, seed=None):
+        """
+        Samples the model in batches until the best energy has been seen with the target confidence
+
+        Parameters
+        ----------
+        bqm : dimod.BinaryQuadraticModel
+            The model to sample
+        variables : list
+            The variable labels, in the order of the returned columns
+        seed : int or numpy.random.Generator
+            The seed of the annealer
+
+        Returns
+        -------
+        samples : numpy.ndarray
+            Every read, of shape (reads, n)
+        energies : numpy.ndarray
+            Their energies
+        report : dict
+            The chosen schedule, the number of reads and sweeps, the success probability and the time to solution
+        """
+        context = SolveContext(seed)
+        sa = neal.SimulatedAnnealingSampler()
+
+        linear, coupling, _ = bqm_to_arrays(bqm, variables)
+        beta_range = self.beta_range(linear, coupling)
+
+        num_sweeps = self.min_sweeps
+        all_samples, all_energies = [], []
+
+        # statistics of the reads taken with the current sweep count
+        setting_energies, setting_time = [], 0.0
+        success, stopped_early = 0.0, False
+        start = time.perf_counter()
+
+        while sum(len(e) for e in all_energies) < self.max_reads:
+            reads = min(self.batch_reads, self.max_reads - sum(len(e) for e in all_energies))
+
+            batch_start = time.perf_counter()
+            sampleset = sa.sample(bqm, num_reads=reads, num_sweeps=num_sweeps, beta_range=beta_range,
+                                  seed=context.child_seed())
+            setting_time += time.perf_counter() - batch_start
+
+            samples, energies = sampleset_to_arrays(sampleset, variables)
+            all_samples.append(samples)
+            all_energies.append(energies)
+            setting_energies.append(energies)
+
+            best = np.min(np.concatenate(all_energies))
+            current = np.concatenate(setting_energies)
+            hits = np.count_nonzero(current <= best + 1e-9)
+            success = hits / len(current)
+
+            # too few reads reach the best energy: anneal slower and restart the statistics
+            if success < self.min_success and num_sweeps < self.max_sweeps:
+                num_sweeps = min(2 * num_sweeps, self.max_sweeps)
+                setting_energies, setting_time = [], 0.0
+                continue
+
+            if hits >= 2 and 1 - (1 - success) ** len(current) >= self.confidence:
+                stopped_early = True
+                break
+
+        samples = np.concatenate(all_samples)
+        energies = np.concatenate(all_energies)
+
+        reads_at_setting = sum(len(e) for e in setting_energies)
+        time_per_read = setting_time / reads_at_setting if reads_at_setting else float("nan")
+
+        report = {
+            "beta_range": [float(b) for b in beta_range],
+            "num_sweeps": num_sweeps,
+            "num_reads": len(energies),
+            "best_energy": float(np.min(energies)),
+            "success_probability": success,
+            "time_to_solution": time_to_solution(time_per_read, success, self.confidence),
+            "elapsed": time.perf_counter() - start,
+            "stopped_early": stopped_early,
+        }
+
+        return samples, energies, report
+
+
+def time_to_solution(time_per_read, success, confidence=0.99):
+    """
+    The expected time to see the best energy at least once with the given confidence, from the time and success probability of a single read
+    """
+    if success >= 1:
+        return time_per_read
+    if success <= 0:
+        return float("inf")
+    return time_per_read * math.log(1 - confidence) / math.log(1 - success)
@@ -0,0 +1,292 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+
+import numpy as np
+import rustworkx as rw
+
+from .. import instrumentation
+from ..instrumentation import stage
+from ..bus.placement.getter_functions import GetterFunctions
+from ..bus.placement.graph_utils import Graph
+from ..bus.placement.qubo import QUBO
+from ..placement_terms import get_term_arrays, get_qubo_matrix
+from ..bus.pipeline import Pipeline
+from .synthetic_city import SyntheticCity
+
+SOLVERS = ("neal", "swap", "exact", "qaoa")
+
+# up to the 10k stations the synthetic city is built for, betweenness takes about 3 minutes per run at that size
+DEFAULT_SIZES = (100, 500, 1000, 2000, 10000)
+
+# the attributes that tell apart the same stage run on problems of different sizes
+SIZE_ATTRIBUTES = ("nodes", "qubits", "candidates")
+
+
+def get_metadata():
+    """
+    Describes the code and machine the results come from, so that two result files can be told apart
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "rustworkx": rw.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def stage_key(span):
+    """
+    Names a recorded stage by its name and problem size, e.g. "qubo.hamiltonian[nodes=8]", so that a library stage
+    run on both the full city and a subproblem gives one row per size
+    """
+    sizes = ["%s=%s" % (attribute, span["attributes"][attribute])
+             for attribute in SIZE_ATTRIBUTES if attribute in span["attributes"]]
+    return "%s[%s]" % (span["name"], ",".join(sizes)) if sizes else span["name"]
+
+
+def run_size(num_stations, data_dir, seed=0, max_duration=25, qubo_share=0.1, dense_nodes=4000, quantum_nodes=8,
+             stations=4, solvers=SOLVERS, routing=True):
+    """
+    Runs every stage of the pipeline once on a synthetic city and returns the recorded stages
+
+    Parameters
+    ----------
+    num_stations : int
+        The number of stations of the city
+    data_dir : str
+        The directory the city's csv files are written to
+    seed : int
+        The seed of the city and of the solvers
+    max_duration : float
+        The longest travel time in minutes that makes an edge
+    qubo_share : float
+        The share of the city's stations in the pyqubo problem and the annealers, pyqubo's dense penalty grows
+        quadratically so the whole city is too large
+    dense_nodes : int
+        The largest city whose whole dense QUBO matrix is built
+    quantum_nodes : int
+        The number of stations of the exact and QAOA problems, the same for every city so their stages are
+        marked fixed_size
+    stations : int
+        The number of stations to place
+    solvers : tuple
+        The solver backends to time, among SOLVERS
+    routing : bool
+        Whether to time a routing solve between three of the stations
+
+    Returns
+    -------
+    report : dict
+        The instrumentation report of the run, and in "solver_sizes" the number of nodes every solver stage ran on
+    """
+    profiler = instrumentation.enable()
+    solver_sizes = {}
+
+    with stage("bench.generate", stations=num_stations):
+        city = SyntheticCity(num_stations, seed=seed)
+        city.write(data_dir, max_duration=max_duration)
+
+    with stage("bench.loaders"):
+        getter = GetterFunctions(data_dir)
+        everything = dict(getter.coordinates)
+        f_list = getter.normalize(getter.get_no_of_people_at_station(everything, os.path.join(data_dir, "station_pop_clean.csv")))
+        g_list = getter.normalize(getter.get_distance_from_farthest_metro(everything, os.path.join(data_dir, "bus_metro_distance.csv")))
+        h_list = getter.normalize(getter.get_delay_from_nearest_station(everything, os.path.join(data_dir, "metro_delay.csv")))
+
+    with stage("bench.graph") as span:
+        graph = Graph(getter.coordinates, everything, getter.station_distances, f_list, g_list, h_list, max_duration=max_duration)
+        span.set(nodes=graph.graph.num_nodes(), edges=graph.graph.num_edges())
+
+    with stage("bench.centrality", nodes=graph.graph.num_nodes()):
+        bw_centrality = rw.betweenness_centrality(graph.graph)
+
+    if num_stations <= dense_nodes:
+        solver_sizes["qubo_dense"] = num_stations
+        with stage("bench.qubo_dense", qubits=num_stations):
+            edges, weights, costs = get_term_arrays(graph.graph, bw_centrality)
+            get_qubo_matrix(edges, weights, costs, stations)
+
+    def subproblem(size):
+        # the stations nearest to the center, connected like the real selections
+        order = np.argsort(np.linalg.norm(city.coordinates - np.array(city.center), axis=1))[:size]
+        selected = {city.names[i]: getter.coordinates[city.names[i]] for i in order}
+        subgraph = Graph(getter.coordinates, selected, getter.station_distances, f_list, g_list, h_list, max_duration=max_duration)
+        return subgraph, rw.betweenness_centrality(subgraph.graph)
+
+    subgraph, sub_centrality = subproblem(min(max(stations + 1, round(qubo_share * num_stations)), num_stations))
+    solver_sizes["qubo_build"] = subgraph.graph.num_nodes()
+    with stage("bench.qubo_build", qubits=subgraph.graph.num_nodes()):
+        qubo = QUBO(subgraph, subgraph.graph, sub_centrality, stations=stations)
+
+    if "neal" in solvers:
+        solver_sizes["neal"] = qubo.nodes
+        with stage("bench.solver.neal", qubits=qubo.nodes, num_reads=10):
+            qubo.get_top_solutions(k=1, num_reads=10, seed=seed)
+    if "swap" in solvers:
+        solver_sizes["swap"] = qubo.nodes
+        with stage("bench.solver.swap", qubits=qubo.nodes, num_reads=10):
+            qubo.get_swap_solution(num_reads=10, seed=seed)
+
+    if "exact" in solvers or "qaoa" in solvers:
+        small, small_centrality = subproblem(min(quantum_nodes, num_stations))
+        small_qubo = QUBO(small, small.graph, small_centrality, stations=min(stations, small.graph.num_nodes() - 1))
+        qp = small_qubo.create_problem()
+        if "exact" in solvers:
+            solver_sizes["exact"] = qp.get_num_vars()
+            with stage("bench.solver.exact", qubits=qp.get_num_vars(), fixed_size=True):
+                small_qubo.run_exact(qp)
+        if "qaoa" in solvers:
+            solver_sizes["qaoa"] = qp.get_num_vars()
+            with stage("bench.solver.qaoa", qubits=qp.get_num_vars(), fixed_size=True):
+                small_qubo.run_qaoa(qp, seed=seed)
+
+    if routing:
+        solver_sizes["routing"] = 3
+        with stage("bench.routing", depots=3):
+            Pipeline(data_dir).route(city.coordinates[:3], seed=seed)
+
+    instrumentation.disable()
+    report = profiler.report()
+    report["solver_sizes"] = solver_sizes
+    return report
+
+
+def run(sizes=DEFAULT_SIZES, repeats=3, seed=0, progress=None, **options):
+    """
+    Runs the pipeline on synthetic cities of every size and keeps the fastest of the repeats of every stage, stages
+    are keyed by stage_key
+
+    Parameters
+    ----------
+    sizes : tuple
+        The numbers of stations
+    repeats : int
+        The number of runs per size
+    seed : int
+        The seed of the cities and solvers
+    progress : callable
+        Called with every size once its repeats are done, if given
+    options : dict
+        Passed on to run_size
+
+    Returns
+    -------
+    results : dict
+        The metadata of the run and, for every size, the number of nodes every solver ran on and the wall time,
+        CPU time, peak RSS and sizes of every stage
+    """
+    results = {"metadata": get_metadata(), "options": dict(options, repeats=repeats, seed=seed), "runs": []}
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for size in sizes:
+            stages = {}
+            for _ in range(repeats):
+                report = run_size(size, data_dir, seed=seed, **options)
+                solver_sizes = report["solver_sizes"]
+                for span in report["stages"]:
+                    key = stage_key(span)
+                    attributes = dict(span["attributes"])
+                    best = stages.get(key)
+                    if best is None or attributes["wall_seconds"] < best["wall_seconds"]:
+                        stages[key] = attributes
+
+            results["runs"].append({"stations": size, "solver_sizes": solver_sizes, "stages": stages})
+            if progress is not None:
+                progress(size)
+
+    return results
+
+
+def compare(baseline, current, tolerance=0.2, min_seconds=0.01):
+    """
+    Lists the stages that got slower between two result files
+
+    Parameters
+    ----------
+    baseline : dict
+        The results of the earlier commit
+    current : dict
+        The results of the later commit
+    tolerance : float
+        The relative slow down that is reported
+    min_seconds : float
+        Stages faster than this in the baseline are too noisy to compare and skipped
+
+    Returns
+    -------
+    regressions : list
+        One dictionary per slower stage and size, slowest ratio first
+    """
+    previous = {(run["stations"], name): attributes["wall_seconds"]
+                for run in baseline["runs"] for name, attributes in run["stages"].items()}
+
+    regressions = []
+    for run in current["runs"]:
+        for name, attributes in run["stages"].items():
+            before = previous.get((run["stations"], name))
+            if before is None or before < min_seconds:
+                continue
+            ratio = attributes["wall_seconds"] / before
+            if ratio > 1 + tolerance:
+                regressions.append({"stations": run["stations"], "stage": name, "baseline_seconds": before,
+                                    "current_seconds": attributes["wall_seconds"], "ratio": ratio})
+
+    return sorted(regressions, key=lambda regression: -regression["ratio"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks of the placement and routing pipeline on synthetic cities")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="benchmark and write the results to a json file")
+    run_parser.add_argument("-o", "--output", default="benchmark.json")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--qubo-share", type=float, default=0.1)
+    run_parser.add_argument("--solvers", nargs="+", choices=SOLVERS, default=list(SOLVERS))
+    run_parser.add_argument("--no-routing", action="store_true")
+
+    compare_parser = commands.add_parser("compare", help="list the stages that got slower between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.sizes, args.repeats, args.seed, progress=lambda size: print("benchmarked", size, "stations"),
+                      qubo_share=args.qubo_share, solvers=tuple(args.solvers), routing=not args.no_routing)
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+        return
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.current) as fp:
+        current = json.load(fp)
+
+    regressions = compare(baseline, current, args.tolerance)
+    for regression in regressions:
+        print("{stage} at {stations} stations: {baseline_seconds:.4f}s -> {current_seconds:.4f}s ({ratio:.2f}x)".format(**regression))
+
+    # a non-zero exit lets a CI job fail on a regression
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
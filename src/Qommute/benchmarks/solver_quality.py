@@ -0,0 +1,378 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import rustworkx as rw
+import dimod
+import neal
+
+from qiskit.algorithms.minimum_eigensolvers import QAOA, SamplingVQE, NumPyMinimumEigensolver
+from qiskit.algorithms.optimizers import COBYLA
+from qiskit.circuit.library import RealAmplitudes
+from qiskit_optimization import QuadraticProgram
+from qiskit_optimization.algorithms import MinimumEigenOptimizer
+
+from ..placement_terms import get_qubo_matrix, cardinality_penalty
+from ..swap_search import SwapAnnealer
+from ..anneal_tuning import time_to_solution
+from ..solve_context import SolveContext
+from ..bus.routing.bus_routing import QuantumOptimizer, BusRoutingInstance
+from .synthetic_city import SyntheticCity
+
+# the largest problems every backend is run on, beyond them a backend is skipped
+BACKEND_LIMITS = {
+    "neal-10": 10000,
+    "neal-1000": 10000,
+    "swap": 10000,
+    "exact": 16,
+    "qaoa": 12,
+    "vqe": 12,
+}
+
+# the largest problem whose optimum is found by enumeration
+BRUTE_FORCE_LIMIT = 22
+
+
+def upper_triangular(quadratic, linear=None):
+    """
+    Folds a quadratic matrix and a linear vector into one upper triangular matrix U, with x^T U x the same energy for binary x
+    """
+    quadratic = np.asarray(quadratic, dtype=float)
+    U = np.triu(quadratic + quadratic.T, k=1)
+    U[np.diag_indices(len(U))] = np.diag(quadratic) + (0 if linear is None else np.asarray(linear, dtype=float))
+    return U
+
+
+def energies(U, offset, samples):
+    """
+    Evaluates x^T U x + offset for a batch of binary samples of shape (reads, n)
+    """
+    samples = np.asarray(samples, dtype=float)
+    return np.einsum("ri,ij,rj->r", samples, U, samples) + offset
+
+
+def brute_force(U, offset, cardinality=None, chunk_bits=16):
+    """
+    Finds the optimum of a small QUBO by enumerating every assignment, 2^chunk_bits at a time,
+    only among the assignments with `cardinality` ones if given
+
+    Returns
+    -------
+    x : numpy.ndarray
+        An optimal assignment
+    energy : float
+        Its energy
+    """
+    n = len(U)
+    if n > BRUTE_FORCE_LIMIT:
+        raise ValueError("brute force is limited to %d variables, got %d" % (BRUTE_FORCE_LIMIT, n))
+
+    bits = np.arange(n)
+    chunk = 1 << min(chunk_bits, n)
+    best_x, best_energy = None, np.inf
+
+    for first in range(0, 1 << n, chunk):
+        numbers = np.arange(first, first + chunk)
+        samples = (numbers[:, None] >> bits) & 1
+        if cardinality is not None:
+            samples = samples[samples.sum(axis=1) == cardinality]
+            if len(samples) == 0:
+                continue
+        values = energies(U, offset, samples)
+        index = np.argmin(values)
+        if values[index] < best_energy:
+            best_x, best_energy = samples[index].astype(np.int8), float(values[index])
+
+    return best_x, best_energy
+
+
+def placement_instance(city, size, stations=4, max_duration=25, cost_weights=(5, 3, 0.3), coefficients=(100, 100, None), seed=0):
+    """
+    Builds a placement QUBO over `size` random stations of a synthetic city, the same way the bus pipeline does.
+    A coefficient C of None is sized by cardinality_penalty, so that the optimum of the QUBO is a feasible placement
+    and the penalty solvers are scored on the problem they can actually solve
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(city.num_stations, size, replace=False)
+
+    features = np.column_stack((city.ridership[rows], city.metro_distance[rows], city.delay[rows])).astype(float)
+    spread = features.max(axis=0) - features.min(axis=0)
+    spread[spread == 0] = 1.0
+    costs = ((features - features.min(axis=0)) / spread) @ np.array(cost_weights)
+
+    durations = city.travel_times(rows)[:, rows]
+    starts, ends = np.nonzero(np.triu(durations <= max_duration, k=1))
+    edges = np.column_stack((starts, ends))
+
+    graph = rw.PyGraph()
+    graph.add_nodes_from(range(size))
+    graph.add_edges_from_no_data([tuple(edge) for edge in edges.tolist()])
+    bw_centrality = rw.betweenness_centrality(graph)
+    centrality = np.array([bw_centrality[i] for i in range(size)])
+
+    weights = centrality[edges[:, 0]] + centrality[edges[:, 1]]
+    if len(weights) and weights.max() > 0:
+        weights = weights / weights.max()
+
+    if coefficients[2] is None:
+        coefficients = (coefficients[0], coefficients[1], cardinality_penalty(edges, weights, costs, coefficients))
+    Q, offset = get_qubo_matrix(edges, weights, costs, stations, coefficients)
+
+    return {
+        "name": "placement-%d-%d" % (size, seed),
+        "kind": "placement",
+        "qubits": size,
+        "U": Q,
+        "offset": offset,
+        "swap": SwapAnnealer(edges, weights, costs, stations, coefficients),
+        "stations": stations,
+        "coefficients": coefficients,
+    }
+
+
+def routing_instance(city, depots, buses=2, seed=0):
+    """
+    Builds the routing QUBO between `depots` random stations of a synthetic city, as QuantumOptimizer does
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(city.num_stations, depots, replace=False)
+
+    _, _, instance = BusRoutingInstance(depots).generate_instance_from_coordinates(city.coordinates[rows])
+    Q, g, c, _ = QuantumOptimizer(instance, depots, buses).binary_representation()
+
+    return {
+        "name": "routing-%d-%d" % (depots, seed),
+        "kind": "routing",
+        "qubits": depots * (depots - 1),
+        "U": upper_triangular(Q, g),
+        "offset": float(c),
+        "swap": None,
+        "stations": None,
+        "coefficients": None,
+    }
+
+
+def to_quadratic_program(U, offset):
+    qp = QuadraticProgram()
+    n = len(U)
+    for i in range(n):
+        qp.binary_var("x%d" % i)
+
+    rows, cols = np.nonzero(np.triu(U, k=1))
+    qp.minimize(constant=offset, linear=np.diag(U).tolist(),
+                quadratic={(int(i), int(j)): float(U[i, j]) for i, j in zip(rows, cols)})
+    return qp
+
+
+def run_backend(backend, instance, seed=0):
+    """
+    Runs one backend on one instance
+
+    Returns
+    -------
+    run : dict
+        The energies of the returned samples, their probabilities (None when every read counts once), which of them
+        are feasible, the indices of the samples every read answered with, the energy of the best feasible sample,
+        the wall time of the run and the number of reads
+    """
+    U, offset = instance["U"], instance["offset"]
+    context = SolveContext(seed)
+
+    start = time.perf_counter()
+
+    if backend.startswith("neal"):
+        reads = int(backend.split("-")[1])
+        sampleset = neal.SimulatedAnnealingSampler().sample(dimod.BinaryQuadraticModel(U, "BINARY"), num_reads=reads,
+                                                            seed=context.child_seed())
+        samples = sampleset.record.sample[:, [sampleset.variables.index(i) for i in range(len(U))]]
+        values = sampleset.record.energy + offset
+        probabilities = None
+
+    elif backend == "swap":
+        samples, values = instance["swap"].sample(num_reads=10, num_sweeps=100, seed=context.rng)
+        reads = len(values)
+        probabilities = None
+
+    else:
+        qp = to_quadratic_program(U, offset)
+        if backend == "exact":
+            solver = NumPyMinimumEigensolver()
+        elif backend == "qaoa":
+            solver = QAOA(sampler=context.sampler(), optimizer=COBYLA(), reps=1, initial_point=[0.0, 0.0])
+        else:
+            ansatz = RealAmplitudes(len(U))
+            solver = SamplingVQE(sampler=context.sampler(), optimizer=context.spsa(maxiter=100), ansatz=ansatz,
+                                 initial_point=context.initial_point(ansatz))
+
+        result = MinimumEigenOptimizer(solver).solve(qp)
+
+        # the final state of the circuit, each sample with the probability of measuring it. The whole variational run
+        # is one read, whose answer is the best sample it returns
+        samples = np.array([sample.x for sample in result.samples])
+        values = np.array([sample.fval for sample in result.samples])
+        probabilities = np.array([sample.probability for sample in result.samples])
+        reads = 1
+        answer = np.flatnonzero(np.all(samples == result.x, axis=1))[0]
+
+    seconds = time.perf_counter() - start
+
+    # a placement must place exactly `stations` stations, the penalty alone does not guarantee it
+    values = np.asarray(values, dtype=float)
+    if instance["stations"] is None:
+        feasible = np.ones(len(values), dtype=bool)
+    else:
+        feasible = np.asarray(samples).sum(axis=1) == instance["stations"]
+
+    if probabilities is None:
+        answers = np.arange(len(values))
+    else:
+        answers = np.array([answer])
+
+    return {"energies": values, "probabilities": probabilities, "feasible": feasible, "answers": answers,
+            "best": float(values[feasible].min()) if feasible.any() else float("inf"), "seconds": seconds, "reads": reads}
+
+
+def evaluate(runs, optimum, tolerance=1e-6, confidence=0.99):
+    """
+    Scores the runs of every backend on one instance against its optimum, the best feasible energy. Only feasible
+    reads count as reaching it
+
+    Parameters
+    ----------
+    runs : dict
+        The run of every backend, see run_backend
+    optimum : float
+        The optimum of the instance, among the placements of exactly the requested number of stations for a
+        placement instance
+
+    Returns
+    -------
+    scores : dict
+        For every backend, the best feasible energy, the optimality gap, the share of the reads that answered with a
+        feasible sample and with the optimum, the wall time, the time to reach the optimum with the given confidence
+        and percentiles of the energies. Circuit backends also report the probability of the final state at the
+        optimum, which is not what their success is judged by
+    """
+    scores = {}
+    for backend, run in runs.items():
+        values, probabilities, feasible, answers = run["energies"], run["probabilities"], run["feasible"], run["answers"]
+        hits = feasible & (values <= optimum + tolerance * max(1.0, abs(optimum)))
+
+        if probabilities is None:
+            weights = np.full(len(values), 1.0 / len(values))
+        else:
+            weights = probabilities / probabilities.sum()
+
+        # a read succeeds when the sample it answers with is a feasible optimum, for a circuit backend the best
+        # sample of the whole run however unlikely its measurement
+        success = float(np.mean(hits[answers]))
+
+        # weighted percentiles of the energy distribution
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        percentiles = {"p%d" % q: float(values[order][min(np.searchsorted(cumulative, q / 100), len(values) - 1)])
+                       for q in (10, 50, 90)}
+
+        scores[backend] = {
+            "best_energy": run["best"],
+            "target_energy": optimum,
+            "gap": (run["best"] - optimum) / max(abs(optimum), 1e-9),
+            "feasible_probability": float(np.mean(feasible[answers])),
+            "success_probability": success,
+            "seconds": run["seconds"],
+            "reads": run["reads"],
+            # a read of a circuit backend is the whole variational run
+            "time_to_target": time_to_solution(run["seconds"] / run["reads"], success, confidence),
+            "energies": percentiles,
+        }
+        if probabilities is not None:
+            scores[backend]["state_probability"] = float(np.sum(weights[hits]))
+
+    return scores
+
+
+def run(placement_sizes=(8, 12, 16), routing_depots=(3, 4), instances=3, backends=tuple(BACKEND_LIMITS), seed=0, city_size=500):
+    """
+    Runs every backend on a corpus of placement and routing instances
+
+    Returns
+    -------
+    results : dict
+        One entry per instance with its optimum and the scores of every backend, and the recommendation per size
+    """
+    city = SyntheticCity(city_size, seed=seed)
+    corpus = [placement_instance(city, size, seed=seed + i) for size in placement_sizes for i in range(instances)]
+    corpus += [routing_instance(city, depots, seed=seed + i) for depots in routing_depots for i in range(instances)]
+
+    results = {"instances": []}
+    for instance in corpus:
+        runs = {backend: run_backend(backend, instance, seed) for backend in backends
+                if instance["qubits"] <= BACKEND_LIMITS[backend] and not (backend == "swap" and instance["swap"] is None)}
+
+        if instance["qubits"] <= BRUTE_FORCE_LIMIT:
+            # a placement is only feasible with exactly `stations` stations, whatever the penalty's unconstrained optimum
+            _, optimum = brute_force(instance["U"], instance["offset"], cardinality=instance["stations"])
+            exact = True
+        else:
+            # beyond enumeration the best feasible energy any backend found stands in for the optimum
+            optimum, exact = min(run["best"] for run in runs.values()), False
+
+        results["instances"].append({"name": instance["name"], "kind": instance["kind"], "qubits": instance["qubits"],
+                                     "stations": instance["stations"], "optimum": optimum, "optimum_is_exact": exact,
+                                     "scores": evaluate(runs, optimum)})
+        print("evaluated", instance["name"])
+
+    results["recommendations"] = recommend(results["instances"])
+    return results
+
+
+def recommend(instances):
+    """
+    Picks, for every kind of problem and number of qubits, the backend with the smallest median time to target.
+    A backend that never returned a feasible sample, e.g. a placement of the wrong number of stations, is not
+    recommended, nor is any backend when none reached the target
+
+    Returns
+    -------
+    recommendations : list
+        For every kind and size, the backend (None when none qualifies) and the median time to target of every backend
+    """
+    groups = {}
+    for instance in instances:
+        for backend, score in instance["scores"].items():
+            groups.setdefault((instance["kind"], instance["qubits"]), {}).setdefault(backend, []).append(score)
+
+    recommendations = []
+    for (kind, qubits), backends in sorted(groups.items()):
+        medians = {backend: float(np.median([score["time_to_target"] for score in scores]))
+                   for backend, scores in backends.items()}
+        candidates = [backend for backend, scores in backends.items()
+                      if all(score["feasible_probability"] > 0 for score in scores) and np.isfinite(medians[backend])]
+        best = min(candidates, key=medians.get) if candidates else None
+        recommendations.append({"kind": kind, "qubits": qubits, "backend": best, "median_time_to_target": medians})
+
+    return recommendations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solution quality against time of every solver backend")
+    parser.add_argument("-o", "--output", default="solver_quality.json")
+    parser.add_argument("--placement-sizes", type=int, nargs="+", default=[8, 12, 16])
+    parser.add_argument("--routing-depots", type=int, nargs="+", default=[3, 4])
+    parser.add_argument("--instances", type=int, default=3, help="the number of instances per size")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKEND_LIMITS), default=list(BACKEND_LIMITS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = run(args.placement_sizes, args.routing_depots, args.instances, tuple(args.backends), args.seed)
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2)
+
+    for recommendation in results["recommendations"]:
+        times = ", ".join("%s %.3gs" % item for item in sorted(recommendation["median_time_to_target"].items(), key=lambda item: item[1]))
+        print("{kind} {qubits} qubits: {backend} ({times})".format(times=times, **recommendation))
+
+
+if __name__ == "__main__":
+    main()
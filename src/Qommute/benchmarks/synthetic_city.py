@@ -0,0 +1,175 @@
+import csv
+import os
+
+import numpy as np
+
+from ..geo import haversine
+
+
+class SyntheticCity:
+    def __init__(self, num_stations, seed=0, center=(40.76903, -73.969649), inner_radius=0.1, outer_radius=0.44,
+                 stations_per_neighborhood=25, speed_kmh=18.0):
+        """
+        Generates a city of any size shaped like the real placement data: stations clustered in neighborhoods,
+        ridership, metro distances, delays and travel times
+
+        Parameters
+        ----------
+        num_stations : int
+            The number of stations
+        seed : int
+            The seed of the generator, the same seed gives the same city
+        center : tuple
+            The latitude and longitude of the center, the one get_selected_locations measures from
+        inner_radius : float
+            The smallest distance in degrees of a station from the center
+        outer_radius : float
+            The largest distance in degrees of a station from the center, so that every station falls in the
+            ring get_selected_locations samples from
+        stations_per_neighborhood : int
+            The average number of stations around one neighborhood center
+        speed_kmh : float
+            The average bus speed along the street network
+        """
+        rng = np.random.default_rng(seed)
+        self.num_stations = num_stations
+        self.center = center
+        self.speed_kmh = speed_kmh
+
+        # neighborhood centers spread uniformly over the ring, stations scattered around them
+        neighborhoods = max(1, num_stations // stations_per_neighborhood)
+        radius = np.sqrt(rng.uniform(inner_radius**2, outer_radius**2, neighborhoods))
+        angle = rng.uniform(0, 2 * np.pi, neighborhoods)
+        hubs = np.column_stack((center[0] + radius * np.sin(angle), center[1] + radius * np.cos(angle)))
+
+        members = rng.integers(0, neighborhoods, num_stations)
+        points = hubs[members] + rng.normal(0, 0.015, (num_stations, 2))
+
+        # pull strays back into the ring along their direction from the center
+        offset = points - np.array(center)
+        distance = np.linalg.norm(offset, axis=1)
+        clipped = np.clip(distance, inner_radius, outer_radius)
+        self.coordinates = np.array(center) + offset * (clipped / np.maximum(distance, 1e-12))[:, None]
+
+        self.names = ["Synthetic %05d" % i for i in range(num_stations)]
+
+        # busier neighborhoods have busier stations
+        popularity = rng.lognormal(0.0, 0.5, neighborhoods)
+        self.ridership = np.round(rng.lognormal(3.0, 1.0, num_stations) * popularity[members], 1)
+
+        # stations far from the center are far from the metro
+        self.metro_distance = np.round(2 + 25 * clipped + rng.exponential(1.5, num_stations), 4)
+
+        self.delay = rng.integers(1, 11, num_stations)
+        self.busiest_line = rng.choice(list("1234567ABCDEFGJLMNQRSZ"), num_stations)
+
+        # a detour factor per station, a trip takes the mean of its two ends, so travel times are symmetric
+        self.detour = rng.uniform(1.2, 1.6, num_stations)
+
+    def travel_times(self, rows=None):
+        """
+        Returns the travel times in minutes from the given stations to every station
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            The indices of the start stations, every station if None
+
+        Returns
+        -------
+        durations : numpy.ndarray
+            A float32 array of shape (len(rows), num_stations)
+        """
+        rows = np.arange(self.num_stations) if rows is None else np.asarray(rows)
+        lat, lon = self.coordinates[:, 0], self.coordinates[:, 1]
+
+        km = haversine(lat[rows, None], lon[rows, None], lat[None, :], lon[None, :])
+        detour = (self.detour[rows, None] + self.detour[None, :]) / 2
+
+        return (60 * km * detour / self.speed_kmh).astype(np.float32)
+
+    def edges(self, max_duration=40, max_neighbors=30, block=1024):
+        """
+        Returns the directed pairs of stations within max_duration of each other, without ever holding the full matrix
+
+        Parameters
+        ----------
+        max_duration : float
+            The longest travel time in minutes that is kept
+        max_neighbors : int
+            The largest number of pairs kept per start station, the fastest ones
+        block : int
+            The number of start stations whose travel times are computed at once
+
+        Returns
+        -------
+        starts : numpy.ndarray
+            The start station of every pair
+        ends : numpy.ndarray
+            The end station of every pair
+        durations : numpy.ndarray
+            The travel time of every pair in minutes
+        """
+        starts, ends, durations = [], [], []
+
+        for first in range(0, self.num_stations, block):
+            rows = np.arange(first, min(first + block, self.num_stations))
+            times = self.travel_times(rows)
+            times[np.arange(len(rows)), rows] = np.inf
+
+            # the max_neighbors fastest trips of every row, then the ones short enough
+            k = min(max_neighbors, self.num_stations - 1)
+            nearest = np.argpartition(times, k - 1, axis=1)[:, :k] if k > 0 else np.zeros((len(rows), 0), dtype=int)
+            nearest_times = np.take_along_axis(times, nearest, axis=1)
+            keep = nearest_times <= max_duration
+
+            starts.append(np.broadcast_to(rows[:, None], nearest.shape)[keep])
+            ends.append(nearest[keep])
+            durations.append(nearest_times[keep])
+
+        return np.concatenate(starts), np.concatenate(ends), np.concatenate(durations)
+
+    def write(self, data_dir, max_duration=40, max_neighbors=30):
+        """
+        Writes the city as the csv files GetterFunctions reads, so that the real loaders can be run on it
+
+        Parameters
+        ----------
+        data_dir : str
+            The directory to write to, created if missing
+        max_duration : float
+            The longest travel time written to station_distance.csv
+        max_neighbors : int
+            The largest number of travel times written per start station
+        """
+        os.makedirs(data_dir, exist_ok=True)
+
+        with open(os.path.join(data_dir, "bus_station_location.csv"), 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["NTAName", "Latitude", "Longitude"])
+            for name, (lat, lon) in zip(self.names, self.coordinates.tolist()):
+                writer.writerow([name, "%.6f" % lat, "%.6f" % lon])
+
+        starts, ends, durations = self.edges(max_duration, max_neighbors)
+        with open(os.path.join(data_dir, "station_distance.csv"), 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["start", "end", "duration (mins)"])
+            writer.writerows(zip([self.names[i] for i in starts], [self.names[i] for i in ends], durations.tolist()))
+
+        with open(os.path.join(data_dir, "station_pop_clean.csv"), 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["", "NTAName", "Location", "total people"])
+            for i, (name, (lat, lon)) in enumerate(zip(self.names, self.coordinates.tolist())):
+                writer.writerow([i, name, "%.6f,%.6f" % (lat, lon), self.ridership[i]])
+
+        with open(os.path.join(data_dir, "bus_metro_distance.csv"), 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["start", "end", "distance (km)"])
+            for i, name in enumerate(self.names):
+                writer.writerow([name, "Metro %s" % self.busiest_line[i], self.metro_distance[i]])
+
+        with open(os.path.join(data_dir, "metro_delay.csv"), 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["", "bus_stations", "busiest_line", "predicted_delay"])
+            for i, name in enumerate(self.names):
+                writer.writerow([i, name, self.busiest_line[i], self.delay[i]])
@@ -1,41 +1,65 @@
+import json
+import os
 import random
 import rustworkx
 import matplotlib.pyplot as plt
 from rustworkx.visualization import mpl_draw
-from getter_functions import get_train_station_location, calculate_distance_from_api, get_station_distance, min_max_normalize, get_number_riders, clean, get_distance_from_nearest_site
-from graph_utils import make_node_edge, make_graph, visualize
-from qubo import QUBOPlacement
+from .getter_functions import get_train_station_location, calculate_distance_from_api, get_station_distance, min_max_normalize, get_number_riders, clean, get_distance_from_nearest_site
+from .graph_utils import make_node_edge, make_graph, visualize
+from .qubo import QUBOPlacement
+from ..stage_cache import StageCache
+from ..instrumentation import stage
+
+# the csv files shipped next to this module, so that the planner works from any working directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 
 class bikeStationPlanner:
-    def __init__(self):
+    def __init__(self, data_dir=DATA_DIR, cache: StageCache = None):
+        # every stage goes through the cache, which loads its output from disk when its inputs did not change
+        cache = cache or StageCache(enabled=False)
+        self.cache = cache
+
         # Step 1: Get the bike station locations
-        self.coordinates = get_train_station_location("bike_placement/data/DOITT_SUBWAY_STATION_01_13SEPT2010.csv")
+        location_file = os.path.join(data_dir, "DOITT_SUBWAY_STATION_01_13SEPT2010.csv")
+        coordinates, coordinates_key = cache.run("train_station_location", get_train_station_location, location_file, files=(location_file,))
 
         # f
-        self.station_rider_sums = get_number_riders("bike_placement/data/Annual Total-Table 1.csv")
+        riders_file = os.path.join(data_dir, "Annual Total-Table 1.csv")
+        station_rider_sums, riders_key = cache.run("number_riders", get_number_riders, riders_file, files=(riders_file,))
 
         # clean data
-        self.coordinates, self.station_rider_sums = clean(self.coordinates, self.station_rider_sums)
+        (self.coordinates, self.station_rider_sums), clean_key = cache.run("clean", clean, coordinates, station_rider_sums, inputs=(coordinates_key, riders_key))
 
         # Step 2: Get the distance between the bike stations
-        self.stations_dic = get_station_distance(self.coordinates, "bike_placement/data/stations.csv")
+        distance_file = os.path.join(data_dir, "stations.csv")
+        self.stations_dic, distance_key = cache.run("station_distance", get_station_distance, self.coordinates, distance_file, files=(distance_file,), inputs=(clean_key,))
 
         # g
-        self.min_station_dist = get_distance_from_nearest_site(self.stations_dic)
+        self.min_station_dist, site_key = cache.run("nearest_site", get_distance_from_nearest_site, self.stations_dic, inputs=(distance_key,))
 
         # Make a list of nodes and edges from the selected coordinates and stations dictionary
-        self.node_dic, self.index_dic, self.edge_dic = make_node_edge(self.station_rider_sums, self.min_station_dist, self.stations_dic)
+        (self.node_dic, self.index_dic, self.edge_dic), node_edge_key = cache.run("node_edge", make_node_edge, self.station_rider_sums, self.min_station_dist, self.stations_dic, inputs=(clean_key, site_key, distance_key))
+
+        # inverse of index_dic, the station name of every node index
+        self.names = [None] * len(self.index_dic)
+        for name, index in self.index_dic.items():
+            self.names[index] = name
 
         # Step 3: Make a graph and calculate the betweenness centrality
-        self.graph, self.bw_centrality = make_graph(self.node_dic, self.index_dic, self.edge_dic)
+        with stage("planner.graph", nodes=len(self.node_dic), edges=len(self.edge_dic)):
+            (self.graph, self.bw_centrality), _ = cache.run("graph", make_graph, self.node_dic, self.index_dic, self.edge_dic, inputs=(node_edge_key,))
+        if cache.enabled:
+            cache.evict()
 
     def create_qubo(self):
         # Step 5: Get the QUBO coefficients
-        self.qubo = QUBOPlacement(self.graph, self.bw_centrality, self.node_dic, self.index_dic)
+        with stage("planner.create_qubo", nodes=len(self.node_dic)):
+            self.qubo = QUBOPlacement(self.graph, self.bw_centrality, self.node_dic, self.index_dic)
 
     def solve_qubo(self):
         # Step 6: Create the QUBO problem
-        qubo_form = self.qubo.create_problem()
+        with stage("planner.create_problem"):
+            qubo_form = self.qubo.create_problem()
 
         # Step 7: Get the best sample
         best_sample = self.qubo.get_best_sample()
@@ -53,31 +77,25 @@ class bikeStationPlanner:
         # print(exact_result.pretty_print())
         return best_sample
 
-    def save_selected_nodes(self,best_sample):
-        # Step 10: Save the results for the routing problem
-        # Extract the node information from the best sample
-        selected_nodes = []
-        index = 0
-        for key, value in best_sample.items():
-            if value == 1:
-                selected_nodes.append(index)
-            index += 1
+    def get_selected_stations(self, best_sample):
+        # decode the sample into the names of the selected stations through the inverse index
+        return [self.names[i] for i in range(len(self.names)) if best_sample["x[%d]" % i] == 1]
 
+    def save_selected_nodes(self, best_sample, file_path="citi_bike_locations.json"):
+        # Step 10: Save the results for the routing problem, by default into the working directory
         # Extracting the name and coordinates of the selected nodes into a dictionary then to a json file
         selected_nodes_dic = {"depots": []}
-        for i in selected_nodes:
-            for key, value in self.index_dic.items():
-                if value == i:
-                    selected_nodes_dic["depots"].append({"lat": self.coordinates[key][0], "lon": self.coordinates[key][1]})
+        for name in self.get_selected_stations(best_sample):
+            selected_nodes_dic["depots"].append({"lat": self.coordinates[name][0], "lon": self.coordinates[name][1]})
 
-        import json
-        with open('bike_placement/citi_bike_locations.json', 'w') as fp:
+        with open(file_path, 'w') as fp:
             json.dump(selected_nodes_dic, fp)
 
 # DEMO
 
 if __name__ == "__main__":
-    bike_station_planner = bikeStationPlanner()
+    bike_station_planner = bikeStationPlanner(cache=StageCache())
+    print(bike_station_planner.cache.report())
     bike_station_planner.create_qubo()
     best_sample = bike_station_planner.solve_qubo()
     bike_station_planner.save_selected_nodes(best_sample)
@@ -1,7 +1,7 @@
+import numpy as np
 import rustworkx
-import matplotlib.pyplot as plt
-from rustworkx.visualization import mpl_draw
-import matplotlib.pyplot as plt
+
+from ..rendering import render_graph
 
 def make_node_edge(station_rider_sums, min_station_dist,stations_dic ):
     """
@@ -95,27 +95,41 @@ def make_graph(node_dic, index_dic, edge_dic):
 
     return graph, bw_centrality
 
-def visualize(bw_centrality, graph):
-    # Generate a color list
-    colors = []
-    for node in graph.node_indices():
-        colors.append(bw_centrality[node])
-
-    # Create a larger figure with a specified size
-    plt.figure(figsize=(200, 200))
-
-    # Generate a visualization with a colorbar
-    plt.rcParams['figure.figsize'] = [15, 10]
-    ax = plt.gca()
-    sm = plt.cm.ScalarMappable(norm=plt.Normalize(
-        vmin=min(bw_centrality.values()),
-        vmax=max(bw_centrality.values())
-    ))
-    plt.colorbar(sm, ax=ax)
-    plt.title("Betweenness Centrality : ")
-
-    # Draw the graph with enlarged size
-    mpl_draw(graph, node_color=colors, ax=ax)
-
-    # Show the plot
-    plt.show()
\ No newline at end of file
+def visualize(bw_centrality, graph, coordinates=None, file_path=None):
+    """
+    Draws the graph colored by betweenness centrality, headless and with thinned edges for large graphs
+
+    Parameters
+    ----------
+    bw_centrality : dict
+        The betweenness centrality of every node index
+    graph : rustworkx.PyGraph
+        The graph of make_graph
+    coordinates : dict
+        The latitude and longitude of every station name, a spring layout is used if None
+    file_path : str
+        The png file to write, if given
+
+    Returns
+    -------
+    figure : matplotlib.figure.Figure
+        The figure, e.g. to show it in a notebook
+    """
+    nodes = list(graph.node_indices())
+    colors = np.array([bw_centrality[node] for node in nodes])
+
+    if coordinates is not None:
+        positions = np.array([coordinates[graph[node]["name"]][::-1] for node in nodes], dtype=float)
+    else:
+        layout = rustworkx.spring_layout(graph, seed=0)
+        positions = np.array([layout[node] for node in nodes])
+
+    # node indices are positions in the arrays above
+    position_of = np.full(max(nodes, default=-1) + 1, -1)
+    position_of[nodes] = np.arange(len(nodes))
+    edges = position_of[np.array(graph.edge_list(), dtype=np.int64).reshape(-1, 2)]
+    weights = np.array(graph.edges(), dtype=float)
+
+    # the shortest edges are the ones kept when there are too many to draw
+    return render_graph(positions, edges, node_values=colors, edge_weights=-weights, file_path=file_path,
+                        title="Betweenness Centrality : ")
@@ -3,10 +3,8 @@ from pyqubo import Array
 from pprint import pprint
 import neal
 
-from qiskit.utils import algorithm_globals
 from qiskit.algorithms.minimum_eigensolvers import QAOA, NumPyMinimumEigensolver
 from qiskit.algorithms.optimizers import COBYLA
-from qiskit.primitives import Sampler
 from qiskit_optimization.algorithms import (
     MinimumEigenOptimizer,
     RecursiveMinimumEigenOptimizer,
@@ -21,13 +19,28 @@ import numpy as np
 from qiskit_optimization.translators import from_docplex_mp
 from docplex.mp.model import Model
 
+from ..angle_cache import AngleCache
+from ..solve_context import SolveContext
+from ..placement_terms import get_term_arrays, decode_selection
+from ..swap_search import SwapAnnealer
+from ..multilevel import MultilevelSolver
+from ..sample_processing import get_variable_order, postprocess, postprocess_arrays
+from ..anneal_tuning import AnnealTuner
+from ..instrumentation import stage
+
 
 class QUBOPlacement:
-    def __init__(self, graph, bw_centrality, node_dic, index_dic):
+    def __init__(self, graph, bw_centrality, node_dic, index_dic, docks=2, coefficients=(100, 100, 100)):
         self.graph = graph
         self.bw_centrality = bw_centrality
         self.node_dic = node_dic
         self.index_dic = index_dic
+        self.docks = docks
+        self.coefficients = coefficients
+
+        # built on first use and kept, so that a placement kept by a long-lived process solves without rebuilding
+        self.bqm = None
+        self.terms = None
     
     def get_H(self):
         
@@ -39,18 +52,18 @@ class QUBOPlacement:
 
         #####calculate H_1#####
         H_1 = 0
-        weight_max = None
 
-        for edge in self.graph.edge_list():
-            # here weight (cost) is betweenness centrality of nodes in the edge
-            weight = self.bw_centrality[edge[0]] + self.bw_centrality[edge[1]]
+        # here weight (cost) is betweenness centrality of nodes in the edge
+        edges = self.graph.edge_list()
+        weights = [self.bw_centrality[edge[0]] + self.bw_centrality[edge[1]] for edge in edges]
+        weight_max = max(weights, default=0)
 
-            if weight_max is None or weight > weight_max:
-                weight_max = weight
+        # every edge counts, normalized by the largest weight like get_term_arrays
+        for edge, weight in zip(edges, weights):
+            H_1 += (1-x[edge[0]])*(1-x[edge[1]])*weight
 
-        H_1 += (1-x[edge[0]])*(1-x[edge[1]])*weight
-
-        H_1 *= 1/weight_max
+        if weight_max > 0:
+            H_1 *= 1/weight_max
 
         #####calculate H_2#####
         H_2 = 0
@@ -63,39 +76,86 @@ class QUBOPlacement:
         #####calculate H_3#####
 
         #number of sensors we want to place
-        docks = 2
+        docks = self.docks
         H_3 = (sum(x)-docks)**2
 
         #####Get Hamiltonian function#####
-        A,B,C = 100,100,100 #random coef for now
+        A,B,C = self.coefficients
         H = A*H_1 + B*H_2 + C*H_3
 
         return H
 
     
-    def get_best_sample(self):
-        H = self.get_H()
-        model = H.compile()
-        #Solve BinaryQuadraticModel(BQM) by using Sampler class
-        bqm = model.to_bqm()
-    
-        #get the solutions of QUBO as SampleSet
-        sa = neal.SimulatedAnnealingSampler()
-        sampleset = sa.sample(bqm, num_reads=1000)
-    
-        #interpret the sampleset object
-        decoded_samples = model.decode_sampleset(sampleset)
-        #print the decoded_samples
-        #print("Printing the decoded sample:")
-        #pprint(decoded_samples)
-    
-        best_sample = min(decoded_samples, key=lambda x: x.energy)
-    
+    def get_best_sample(self, seed=None):
+        best_sample, energy = self.get_top_samples(k=1, seed=seed)[0]
+
         #print the best sample
         #print("Printing the best sample:")
-        #pprint(best_sample.sample)
-    
-        return best_sample.sample
+        #pprint(best_sample)
+
+        return best_sample
+
+    def _ensure_compiled(self):
+        # the penalty model is compiled on its first use
+        if self.bqm is not None:
+            return
+        with stage("qubo.hamiltonian", nodes=len(self.node_dic), edges=self.graph.num_edges()):
+            H = self.get_H()
+        with stage("qubo.compile", qubits=len(self.node_dic)):
+            model = H.compile()
+        #Solve BinaryQuadraticModel(BQM) by using Sampler class
+        with stage("qubo.to_bqm") as span:
+            self.bqm = model.to_bqm()
+            span.set(qubits=self.bqm.num_variables, interactions=self.bqm.num_interactions)
+
+    def get_term_arrays(self):
+        # the sparse H_1 and H_2 terms of the swap and multilevel solvers, computed on their first use
+        if self.terms is None:
+            self.terms = get_term_arrays(self.graph, self.bw_centrality)
+        return self.terms
+
+    def get_top_samples(self, k=5, min_distance=2, num_reads=None, polish=True, seed=None, tuner: AnnealTuner = None):
+        self._ensure_compiled()
+        bqm = self.bqm
+        variables = get_variable_order(len(self.node_dic))
+
+        with stage("qubo.neal", qubits=len(variables)) as span:
+            if num_reads is None:
+                # tune the schedule and stop once the best energy has been seen with the target confidence
+                tuner = tuner or AnnealTuner()
+                samples, energies, self.anneal_report = tuner.sample(bqm, variables, seed=seed)
+                samples, energies = postprocess_arrays(samples, energies, bqm, variables, k, min_distance, polish)
+                span.set(num_reads=self.anneal_report["num_reads"], num_sweeps=self.anneal_report["num_sweeps"])
+            else:
+                #get the solutions of QUBO as SampleSet
+                context = SolveContext(seed)
+                sa = neal.SimulatedAnnealingSampler()
+                sampleset = sa.sample(bqm, num_reads=num_reads, seed=context.child_seed())
+
+                # deduplicate, polish and pick diverse winners on the raw arrays, only the winners are decoded
+                samples, energies = postprocess(sampleset, bqm, variables, k, min_distance, polish)
+                span.set(num_reads=num_reads)
+
+        return [(decode_selection(x), float(energy)) for x, energy in zip(samples, energies)]
+
+    def get_constrained_sample(self, num_reads=10, num_sweeps=100, seed=None):
+        # keep exactly `docks` stations by swapping a selected and an unselected node,
+        # so only the sparse H_1 + H_2 terms are needed and the dense H_3 penalty is never compiled
+        edges, weights, costs = self.get_term_arrays()
+        annealer = SwapAnnealer(edges, weights, costs, self.docks, self.coefficients)
+        samples, energies = annealer.sample(num_reads=num_reads, num_sweeps=num_sweeps, seed=seed)
+
+        return decode_selection(samples[np.argmin(energies)])
+
+    def get_multilevel_sample(self, coarse_nodes=None, seed=None, **options):
+        # coarsen along the shortest travel times, solve the coarse problem and refine back level by level,
+        # keeping exactly `docks` stations like get_constrained_sample
+        edges, weights, costs = self.get_term_arrays()
+        durations = np.array(self.graph.edges(), dtype=float)
+        solver = MultilevelSolver(edges, weights, costs, durations, self.docks, self.coefficients, coarse_nodes)
+        x, _ = solver.solve(seed=seed, **options)
+
+        return decode_selection(x)
 
     def create_problem(self) -> QuadraticProgram:
         nodes = len(self.node_dic)
@@ -127,7 +187,8 @@ class QUBOPlacement:
         qp = from_docplex_mp(mdl)
         return qp
     
-    def run_qaoa(self):
+    def run_qaoa(self, reps=1, angle_cache: AngleCache = None, seed=10598):
+        context = SolveContext(seed)
 
         qubo = self.create_problem()
         print(qubo.prettyprint())
@@ -137,15 +198,26 @@ class QUBOPlacement:
         print("operator:")
         print(op)
 
-        algorithm_globals.random_seed = 10598
-        qaoa_mes = QAOA(sampler=Sampler(), optimizer=COBYLA(), initial_point=[0.0, 0.0])
+        # start from the nearest cached angles if a cache is given
+        if angle_cache is None:
+            initial_point = [0.0] * 2 * reps
+        else:
+            initial_point = angle_cache.initial_point(qubo, reps)
+
+        qaoa_mes = QAOA(sampler=context.sampler(), optimizer=COBYLA(), reps=reps, initial_point=initial_point)
         exact_mes = NumPyMinimumEigensolver()
 
         qaoa = MinimumEigenOptimizer(qaoa_mes)
     
-        qaoa_result = qaoa.solve(qubo)
+        with stage("qubo.qaoa", qubits=qubo.get_num_vars(), reps=reps) as span:
+            qaoa_result = qaoa.solve(qubo)
+            span.set(evals=qaoa_result.min_eigen_solver_result.cost_function_evals)
         # print(qaoa_result.prettyprint())
 
+        if angle_cache is not None:
+            eigen_result = qaoa_result.min_eigen_solver_result
+            angle_cache.store(qubo, reps, eigen_result.optimal_point, eigen_result.cost_function_evals)
+
         return qaoa_result
 
     def run_exact(self):
@@ -158,8 +230,7 @@ class QUBOPlacement:
         print("operator:")
         print(op)
 
-        algorithm_globals.random_seed = 10598
-        qaoa_mes = QAOA(sampler=Sampler(), optimizer=COBYLA(), initial_point=[0.0, 0.0])
+        # the exact eigensolver is deterministic and needs no seed
         exact_mes = NumPyMinimumEigensolver()
 
         exact = MinimumEigenOptimizer(exact_mes)
@@ -1,3 +1,5 @@
 
-from routing import *
-from placement import *
\ No newline at end of file
+from .routing import *
+from .placement import *
+from .pipeline import Pipeline
+from .delay import DelayModel
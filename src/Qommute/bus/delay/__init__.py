@@ -0,0 +1,2 @@
+from .model import DelayModel, export_model
+from .table import DelayTable
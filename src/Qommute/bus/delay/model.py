@@ -0,0 +1,199 @@
+import hashlib
+import os
+
+import numpy as np
+
+from ...instrumentation import stage
+
+# the model file is written by export_model next to this module, so that the package works from any working directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MODEL_FILE = os.path.join(DATA_DIR, "delay_model.npz")
+
+# the columns of the MTA delay dataset, in the order the network takes them
+FEATURES = ("month", "subdivison", "line", "day_type", "reporting_category", "subcategory")
+
+# the columns a scenario sets, the subdivision and line come from the station
+SCENARIO_FEATURES = ("month", "day_type", "reporting_category", "subcategory")
+
+# busiest_line values of metro_delay.csv that the dataset names differently
+LINE_ALIASES = {"S": "S 42nd", "J": "JZ", "Z": "JZ"}
+
+
+class DelayModel:
+    def __init__(self, weights, biases, mean, scale, vocabularies, version=None):
+        """
+        The 64-32-1 delay regression network of delayPrediction_Model_NN.ipynb, run with numpy only
+
+        Parameters
+        ----------
+        weights : list
+            The weight matrices of fc1, fc2 and fc3 in torch's (out, in) layout
+        biases : list
+            The bias vectors of fc1, fc2 and fc3
+        mean : numpy.ndarray
+            The mean_ of the fitted StandardScaler
+        scale : numpy.ndarray
+            The scale_ of the fitted StandardScaler
+        vocabularies : dict
+            The sorted values of every column of FEATURES, the classes_ of its LabelEncoder
+        version : str
+            Identifies the weights, computed from them if None
+        """
+        # transposed once here so that every layer is a plain x @ W
+        self.weights = [np.ascontiguousarray(np.asarray(w, dtype=np.float32).T) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.vocabularies = {column: np.asarray(vocabularies[column], dtype=str) for column in FEATURES}
+        self.version = version or self._digest()
+
+    def _digest(self):
+        h = hashlib.sha256()
+        for array in self.weights + self.biases + [self.mean, self.scale]:
+            h.update(array.tobytes())
+        for column in FEATURES:
+            h.update("\x00".join(self.vocabularies[column]).encode())
+        return h.hexdigest()[:16]
+
+    @classmethod
+    def load(cls, file_path=MODEL_FILE):
+        """
+        Loads a model written by save or export_model, without importing torch or scikit-learn
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the npz file
+
+        Returns
+        -------
+        model : DelayModel
+            The loaded model
+        """
+        with stage("delay.load"), np.load(file_path) as data:
+            return cls([data["W1"], data["W2"], data["W3"]], [data["b1"], data["b2"], data["b3"]],
+                       data["mean"], data["scale"], {column: data["vocab_" + column] for column in FEATURES},
+                       version=str(data["version"]))
+
+    def save(self, file_path=MODEL_FILE):
+        """
+        Writes the weights, the scaler and the vocabularies to one compressed npz file
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the npz file
+        """
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        arrays = {"W%d" % (i + 1): w.T for i, w in enumerate(self.weights)}
+        arrays.update({"b%d" % (i + 1): b for i, b in enumerate(self.biases)})
+        arrays.update({"vocab_" + column: self.vocabularies[column] for column in FEATURES})
+        np.savez_compressed(file_path, mean=self.mean, scale=self.scale, version=np.array(self.version), **arrays)
+
+    def encode(self, column, values):
+        """
+        Encodes the values of one column the way LabelEncoder did during training
+
+        Parameters
+        ----------
+        column : str
+            One of FEATURES
+        values : list
+            The values, compared as strings
+
+        Returns
+        -------
+        codes : numpy.ndarray
+            The index of every value in the sorted vocabulary of the column
+        """
+        vocabulary = self.vocabularies[column]
+        values = np.asarray(values, dtype=str)
+
+        codes = np.searchsorted(vocabulary, values)
+        codes = np.minimum(codes, len(vocabulary) - 1)
+        unknown = vocabulary[codes] != values
+        if unknown.any():
+            raise ValueError("unknown %s values: %s" % (column, sorted(set(values[unknown].tolist()))))
+
+        return codes
+
+    def predict(self, codes):
+        """
+        Predicts the number of delays of every row of encoded features in one batch
+
+        Parameters
+        ----------
+        codes : numpy.ndarray
+            An array of shape (rows, 6) of encoded features in the order of FEATURES
+
+        Returns
+        -------
+        delays : numpy.ndarray
+            The predicted number of delays of every row
+        """
+        with stage("delay.predict", rows=len(codes)):
+            x = (np.asarray(codes, dtype=np.float32) - self.mean) / self.scale
+            for w, b in zip(self.weights[:-1], self.biases[:-1]):
+                x = np.maximum(x @ w + b, 0)
+            return (x @ self.weights[-1] + self.biases[-1])[:, 0]
+
+    def predict_stations(self, lines, scenarios):
+        """
+        Predicts the delays at every station under every scenario with one forward pass
+
+        Parameters
+        ----------
+        lines : list
+            The busiest metro line near every station, e.g. the busiest_line column of metro_delay.csv
+        scenarios : list
+            One dictionary per scenario with a value for every column of SCENARIO_FEATURES
+
+        Returns
+        -------
+        delays : numpy.ndarray
+            An array of shape (scenarios, stations) of predicted delays
+        """
+        lines = [LINE_ALIASES.get(str(line), str(line)) for line in lines]
+
+        # numbered lines belong to the A division, lettered ones to the B division
+        subdivisions = ["A DIVISION" if line.isdigit() else "B DIVISION" for line in lines]
+        station_codes = np.column_stack((self.encode("subdivison", subdivisions), self.encode("line", lines)))
+        scenario_codes = np.column_stack([self.encode(column, [scenario[column] for scenario in scenarios])
+                                          for column in SCENARIO_FEATURES])
+
+        codes = np.empty((len(scenarios), len(lines), len(FEATURES)), dtype=np.int64)
+        codes[:, :, [0, 3, 4, 5]] = scenario_codes[:, None, :]
+        codes[:, :, [1, 2]] = station_codes[None, :, :]
+
+        return self.predict(codes.reshape(-1, len(FEATURES))).reshape(len(scenarios), len(lines))
+
+
+def export_model(model, scaler, vocabularies, file_path=MODEL_FILE):
+    """
+    Exports the trained network of delayPrediction_Model_NN.ipynb so that DelayModel can load it without torch
+
+    Parameters
+    ----------
+    model : RegressionModel
+        The trained torch module with the layers fc1, fc2 and fc3
+    scaler : StandardScaler
+        The scaler fitted on the training features
+    vocabularies : dict
+        The sorted values of every column of FEATURES, e.g. {column: sorted(df[column].unique())}
+    file_path : str
+        The path to the npz file
+
+    Returns
+    -------
+    delay_model : DelayModel
+        The exported model
+    """
+    state = {name: tensor.detach().cpu().numpy() for name, tensor in model.state_dict().items()}
+    delay_model = DelayModel([state["fc1.weight"], state["fc2.weight"], state["fc3.weight"]],
+                             [state["fc1.bias"], state["fc2.bias"], state["fc3.bias"]],
+                             scaler.mean_, scaler.scale_, vocabularies)
+    delay_model.save(file_path)
+    return delay_model
@@ -0,0 +1,231 @@
+import argparse
+import csv
+import itertools
+import os
+
+import numpy as np
+
+from ...instrumentation import stage
+from .model import DATA_DIR, LINE_ALIASES, MODEL_FILE, SCENARIO_FEATURES, DelayModel
+
+TABLE_FILE = os.path.join(DATA_DIR, "delay_table.npz")
+
+
+class DelayTable:
+    def __init__(self, delays, vocabularies, version):
+        """
+        The delay model evaluated once over every scenario and line, so that a delay is an array lookup
+
+        Parameters
+        ----------
+        delays : numpy.ndarray
+            The predicted delays indexed by month, day_type, reporting_category, subcategory and line
+        vocabularies : dict
+            The sorted values of every column of SCENARIO_FEATURES and of "line"
+        version : str
+            The version of the model the table was computed with
+        """
+        self.delays = delays
+        self.vocabularies = vocabularies
+        self.version = version
+
+        # value -> position dictionaries, so that a lookup does not search the vocabularies
+        self._index = {column: {value: i for i, value in enumerate(vocabularies[column])}
+                       for column in SCENARIO_FEATURES + ("line",)}
+        self._rows = {}
+
+    @classmethod
+    def build(cls, model: DelayModel):
+        """
+        Evaluates the model over the whole grid of encoded features in one batch
+
+        Parameters
+        ----------
+        model : DelayModel
+            The delay model
+
+        Returns
+        -------
+        table : DelayTable
+            The table of the model
+        """
+        vocabularies = {column: model.vocabularies[column].tolist() for column in SCENARIO_FEATURES + ("line",)}
+        scenarios = [dict(zip(SCENARIO_FEATURES, values))
+                     for values in itertools.product(*(vocabularies[column] for column in SCENARIO_FEATURES))]
+
+        with stage("delay.table", scenarios=len(scenarios), lines=len(vocabularies["line"])):
+            delays = model.predict_stations(vocabularies["line"], scenarios)
+
+        shape = tuple(len(vocabularies[column]) for column in SCENARIO_FEATURES + ("line",))
+        return cls(delays.reshape(shape).astype(np.float32), vocabularies, model.version)
+
+    @classmethod
+    def load(cls, file_path=TABLE_FILE):
+        """
+        Loads a table written by save
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the npz file
+
+        Returns
+        -------
+        table : DelayTable
+            The loaded table
+        """
+        with np.load(file_path) as data:
+            vocabularies = {column: data["vocab_" + column].tolist() for column in SCENARIO_FEATURES + ("line",)}
+            return cls(data["delays"], vocabularies, str(data["version"]))
+
+    @classmethod
+    def get(cls, model_file=MODEL_FILE, file_path=TABLE_FILE):
+        """
+        Loads the table of the current model, and builds and saves it again if the model changed since
+
+        Parameters
+        ----------
+        model_file : str
+            The npz file of the delay model
+        file_path : str
+            The npz file of the table
+
+        Returns
+        -------
+        table : DelayTable
+            The table of the current model
+        """
+        model = DelayModel.load(model_file)
+        if os.path.exists(file_path):
+            table = cls.load(file_path)
+            if table.version == model.version:
+                return table
+
+        table = cls.build(model)
+        table.save(file_path)
+        return table
+
+    def save(self, file_path=TABLE_FILE):
+        """
+        Writes the table, its vocabularies and the model version to one compressed npz file
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the npz file
+        """
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        vocabularies = {"vocab_" + column: np.asarray(values, dtype=str) for column, values in self.vocabularies.items()}
+        np.savez_compressed(file_path, delays=self.delays, version=np.array(self.version), **vocabularies)
+
+    def scenario_delays(self, scenario):
+        """
+        Returns the delays of every line under a scenario, the row is looked up once per scenario
+
+        Parameters
+        ----------
+        scenario : dict
+            A value for every column of SCENARIO_FEATURES
+
+        Returns
+        -------
+        delays : numpy.ndarray
+            The delay of every line, in the order of the line vocabulary
+        """
+        key = tuple(str(scenario[column]) for column in SCENARIO_FEATURES)
+        row = self._rows.get(key)
+        if row is None:
+            try:
+                row = self._rows[key] = self.delays[tuple(self._index[column][value]
+                                                          for column, value in zip(SCENARIO_FEATURES, key))]
+            except KeyError as error:
+                raise ValueError("unknown scenario value %s" % error) from None
+        return row
+
+    def lookup(self, lines, scenario):
+        """
+        Returns the delays at stations near the given lines under a scenario
+
+        Parameters
+        ----------
+        lines : list
+            The busiest metro line near every station
+        scenario : dict
+            A value for every column of SCENARIO_FEATURES
+
+        Returns
+        -------
+        delays : numpy.ndarray
+            The delay at every station
+        """
+        index = self._index["line"]
+        try:
+            positions = [index[LINE_ALIASES.get(str(line), str(line))] for line in lines]
+        except KeyError as error:
+            raise ValueError("unknown line %s" % error) from None
+        return self.scenario_delays(scenario)[positions]
+
+
+def read_station_lines(file_path):
+    """
+    Reads the busiest metro line near every station from a metro_delay.csv file
+
+    Returns
+    -------
+    lines : dict
+        The busiest line with the name of the station as key
+    """
+    with open(file_path, 'r') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader)
+        return {row[1]: row[2] for row in reader}
+
+
+def write_metro_delay(file_path, stations, lines, delays):
+    """
+    Writes the predicted delays in the format of metro_delay.csv, which GetterFunctions reads
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the csv file
+    stations : list
+        The names of the stations
+    lines : list
+        The busiest metro line near every station
+    delays : numpy.ndarray
+        The delay at every station, rounded as in the notebook
+    """
+    with open(file_path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["", "bus_stations", "busiest_line", "predicted_delay"])
+        for i, (station, line, delay) in enumerate(zip(stations, lines, np.round(delays).astype(int).tolist())):
+            writer.writerow([i, station, line, delay])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write metro_delay.csv for a scenario from the precomputed delay table")
+    parser.add_argument("stations", help="a metro_delay.csv file giving the busiest line near every station")
+    parser.add_argument("-o", "--output", help="the csv file to write, the stations file if not given")
+    parser.add_argument("--model", default=MODEL_FILE)
+    parser.add_argument("--table", default=TABLE_FILE)
+    parser.add_argument("--month", required=True)
+    parser.add_argument("--day-type", required=True)
+    parser.add_argument("--category", required=True)
+    parser.add_argument("--subcategory", required=True)
+    args = parser.parse_args(argv)
+
+    table = DelayTable.get(args.model, args.table)
+    station_lines = read_station_lines(args.stations)
+    scenario = {"month": args.month, "day_type": args.day_type, "reporting_category": args.category,
+                "subcategory": args.subcategory}
+
+    delays = table.lookup(list(station_lines.values()), scenario)
+    write_metro_delay(args.output or args.stations, list(station_lines), list(station_lines.values()), delays)
+
+
+if __name__ == "__main__":
+    main()
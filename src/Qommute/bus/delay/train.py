@@ -0,0 +1,494 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import types
+import urllib.parse
+import urllib.request
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import BatchSampler, DataLoader, Dataset, SubsetRandomSampler, SequentialSampler
+
+from ...instrumentation import stage
+from .model import DATA_DIR, FEATURES, MODEL_FILE, export_model
+
+DATASET_FILE = os.path.join(DATA_DIR, "mta_delays.csv")
+VOCABULARY_FILE = os.path.join(DATA_DIR, "vocabularies.json")
+ENCODED_DIR = os.path.join(DATA_DIR, "encoded")
+CHECKPOINT_FILE = os.path.join(DATA_DIR, "checkpoint.pt")
+
+# the MTA Subway Trains Delayed dataset the notebook trains on
+DATASET_URL = "https://data.ny.gov/resource/wx2t-qtaz.csv"
+TARGET = "delays"
+
+
+class RegressionModel(nn.Module):
+    """
+    The network of delayPrediction_Model_NN.ipynb
+    """
+    def __init__(self, input_size=len(FEATURES)):
+        super(RegressionModel, self).__init__()
+        self.fc1 = nn.Linear(input_size, 64)
+        self.fc2 = nn.Linear(64, 32)
+        self.fc3 = nn.Linear(32, 1)
+
+    def forward(self, x):
+        x = torch.relu(self.fc1(x))
+        x = torch.relu(self.fc2(x))
+        x = self.fc3(x)
+        return x
+
+
+def download_dataset(file_path=DATASET_FILE, url=DATASET_URL, page_size=50000):
+    """
+    Downloads the dataset once into a local csv file, training then never touches the network
+
+    Parameters
+    ----------
+    file_path : str
+        The csv file to write
+    url : str
+        The csv endpoint of the dataset
+    page_size : int
+        The number of rows requested at once
+    """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    columns = ",".join(FEATURES + (TARGET,))
+
+    temp_path = file_path + ".tmp"
+    with open(temp_path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(FEATURES + (TARGET,))
+
+        offset = 0
+        while True:
+            query = urllib.parse.urlencode({"$select": columns, "$order": ":id", "$limit": page_size, "$offset": offset})
+            with urllib.request.urlopen(url + "?" + query) as response:
+                reader = csv.reader(line.decode("utf-8") for line in response)
+                next(reader)
+                rows = list(reader)
+
+            writer.writerows(rows)
+            offset += len(rows)
+            if len(rows) < page_size:
+                break
+
+    os.replace(temp_path, file_path)
+
+
+def read_chunks(file_path, chunk_size=100000):
+    """
+    Reads the dataset in chunks so that memory does not grow with the number of rows
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the csv file
+    chunk_size : int
+        The number of rows per chunk
+
+    Yields
+    ------
+    chunk : dict
+        The values of every column of the chunk as a list of strings
+    """
+    with open(file_path, 'r', newline='') as fp:
+        reader = csv.reader(fp)
+        header = next(reader)
+        index = [header.index(column) for column in FEATURES + (TARGET,)]
+
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield {column: [row[i] for row in chunk] for column, i in zip(FEATURES + (TARGET,), index)}
+                chunk = []
+        if chunk:
+            yield {column: [row[i] for row in chunk] for column, i in zip(FEATURES + (TARGET,), index)}
+
+
+def get_vocabularies(file_path=DATASET_FILE, vocabulary_file=VOCABULARY_FILE, chunk_size=100000, rebuild=False):
+    """
+    Returns the sorted values of every column, read from the vocabulary file or collected from the dataset
+
+    The vocabularies are kept on disk so that retraining encodes every value the same way, even when the dataset
+    grows. A value missing from the kept vocabularies fails the encoding, rebuild them to accept it
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the dataset
+    vocabulary_file : str
+        The json file the vocabularies are kept in
+    chunk_size : int
+        The number of rows read at once
+    rebuild : bool
+        Whether to collect the vocabularies again even if the file exists
+
+    Returns
+    -------
+    vocabularies : dict
+        The sorted values of every column of FEATURES, the classes_ a LabelEncoder would find
+    """
+    if not rebuild and os.path.exists(vocabulary_file):
+        with open(vocabulary_file) as fp:
+            return json.load(fp)
+
+    with stage("delay.vocabularies"):
+        values = {column: set() for column in FEATURES}
+        for chunk in read_chunks(file_path, chunk_size):
+            for column in FEATURES:
+                values[column].update(chunk[column])
+        vocabularies = {column: sorted(values[column]) for column in FEATURES}
+
+    os.makedirs(os.path.dirname(vocabulary_file) or ".", exist_ok=True)
+    with open(vocabulary_file, 'w') as fp:
+        json.dump(vocabularies, fp, indent=2)
+
+    return vocabularies
+
+
+def _encoding_key(file_path, vocabularies):
+    # identifies the dataset file and vocabularies an encoding was made from
+    stat = os.stat(file_path)
+    return {"dataset": os.path.abspath(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "vocabularies": hashlib.sha256(json.dumps(vocabularies, sort_keys=True).encode()).hexdigest()}
+
+
+def encode_dataset(file_path, vocabularies, encoded_dir=ENCODED_DIR, chunk_size=100000, reuse=True):
+    """
+    Encodes the dataset chunk by chunk into two memory-mapped npy files, features.npy and delays.npy
+
+    The encoding is recorded in encoding.json once complete, and a later call with the same dataset file and
+    vocabularies maps the stored files instead of encoding them again
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the dataset
+    vocabularies : dict
+        The sorted values of every column of FEATURES
+    encoded_dir : str
+        The directory the npy files are written to
+    chunk_size : int
+        The number of rows read at once
+    reuse : bool
+        Whether to map the stored encoding if it was made from the same dataset file and vocabularies
+
+    Returns
+    -------
+    features : numpy.memmap
+        The (rows, 6) int16 codes
+    delays : numpy.memmap
+        The float32 delays of every row
+    """
+    key = _encoding_key(file_path, vocabularies)
+    manifest_file = os.path.join(encoded_dir, "encoding.json")
+    if reuse and os.path.exists(manifest_file):
+        with open(manifest_file) as fp:
+            if json.load(fp) == key:
+                return (np.load(os.path.join(encoded_dir, "features.npy"), mmap_mode='r'),
+                        np.load(os.path.join(encoded_dir, "delays.npy"), mmap_mode='r'))
+
+    # counted with the csv reader, a quoted field may span lines
+    with open(file_path, 'r', newline='') as fp:
+        rows = sum(1 for _ in csv.reader(fp)) - 1
+
+    os.makedirs(encoded_dir, exist_ok=True)
+    if os.path.exists(manifest_file):
+        # the files are about to be overwritten, an interrupted encode must not pass for a complete one
+        os.remove(manifest_file)
+    features = np.lib.format.open_memmap(os.path.join(encoded_dir, "features.npy"), mode='w+', dtype=np.int16,
+                                         shape=(rows, len(FEATURES)))
+    delays = np.lib.format.open_memmap(os.path.join(encoded_dir, "delays.npy"), mode='w+', dtype=np.float32,
+                                       shape=(rows,))
+    vocabularies = {column: np.asarray(vocabularies[column], dtype=str) for column in FEATURES}
+
+    with stage("delay.encode", rows=rows):
+        start = 0
+        for chunk in read_chunks(file_path, chunk_size):
+            end = start + len(chunk[TARGET])
+            for i, column in enumerate(FEATURES):
+                values = np.asarray(chunk[column], dtype=str)
+                codes = np.minimum(np.searchsorted(vocabularies[column], values), len(vocabularies[column]) - 1)
+                unknown = vocabularies[column][codes] != values
+                if unknown.any():
+                    raise ValueError("unknown %s values: %s, rebuild the vocabularies"
+                                     % (column, sorted(set(values[unknown].tolist()))))
+                features[start:end, i] = codes
+            delays[start:end] = np.asarray(chunk[TARGET], dtype=np.float32)
+            start = end
+
+    features.flush()
+    delays.flush()
+    with open(manifest_file, 'w') as fp:
+        json.dump(key, fp, indent=2)
+    return features, delays
+
+
+class DelayDataset(Dataset):
+    def __init__(self, encoded_dir, mean, scale):
+        """
+        Serves standardized batches of the encoded dataset, the workers map the npy files instead of copying them
+
+        Parameters
+        ----------
+        encoded_dir : str
+            The directory written by encode_dataset
+        mean : numpy.ndarray
+            The mean of every feature over the training rows
+        scale : numpy.ndarray
+            The standard deviation of every feature over the training rows
+        """
+        self.encoded_dir = encoded_dir
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.features = None
+        self.delays = None
+
+    def _open(self):
+        # opened on first use, so that every worker maps the files itself
+        self.features = np.load(os.path.join(self.encoded_dir, "features.npy"), mmap_mode='r')
+        self.delays = np.load(os.path.join(self.encoded_dir, "delays.npy"), mmap_mode='r')
+
+    def __len__(self):
+        if self.features is None:
+            self._open()
+        return len(self.delays)
+
+    def __getitem__(self, rows):
+        """
+        Returns the batch of the given rows, the DataLoader hands over whole batches of indices
+        """
+        if self.features is None:
+            self._open()
+        rows = np.sort(np.asarray(rows))
+        x = (self.features[rows].astype(np.float32) - self.mean) / self.scale
+        y = self.delays[rows].astype(np.float32)
+        return torch.from_numpy(x), torch.from_numpy(y).view(-1, 1)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["features"] = state["delays"] = None
+        return state
+
+
+def get_scaler(features, rows, chunk_size=100000):
+    """
+    Computes the StandardScaler statistics of the training rows chunk by chunk
+
+    Parameters
+    ----------
+    features : numpy.ndarray
+        The encoded features
+    rows : numpy.ndarray
+        The training rows
+    chunk_size : int
+        The number of rows summed at once
+
+    Returns
+    -------
+    mean : numpy.ndarray
+        The mean of every feature
+    scale : numpy.ndarray
+        The population standard deviation of every feature, 1 for constant features as in StandardScaler
+    """
+    total = np.zeros(features.shape[1])
+    squares = np.zeros(features.shape[1])
+    for start in range(0, len(rows), chunk_size):
+        x = features[np.sort(rows[start:start + chunk_size])].astype(np.float64)
+        total += x.sum(axis=0)
+        squares += (x ** 2).sum(axis=0)
+
+    mean = total / len(rows)
+    std = np.sqrt(np.maximum(squares / len(rows) - mean ** 2, 0))
+    return mean, np.where(std > 0, std, 1.0)
+
+
+def _seed_worker(worker_id):
+    seed = torch.initial_seed() % 2**32
+    np.random.seed(seed)
+    random.seed(seed)
+
+
+def _save_checkpoint(file_path, checkpoint):
+    # written to a temporary file first, so that an interrupted save keeps the previous checkpoint
+    temp_path = file_path + ".tmp"
+    torch.save(checkpoint, temp_path)
+    os.replace(temp_path, file_path)
+
+
+def train(file_path=DATASET_FILE, vocabulary_file=VOCABULARY_FILE, encoded_dir=ENCODED_DIR,
+          checkpoint_file=CHECKPOINT_FILE, model_file=MODEL_FILE, epochs=70, batch_size=256, lr=0.001,
+          test_size=0.2, patience=10, workers=2, chunk_size=100000, seed=42, resume=True):
+    """
+    Trains the delay model on the local dataset with mini-batches and writes it for DelayModel
+
+    Parameters
+    ----------
+    file_path : str
+        The local csv file of the dataset, see download_dataset
+    vocabulary_file : str
+        The json file the vocabularies are kept in
+    encoded_dir : str
+        The directory of the encoded dataset
+    checkpoint_file : str
+        The file written after every epoch, training continues from it when resume is True
+    model_file : str
+        The npz file the best model is exported to
+    epochs : int
+        The largest number of epochs
+    batch_size : int
+        The number of rows per mini-batch
+    lr : float
+        The learning rate of Adam
+    test_size : float
+        The share of rows held out to validate on
+    patience : int
+        The number of epochs without a better validation loss after which training stops
+    workers : int
+        The number of DataLoader worker processes
+    chunk_size : int
+        The number of csv rows read at once
+    seed : int
+        The seed of the split, the initial weights and the shuffling
+    resume : bool
+        Whether to continue from the checkpoint file if it exists and map the stored encoding of the same dataset.
+        A checkpoint of another dataset, split or scaler is not resumed, training starts over with a warning
+
+    Returns
+    -------
+    history : dict
+        The training and validation loss of every epoch, the best validation loss and the epoch it was reached
+    """
+    torch.manual_seed(seed)
+    vocabularies = get_vocabularies(file_path, vocabulary_file, chunk_size)
+    features, _ = encode_dataset(file_path, vocabularies, encoded_dir, chunk_size, reuse=resume)
+
+    # the same seed gives the same split
+    order = np.random.default_rng(seed).permutation(len(features))
+    validation_rows = order[:int(len(order) * test_size)]
+    train_rows = order[len(validation_rows):]
+
+    mean, scale = get_scaler(features, train_rows, chunk_size)
+    dataset = DelayDataset(encoded_dir, mean, scale)
+
+    # what a checkpoint must have been trained on to be resumed
+    identity = {"dataset": _encoding_key(file_path, vocabularies), "seed": seed, "test_size": test_size}
+
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    loader_options = {"batch_size": None, "num_workers": workers, "worker_init_fn": _seed_worker,
+                      "persistent_workers": workers > 0}
+    train_loader = DataLoader(dataset, sampler=BatchSampler(SubsetRandomSampler(train_rows.tolist(), generator=generator),
+                                                            batch_size, drop_last=False), **loader_options)
+    validation_loader = DataLoader(dataset, sampler=BatchSampler(SequentialSampler(validation_rows.tolist()),
+                                                                 batch_size * 16, drop_last=False), **loader_options)
+
+    model = RegressionModel(len(FEATURES))
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    criterion = nn.MSELoss()
+
+    history = {"train_loss": [], "validation_loss": [], "best_loss": float("inf"), "best_epoch": None}
+    best_state = None
+    bad_epochs = 0
+    first_epoch = 0
+
+    checkpoint = torch.load(checkpoint_file) if resume and os.path.exists(checkpoint_file) else None
+    if checkpoint is not None and (checkpoint.get("identity") != identity
+                                   or not np.allclose(checkpoint["scaler"]["mean"], mean)
+                                   or not np.allclose(checkpoint["scaler"]["scale"], scale)):
+        warnings.warn("%s was trained on another dataset, split or scaler, training starts over" % checkpoint_file)
+        checkpoint = None
+
+    if checkpoint is not None:
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        generator.set_state(checkpoint["generator"])
+        torch.set_rng_state(checkpoint["torch_rng"])
+        history = checkpoint["history"]
+        best_state = checkpoint["best_model"]
+        bad_epochs = checkpoint["bad_epochs"]
+        first_epoch = checkpoint["epoch"] + 1
+
+    for epoch in range(first_epoch, epochs):
+        if bad_epochs >= patience:
+            break
+
+        with stage("delay.epoch", epoch=epoch) as span:
+            model.train()
+            total = 0.0
+            for x, y in train_loader:
+                optimizer.zero_grad()
+                loss = criterion(model(x), y)
+                loss.backward()
+                optimizer.step()
+                total += loss.item() * len(y)
+            train_loss = total / len(train_rows)
+
+            model.eval()
+            total = 0.0
+            with torch.no_grad():
+                for x, y in validation_loader:
+                    total += criterion(model(x), y).item() * len(y)
+            validation_loss = total / max(len(validation_rows), 1)
+            span.set(train_loss=train_loss, validation_loss=validation_loss)
+
+        history["train_loss"].append(train_loss)
+        history["validation_loss"].append(validation_loss)
+        if validation_loss < history["best_loss"]:
+            history["best_loss"], history["best_epoch"] = validation_loss, epoch
+            best_state = {name: tensor.clone() for name, tensor in model.state_dict().items()}
+            bad_epochs = 0
+        else:
+            bad_epochs += 1
+
+        _save_checkpoint(checkpoint_file, {"epoch": epoch, "model": model.state_dict(), "optimizer": optimizer.state_dict(),
+                                           "generator": generator.get_state(), "torch_rng": torch.get_rng_state(),
+                                           "history": history, "best_model": best_state, "bad_epochs": bad_epochs,
+                                           "identity": identity, "scaler": {"mean": mean.tolist(), "scale": scale.tolist()}})
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    export_model(model, types.SimpleNamespace(mean_=mean, scale_=scale), vocabularies, model_file)
+
+    return history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the delay model offline on a local copy of the MTA delay dataset")
+    parser.add_argument("--dataset", default=DATASET_FILE)
+    parser.add_argument("--download", action="store_true", help="download the dataset into --dataset first")
+    parser.add_argument("--vocabularies", default=VOCABULARY_FILE)
+    parser.add_argument("--rebuild-vocabularies", action="store_true")
+    parser.add_argument("--encoded-dir", default=ENCODED_DIR)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument("-o", "--output", default=MODEL_FILE)
+    parser.add_argument("--epochs", type=int, default=70)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--patience", type=int, default=10)
+    parser.add_argument("-w", "--workers", type=int, default=2)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if args.download:
+        download_dataset(args.dataset)
+    if args.rebuild_vocabularies:
+        get_vocabularies(args.dataset, args.vocabularies, args.chunk_size, rebuild=True)
+
+    history = train(args.dataset, args.vocabularies, args.encoded_dir, args.checkpoint, args.output, epochs=args.epochs,
+                    batch_size=args.batch_size, lr=args.lr, patience=args.patience, workers=args.workers,
+                    chunk_size=args.chunk_size, seed=args.seed, resume=not args.no_resume)
+    print("best validation loss {:.4f} at epoch {}".format(history["best_loss"], history["best_epoch"]))
+
+
+if __name__ == "__main__":
+    main()
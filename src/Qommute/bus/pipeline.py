@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+import rustworkx as rw
+
+from .placement.getter_functions import GetterFunctions, DATA_DIR
+from .placement.graph_utils import Graph
+from .placement.qubo import QUBO
+from ..stage_cache import StageCache
+from .routing.bus_routing import QuantumOptimizer, BusRoutingInstance
+
+
+class Pipeline:
+    def __init__(self, data_dir=DATA_DIR, n=20, start=1, end=20, cost_weights=(5, 3, 0.3), max_duration=25,
+                 stations=4, coefficients=(100, 100, 100), buses=2, cache: StageCache = None):
+        """
+        Plans bus stations and the routes between them in one process, handing the placed stations to the
+        routing problem as arrays instead of through a json file. Nothing is loaded before the first call
+
+        Parameters
+        ----------
+        data_dir : str
+            The directory holding the placement csv files
+        n : int
+            The number of candidate stations to sample
+        start : int
+            The start distance from the center of the map, as in get_selected_locations
+        end : int
+            The end distance from the center of the map, as in get_selected_locations
+        cost_weights : tuple
+            The weights C, D, E of the node cost c = Cf + Dg + Eh
+        max_duration : float
+            The longest travel time in minutes that still makes an edge
+        stations : int
+            The number of stations to place
+        coefficients : tuple
+            The coefficients A, B, C of the Hamiltonian
+        buses : int
+            The number of buses K of the routing problem
+        cache : StageCache
+            Loads the parsed csv files from disk when they did not change, if given
+        """
+        self.data_dir = data_dir
+        self.n = n
+        self.start = start
+        self.end = end
+        self.cost_weights = cost_weights
+        self.max_duration = max_duration
+        self.stations = stations
+        self.coefficients = coefficients
+        self.buses = buses
+        self.cache = cache
+        self.getter = None
+
+    def place(self, solver="neal", seed=42):
+        """
+        Samples candidate stations and places stations among them
+
+        Parameters
+        ----------
+        solver : str
+            "neal" for the penalty QUBO, "swap" for the cardinality-preserving annealer
+        seed : int
+            The seed of the candidate sample and of the annealer
+
+        Returns
+        -------
+        placement : dict
+            The solution, the names of the placed stations and their (k, 2) array of latitudes and longitudes
+        """
+        if self.getter is None:
+            self.getter = GetterFunctions(self.data_dir, cache=self.cache)
+        getter = self.getter
+
+        selected = getter.get_selected_locations(getter.coordinates, n=self.n, start=self.start, end=self.end, seed=seed)
+        # every input comes from this pipeline's data directory, not the getters' default one
+        f_list = getter.normalize(getter.get_no_of_people_at_station(selected, os.path.join(self.data_dir, "station_pop_clean.csv")))
+        g_list = getter.normalize(getter.get_distance_from_farthest_metro(selected, os.path.join(self.data_dir, "bus_metro_distance.csv")))
+        h_list = getter.normalize(getter.get_delay_from_nearest_station(selected, os.path.join(self.data_dir, "metro_delay.csv")))
+
+        graph = Graph(getter.coordinates, selected, getter.station_distances, f_list, g_list, h_list,
+                      cost_weights=self.cost_weights, max_duration=self.max_duration)
+        bw_centrality = rw.betweenness_centrality(graph.graph)
+
+        qubo = QUBO(graph, graph.graph, bw_centrality, stations=self.stations, coefficients=self.coefficients,
+                    constrained=solver == "swap")
+        if solver == "swap":
+            solution = qubo.get_swap_solution(seed=seed)
+        else:
+            solution = qubo.get_neal_solution(seed=seed)
+
+        names = qubo.get_selected_stations(solution)
+
+        return {
+            "solution": solution,
+            "stations": names,
+            "coordinates": np.array([getter.coordinates[name] for name in names], dtype=float).reshape(-1, 2),
+        }
+
+    def route(self, coordinates, angle_cache=None, seed=10598):
+        """
+        Routes the buses between the given stations
+
+        Parameters
+        ----------
+        coordinates : numpy.ndarray
+            An (n, 2) array of the latitudes and longitudes of the stations, the first one is the depot
+        angle_cache : AngleCache
+            Warm starts the VQE if given
+        seed : int
+            The seed of the VQE
+
+        Returns
+        -------
+        routing : dict
+            The binary solution, its cost and the plotting coordinates of the stations
+        """
+        n = len(coordinates)
+
+        xc, yc, instance = BusRoutingInstance(n).generate_instance_from_coordinates(coordinates)
+        optim = QuantumOptimizer(instance, n, self.buses)
+
+        Q, g, c, _ = optim.binary_representation()
+        qp = optim.construct_problem(Q, g, c, n)
+        x, cost = optim.solve_problem(qp, angle_cache=angle_cache, seed=seed)
+
+        return {"x": x, "cost": cost, "xc": xc, "yc": yc}
+
+    def run(self, solver="neal", seed=42, angle_cache=None):
+        """
+        Places the stations and routes the buses between them, both solves seeded by seed so that a run is
+        reproducible end to end
+
+        Returns
+        -------
+        plan : dict
+            The placement and routing results of place and route
+        """
+        placement = self.place(solver=solver, seed=seed)
+        routing = self.route(placement["coordinates"], angle_cache=angle_cache, seed=seed)
+
+        return {"placement": placement, "routing": routing}
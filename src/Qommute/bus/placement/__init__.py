@@ -1,3 +1,3 @@
-from getter_functions import GetterFunctions
-from graph_utils import Graph
-from qubo import QUBO
\ No newline at end of file
+from .getter_functions import GetterFunctions
+from .graph_utils import Graph
+from .qubo import QUBO
\ No newline at end of file
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import rustworkx as rw
+
+from .getter_functions import GetterFunctions, DATA_DIR
+from .graph_utils import Graph
+from .qubo import QUBO
+from ...stage_cache import StageCache
+
+# every key a scenario may set, with the values the tutorial uses
+DEFAULT_SCENARIO = {
+    "name": None,
+    "data_dir": DATA_DIR,
+    "n": 20,
+    "start": 1,
+    "end": 20,
+    "max_duration": 25,
+    "cost_weights": [5, 3, 0.3],
+    "coefficients": [100, 100, 100],
+    "stations": 4,
+    "solver": "neal",
+    "seed": 42,
+}
+
+# the solvers that keep the number of stations by construction, their QUBO has no penalty term
+CONSTRAINED_SOLVERS = ("swap", "multilevel")
+
+# the data of a worker process, loaded once per data directory
+_DATA = {}
+
+# the most recently built problems of a worker process, so that scenarios differing only in their solver reuse them
+_PROBLEMS = OrderedDict()
+PROBLEM_CACHE_SIZE = 32
+
+
+def load_data(data_dir):
+    """
+    Loads the csv files of a data directory once per process and keeps the features of every station
+
+    Parameters
+    ----------
+    data_dir : str
+        The directory holding the placement csv files
+
+    Returns
+    -------
+    data : dict
+        The GetterFunctions object and the raw f, g, h dictionaries of every station
+    """
+    if data_dir not in _DATA:
+        getter = GetterFunctions(data_dir, cache=StageCache())
+        everything = dict(getter.coordinates)
+        _DATA[data_dir] = {
+            "getter": getter,
+            "f": getter.get_no_of_people_at_station(everything, os.path.join(data_dir, "station_pop_clean.csv")),
+            "g": getter.get_distance_from_farthest_metro(everything, os.path.join(data_dir, "bus_metro_distance.csv")),
+            "h": getter.get_delay_from_nearest_station(everything, os.path.join(data_dir, "metro_delay.csv")),
+        }
+    return _DATA[data_dir]
+
+
+def get_problem(scenario: dict, data: dict, timing: dict = None):
+    """
+    Builds the graph and the QUBO of a scenario, or returns them from the problems of this process
+
+    Parameters
+    ----------
+    scenario : dict
+        The complete scenario, see DEFAULT_SCENARIO
+    data : dict
+        The loaded data of the scenario's data directory, see load_data
+    timing : dict
+        Receives the seconds spent building the graph and the QUBO, both 0 when the problem was kept
+
+    Returns
+    -------
+    graph : Graph
+        The graph of the sampled candidate stations
+    qubo : QUBO
+        The placement problem, constrained for the swap and multilevel solvers and whenever there are too few candidates
+    """
+    timing = {} if timing is None else timing
+    timing["graph"] = timing["qubo"] = 0.0
+
+    problem_key = json.dumps([scenario[k] for k in ("data_dir", "n", "start", "end", "seed", "max_duration", "cost_weights",
+                                                    "coefficients", "stations")] + [scenario["solver"] in CONSTRAINED_SOLVERS])
+    if problem_key in _PROBLEMS:
+        _PROBLEMS.move_to_end(problem_key)
+        return _PROBLEMS[problem_key]
+
+    start = time.perf_counter()
+    getter = data["getter"]
+    selected = getter.get_selected_locations(getter.coordinates, n=scenario["n"], start=scenario["start"],
+                                             end=scenario["end"], seed=scenario["seed"])
+    f_list, g_list, h_list = [getter.normalize({k: v for k, v in data[key].items() if k in selected}) for key in "fgh"]
+    graph = Graph(getter.coordinates, selected, getter.station_distances, f_list, g_list, h_list,
+                  cost_weights=tuple(scenario["cost_weights"]), max_duration=scenario["max_duration"])
+    bw_centrality = rw.betweenness_centrality(graph.graph)
+    timing["graph"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    constrained = scenario["solver"] in CONSTRAINED_SOLVERS or graph.graph.num_nodes() <= scenario["stations"]
+    qubo = QUBO(graph, graph.graph, bw_centrality, stations=scenario["stations"],
+                coefficients=tuple(scenario["coefficients"]), constrained=constrained)
+
+    timing["qubo"] = time.perf_counter() - start
+
+    _PROBLEMS[problem_key] = graph, qubo
+    if len(_PROBLEMS) > PROBLEM_CACHE_SIZE:
+        _PROBLEMS.popitem(last=False)
+    return graph, qubo
+
+
+def run_scenario(scenario: dict):
+    """
+    Runs the placement pipeline for one scenario
+
+    Parameters
+    ----------
+    scenario : dict
+        The scenario, keys missing from it take their value from DEFAULT_SCENARIO
+
+    Returns
+    -------
+    result : dict
+        The scenario, the placed stations, the energy of the solution and the time spent in every stage
+    """
+    scenario = {**DEFAULT_SCENARIO, **scenario}
+    timing = {}
+
+    start = time.perf_counter()
+    data = load_data(scenario["data_dir"])
+    timing["load"] = time.perf_counter() - start
+
+    graph, qubo = get_problem(scenario, data, timing)
+
+    start = time.perf_counter()
+    if qubo.nodes <= scenario["stations"]:
+        # too few stations with data to choose from, all of them are placed
+        solution = {"x[%d]" % i: 1 for i in range(qubo.nodes)}
+        energy = None
+    elif scenario["solver"] == "swap":
+        solution = qubo.get_swap_solution(seed=scenario["seed"])
+        energy = None
+    elif scenario["solver"] == "multilevel":
+        solution = qubo.get_multilevel_solution(seed=scenario["seed"])
+        energy = None
+    elif scenario["solver"] == "neal":
+        solution, energy = qubo.get_top_solutions(k=1, seed=scenario["seed"])[0]
+    elif scenario["solver"] in ("qaoa", "exact"):
+        qp = qubo.create_problem()
+        result = qubo.run_qaoa(qp, seed=scenario["seed"]) if scenario["solver"] == "qaoa" else qubo.run_exact(qp)
+        solution = {"x[%d]" % i: int(round(v)) for i, v in enumerate(result.x)}
+        energy = result.fval + qubo.offset
+    else:
+        raise ValueError("unknown solver %s" % scenario["solver"])
+    timing["solve"] = time.perf_counter() - start
+
+    return {
+        "scenario": scenario,
+        "stations": qubo.get_selected_stations(solution),
+        "candidates": qubo.names,
+        "energy": energy,
+        "timing": timing,
+        "pid": os.getpid(),
+    }
+
+
+def read_scenarios(file_path):
+    """
+    Reads scenarios from a json file holding a list of scenarios, or from a jsonl file with one scenario per line
+    """
+    with open(file_path, 'r') as fp:
+        if file_path.endswith(".jsonl"):
+            scenarios = [json.loads(line) for line in fp if line.strip()]
+        else:
+            scenarios = json.load(fp)
+
+    for index, scenario in enumerate(scenarios):
+        scenario.setdefault("name", "scenario-%d" % index)
+    return scenarios
+
+
+def save_npz(results, file_path):
+    """
+    Writes the results as a scenario by station selection matrix
+    """
+    stations = sorted({name for result in results for name in result["candidates"]})
+    column = {name: index for index, name in enumerate(stations)}
+
+    selection = np.zeros((len(results), len(stations)), dtype=np.int8)
+    for row, result in enumerate(results):
+        selection[row, [column[name] for name in result["stations"]]] = 1
+
+    np.savez_compressed(file_path,
+                        scenarios=np.array([result["scenario"]["name"] for result in results]),
+                        stations=np.array(stations),
+                        selection=selection,
+                        energy=np.array([np.nan if result["energy"] is None else result["energy"] for result in results]),
+                        solve_time=np.array([result["timing"]["solve"] for result in results]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="qommute", description="Runs placement scenarios in parallel and streams the results")
+    parser.add_argument("scenarios", help="a json list or jsonl file of scenarios")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="the jsonl file the results are appended to")
+    parser.add_argument("--npz", help="also write a selection matrix of all results to this npz file")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="the number of worker processes")
+    args = parser.parse_args(argv)
+
+    scenarios = read_scenarios(args.scenarios)
+    results = []
+
+    with ProcessPoolExecutor(args.processes) as pool, open(args.output, 'a') as out:
+        submitted = {pool.submit(run_scenario, scenario): scenario for scenario in scenarios}
+
+        for future in as_completed(submitted):
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {"scenario": submitted[future], "error": repr(error)}
+            else:
+                results.append(result)
+
+            # one line per finished scenario, flushed so that an interrupted batch keeps its results
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            print("finished", result["scenario"]["name"])
+
+    if args.npz:
+        save_npz(results, args.npz)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import csv
+import itertools
+import os
+import warnings
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from ...instrumentation import stage
+from .getter_functions import DATA_DIR
+
+# coordinates are matched exactly once rounded to this many decimals, about 10 cm
+KEY_DECIMALS = 6
+
+
+def parse_locations(locations):
+    """
+    Parses quoted "lat,lon" strings in bulk
+
+    Parameters
+    ----------
+    locations : list
+        The strings, e.g. ["40.506882,-74.232979", ...]
+
+    Returns
+    -------
+    points : numpy.ndarray
+        An array of shape (len(locations), 2) of latitudes and longitudes
+    """
+    if not locations:
+        return np.zeros((0, 2))
+    return np.array(",".join(locations).split(","), dtype=np.float64).reshape(-1, 2)
+
+
+def location_keys(points):
+    """
+    Returns one int64 per point that is equal for points equal to KEY_DECIMALS decimals
+    """
+    scaled = np.round(points * 10**KEY_DECIMALS).astype(np.int64)
+    # latitudes and longitudes of the city fit in 32 bits each once scaled
+    return (scaled[:, 0] << 32) ^ (scaled[:, 1] & 0xFFFFFFFF)
+
+
+def read_counts(file_path, location_column="Location", count_column="total people", chunk_size=1000000):
+    """
+    Reads a stop-level count file like in_n_out.csv in chunks, so that memory does not grow with the number of rows
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the csv file
+    location_column : str
+        The column of the quoted "lat,lon" strings
+    count_column : str
+        The column of the counts
+    chunk_size : int
+        The number of rows per chunk
+
+    Yields
+    ------
+    points : numpy.ndarray
+        The (rows, 2) latitudes and longitudes of the chunk
+    counts : numpy.ndarray
+        The count of every row of the chunk
+    """
+    with open(file_path, 'r', newline='') as fp:
+        header = next(csv.reader([fp.readline()]))
+        location, count = header.index(location_column), header.index(count_column)
+        # the quoted location splits into two fields, shifting the columns after it
+        width = len(header) + 1
+        count_field = count + 1 if count > location else count
+
+        while True:
+            lines = list(itertools.islice(fp, chunk_size))
+            if not lines:
+                break
+
+            # fast path for all-numeric files like in_n_out.csv: drop the quotes and parse the whole chunk in C,
+            # a chunk with a text field comes out short and goes through the csv module instead
+            text = "".join(lines).replace('"', '').replace('\n', ',')
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", DeprecationWarning)
+                values = np.fromstring(text, sep=',')
+            if len(values) == len(lines) * width:
+                values = values.reshape(len(lines), width)
+                yield values[:, location:location + 2], values[:, count_field]
+            else:
+                rows = [row for row in csv.reader(lines) if row]
+                yield parse_locations([row[location] for row in rows]), np.array([row[count] for row in rows], dtype=np.float64)
+
+
+class StopIndex:
+    def __init__(self, stations_file=os.path.join(DATA_DIR, "bus_station.csv")):
+        """
+        The NTA of every stop of bus_station.csv, indexed by exact coordinates and by position
+
+        Parameters
+        ----------
+        stations_file : str
+            A csv file with the NTAName and the quoted "lat,lon" Location of every stop
+        """
+        with open(stations_file, 'r') as fp:
+            reader = csv.reader(fp)
+            header = next(reader)
+            name, location = header.index("NTAName"), header.index("Location")
+            rows = list(reader)
+
+        self.points = parse_locations([row[location] for row in rows])
+        self.ntas, self.stop_nta = np.unique([row[name] for row in rows], return_inverse=True)
+        self.ntas = self.ntas.tolist()
+
+        # sorted keys for the hash join and a k-d tree for the nearest stop join
+        keys = location_keys(self.points)
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+        self._tree = cKDTree(self.points)
+
+    def exact(self, points):
+        """
+        Returns the NTA ID of the stop at exactly the coordinates of every point, -1 where there is none
+        """
+        keys = location_keys(points)
+        position = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = self._keys[position] == keys
+        return np.where(found, self.stop_nta[self._order[position]], -1)
+
+    def nearest(self, points, max_distance=0.01):
+        """
+        Returns the NTA ID of the nearest stop to every point, -1 where it is farther than max_distance degrees
+        """
+        distance, stop = self._tree.query(points, distance_upper_bound=max_distance)
+        found = np.isfinite(distance)
+        return np.where(found, self.stop_nta[np.minimum(stop, len(self.stop_nta) - 1)], -1)
+
+    def centroids(self):
+        """
+        Returns the mean latitude and longitude of the stops of every NTA
+        """
+        counts = np.bincount(self.stop_nta, minlength=len(self.ntas))
+        return np.column_stack([np.bincount(self.stop_nta, self.points[:, i], minlength=len(self.ntas)) / counts
+                                for i in range(2)])
+
+
+def aggregate(counts_file, index: StopIndex, join="nearest", max_distance=0.1, max_unmatched=0.05, chunk_size=1000000,
+              **columns):
+    """
+    Sums stop-level counts per NTA, chunk by chunk
+
+    A row matched to no NTA is left out of every total, so the aggregation fails when more than max_unmatched of the
+    rows are. With the nearest join, 244 of the 507 rows of in_n_out.csv, 47% of its count, are farther than 0.01
+    degrees from every stop of bus_station.csv, 5 rows are at 0.05 degrees and none at 0.1, the default
+
+    Parameters
+    ----------
+    counts_file : str
+        A stop-level count file like in_n_out.csv
+    index : StopIndex
+        The NTAs of the stops
+    join : str
+        "exact" to match stops on their coordinates, "nearest" to match them to the nearest stop
+    max_distance : float
+        The largest distance in degrees of a nearest match
+    max_unmatched : float
+        The largest share of rows that may be matched to no NTA, 1 to accept any loss
+    chunk_size : int
+        The number of rows read at once
+    columns : dict
+        The location_column and count_column of read_counts
+
+    Returns
+    -------
+    totals : numpy.ndarray
+        The summed count of every NTA of the index
+    summary : dict
+        The number of rows read and of rows matched to no NTA, and the total count and the count left out
+    """
+    totals = np.zeros(len(index.ntas))
+    summary = {"rows": 0, "unmatched": 0, "count": 0.0, "unmatched_count": 0.0}
+
+    with stage("demand.aggregate", join=join) as span:
+        for points, counts in read_counts(counts_file, chunk_size=chunk_size, **columns):
+            nta = index.exact(points) if join == "exact" else index.nearest(points, max_distance)
+            matched = nta >= 0
+            totals += np.bincount(nta[matched], counts[matched], minlength=len(index.ntas))
+            summary["rows"] += len(counts)
+            summary["unmatched"] += int((~matched).sum())
+            summary["count"] += float(counts.sum())
+            summary["unmatched_count"] += float(counts[~matched].sum())
+        span.set(**summary)
+
+    if summary["unmatched"] > max_unmatched * summary["rows"]:
+        raise ValueError("{unmatched} of {rows} rows, {unmatched_count:g} of a count of {count:g}, match no NTA, more than "
+                         "the {share:.0%} allowed. Raise max_distance or max_unmatched".format(share=max_unmatched, **summary))
+
+    return totals, summary
+
+
+def write_station_pop(file_path, index: StopIndex, totals):
+    """
+    Writes one row per NTA in the format of station_pop_clean.csv, which get_no_of_people_at_station reads
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the csv file
+    index : StopIndex
+        The NTAs of the stops
+    totals : numpy.ndarray
+        The summed count of every NTA
+    """
+    with open(file_path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["", "NTAName", "Location", "total people"])
+        for i, (name, (lat, lon), total) in enumerate(zip(index.ntas, index.centroids().tolist(), totals.tolist())):
+            writer.writerow([i, name, "%.6f,%.6f" % (lat, lon), total])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate stop-level counts into the NTA ridership of station_pop_clean.csv")
+    parser.add_argument("counts", help="a stop-level count file like in_n_out.csv")
+    parser.add_argument("output", help="the csv file to write, shaped like station_pop_clean.csv")
+    parser.add_argument("--stations", default=os.path.join(DATA_DIR, "bus_station.csv"))
+    parser.add_argument("--join", choices=("nearest", "exact"), default="nearest")
+    parser.add_argument("--max-distance", type=float, default=0.1, help="the largest distance in degrees of a nearest match")
+    parser.add_argument("--max-unmatched", type=float, default=0.05,
+                        help="the largest share of rows matched to no NTA before the aggregation fails")
+    parser.add_argument("--chunk-size", type=int, default=1000000)
+    parser.add_argument("--location-column", default="Location")
+    parser.add_argument("--count-column", default="total people")
+    args = parser.parse_args(argv)
+
+    index = StopIndex(args.stations)
+    totals, summary = aggregate(args.counts, index, args.join, args.max_distance, args.max_unmatched, args.chunk_size,
+                                location_column=args.location_column, count_column=args.count_column)
+    write_station_pop(args.output, index, totals)
+    print("{rows} rows, {unmatched} matched to no NTA, {unmatched_count:g} of a count of {count:g} left out".format(**summary))
+
+
+if __name__ == "__main__":
+    main()
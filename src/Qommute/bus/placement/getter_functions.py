@@ -1,14 +1,49 @@
 import csv
+import os
 import random
 
+from ...stage_cache import StageCache
+from ...instrumentation import stage
+from ...travel_times.matrix import TravelTimeMatrix
+
+# the csv files shipped next to this module, so that the package works from any working directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
 class GetterFunctions:
-    def __init__(self):
-        self.coordinates = self.get_data_from_csv("./data/bus_station_location.csv")
-        self.selected_coordinates = self.get_selected_locations(self.coordinates)
-        self.station_distances = self.get_distance_between_stations()
-        self.pop_at_station = self.get_no_of_people_at_station(self.selected_coordinates)
-        self.distance_from_metro = self.get_distance_from_farthest_metro(self.selected_coordinates)
-        self.delay_from_station = self.get_delay_from_nearest_station(self.selected_coordinates)
+    def __init__(self, data_dir=DATA_DIR, cache: StageCache = None, travel_times: str = None):
+        """
+        Loads the placement csv files of data_dir
+
+        Parameters
+        ----------
+        data_dir : str
+            The directory holding the placement csv files
+        cache : StageCache
+            Loads the parsed city-wide files from disk when they did not change, if given
+        travel_times : str
+            A directory written by Qommute.travel_times.matrix, whose completed matrix is used instead of station_distance.csv
+        """
+        self.data_dir = data_dir
+
+        # the two city-wide files go through the cache, which loads them from disk when they did not change
+        cache = cache or StageCache(enabled=False)
+        location_file = os.path.join(data_dir, "bus_station_location.csv")
+        distance_file = os.path.join(data_dir, "station_distance.csv")
+
+        with stage("getter.locations") as span:
+            self.coordinates, _ = cache.run("bus_station_location", self.get_data_from_csv, location_file, files=(location_file,))
+            self.selected_coordinates = self.get_selected_locations(self.coordinates)
+            span.set(stations=len(self.coordinates), selected=len(self.selected_coordinates))
+        with stage("getter.station_distances") as span:
+            if travel_times is not None:
+                self.station_distances = TravelTimeMatrix.load(travel_times)
+            else:
+                self.station_distances, _ = cache.run("bus_station_distance", self.get_distance_between_stations, distance_file, files=(distance_file,))
+            span.set(distances=len(self.station_distances))
+        with stage("getter.features"):
+            self.pop_at_station = self.get_no_of_people_at_station(self.selected_coordinates, os.path.join(data_dir, "station_pop_clean.csv"))
+            self.distance_from_metro = self.get_distance_from_farthest_metro(self.selected_coordinates, os.path.join(data_dir, "bus_metro_distance.csv"))
+            self.delay_from_station = self.get_delay_from_nearest_station(self.selected_coordinates, os.path.join(data_dir, "metro_delay.csv"))
 
     def get_data_from_csv(self, file_path):
         """
@@ -50,7 +85,7 @@ class GetterFunctions:
         
         return coordinates
 
-    def get_selected_locations(self, coordinates: dict, n=20, start=1, end=20, lat=40.76903, lon=-73.969649):
+    def get_selected_locations(self, coordinates: dict, n=20, start=1, end=20, lat=40.76903, lon=-73.969649, seed=42):
         """
         Randomly selects n locations from the coordinates dictionary
 
@@ -64,6 +99,8 @@ class GetterFunctions:
             The start distance from the center of the map
         end : int
             The end distance from the center of the map
+        seed : int
+            The seed of the random selection
 
         Returns
         -------
@@ -75,12 +112,12 @@ class GetterFunctions:
             if (v[0]-lat)**2 + (v[1]-lon)**2 >= start/100 and (v[0]-lat)**2 + (v[1]-lon)**2 <= end/100:
                 selected_coordinates[k] = v
         
-        random.seed(42)
-        selected_coordinates = dict(random.sample(list(selected_coordinates.items()), n))
+        rng = random.Random(seed)
+        selected_coordinates = dict(rng.sample(list(selected_coordinates.items()), n))
 
         return selected_coordinates
 
-    def get_distance_between_stations(self, file_path = "./data/station_distance.csv"):
+    def get_distance_between_stations(self, file_path = os.path.join(DATA_DIR, "station_distance.csv")):
         """
         Takes a csv file path as input and returns a dictionary of distances between stations
 
@@ -106,13 +143,16 @@ class GetterFunctions:
                 # row variable is a list that represents a row in csv
                 start = row[0]
                 end = row[1]
+                # a pair the travel time builder found no route for has no duration
+                if not row[2]:
+                    continue
                 distance = float(row[2])
                 # Append the values to the respective lists
                 station_distances[(start, end)] = distance
         
         return station_distances
 
-    def get_no_of_people_at_station(self, selected_coordinates: dict, file_path: str = "./data/station_pop_clean.csv"):
+    def get_no_of_people_at_station(self, selected_coordinates: dict, file_path: str = os.path.join(DATA_DIR, "station_pop_clean.csv")):
         """
         Takes a csv file path as input and returns a dictionary of distances between stations
 
@@ -145,7 +185,7 @@ class GetterFunctions:
         
         return pop_at_station
 
-    def get_distance_from_farthest_metro(self, selected_coordinates: dict, file_path: str = "./data/bus_metro_distance.csv"):
+    def get_distance_from_farthest_metro(self, selected_coordinates: dict, file_path: str = os.path.join(DATA_DIR, "bus_metro_distance.csv")):
         """
         Takes a csv file path as input and returns a dictionary of distances between stations
 
@@ -178,7 +218,7 @@ class GetterFunctions:
         
         return distance_from_metro
 
-    def get_delay_from_nearest_station(self, selected_coordinates: dict, file_path: str = "./data/metro_delay.csv"):
+    def get_delay_from_nearest_station(self, selected_coordinates: dict, file_path: str = os.path.join(DATA_DIR, "metro_delay.csv")):
         """
         Takes a csv file path as input and returns a dictionary of distances between stations
 
@@ -211,6 +251,38 @@ class GetterFunctions:
         
         return delay_from_station
 
+    def get_scenario_delay_from_nearest_station(self, selected_coordinates: dict, table, scenario: dict, file_path: str = os.path.join(DATA_DIR, "metro_delay.csv")):
+        """
+        Looks up the delay at every selected station under a scenario instead of reading the fixed predicted_delay
+
+        Parameters
+        ----------
+        selected_coordinates : dict
+            A dictionary of coordinates with the name of the city as key and a tuple of latitude and longitude as value
+        table : DelayTable
+            The precomputed delay table, see Qommute.bus.delay.table
+        scenario : dict
+            The month, day_type, reporting_category and subcategory of the scenario
+        file_path : str
+            The path to the csv file giving the busiest line near every station
+
+        Returns
+        -------
+        delay_from_station : dict
+            A dictionary of delays with the name of the station as key
+        """
+        stations, lines = [], []
+        with open(file_path, 'r') as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)  # Skip the header row if present
+
+            for row in reader:
+                if row[1] in selected_coordinates.keys():
+                    stations.append(row[1])
+                    lines.append(row[2])
+
+        return dict(zip(stations, table.lookup(lines, scenario).tolist()))
+
     def normalize(self, dic: dict):
         """
         Takes a dictionary as input and returns a dictionary of normalized values
@@ -223,10 +295,8 @@ class GetterFunctions:
         Returns
         -------
         dic : dict
-            A dictionary of normalized values
+            A new dictionary of normalized values, the input is left unchanged
         """
         max_value = max(dic.values())
         min_value = min(dic.values())
-        for key in dic.keys():
-            dic[key] = (dic[key] - min_value) / (max_value - min_value)
-        return dic
\ No newline at end of file
+        return {key: (value - min_value) / (max_value - min_value) for key, value in dic.items()}
\ No newline at end of file
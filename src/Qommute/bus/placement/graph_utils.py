@@ -2,18 +2,22 @@ import rustworkx
 import matplotlib.pyplot as plt
 from rustworkx.visualization import mpl_draw
 
-from getter_functions import get_no_of_people_at_station, get_distance_from_farthest_metro, get_delay_from_nearest_station, normalize
+from ...instrumentation import stage
 
 class Graph:
-    def __init__(self, coordinates, selected_coordinates, station_distances, f_list, g_list, h_list) -> None:
+    def __init__(self, coordinates, selected_coordinates, station_distances, f_list, g_list, h_list, cost_weights=(5, 3, 0.3), max_duration=25) -> None:
         self.coordinates = coordinates
         self.selected_coordinates = selected_coordinates
         self.station_distances = station_distances
         self.f_list = f_list
         self.g_list = g_list
         self.h_list = h_list
-        self.node_dict, self.edge_dict, self.index_dict = self.create_nodes_edges(self.selected_coordinates, self.station_distances)
-        self.graph = self.make_graph(self.node_dict, self.edge_dict, self.index_dict)
+        self.cost_weights = cost_weights
+        self.max_duration = max_duration
+        with stage("graph.nodes_edges", candidates=len(selected_coordinates), distances=len(station_distances)):
+            self.node_dict, self.edge_dict, self.index_dict = self.create_nodes_edges(self.selected_coordinates, self.station_distances)
+        with stage("graph.make_graph", nodes=len(self.node_dict), edges=len(self.edge_dict)):
+            self.graph = self.make_graph(self.node_dict, self.edge_dict, self.index_dict)
 
 
     def create_nodes_edges(self, selected_coordinates:dict, station_distances:dict):
@@ -25,7 +29,8 @@ class Graph:
         selected_coordinates : dict
             A dictionary of coordinates with the name of the city as key and a tuple of latitude and longitude as value
         station_distances : dict
-            A dictionary of distances between stations with the name of the city as key and a tuple of latitude and longitude as value
+            A dictionary of distances between stations with the name of the city as key and a tuple of latitude and longitude as value,
+            or a TravelTimeMatrix
 
         Returns
         -------
@@ -45,9 +50,7 @@ class Graph:
                 node_dict[key] = { 'name':key, 'f': self.f_list[key], 'g': self.g_list[key], 'h': self.h_list[key] }
 
         #constants
-        C = 5
-        D = 3
-        E = 0.3
+        C, D, E = self.cost_weights
 
         temp = {node: {"name": attrs["name"], "c": C*attrs["f"] + D*attrs["g"] + E*attrs["h"]}
                     for node, attrs in node_dict.items()}
@@ -58,8 +61,10 @@ class Graph:
             index_dict[node] = index
             index += 1
         
-        for item in station_distances.items():
-            if (item[0][0] in node_dict) and (item[0][1] in node_dict) and item[1] <= 25:
+        # a travel time matrix gives the pairs between the nodes directly instead of every known pair
+        items = station_distances.items(node_dict) if hasattr(station_distances, "submatrix") else station_distances.items()
+        for item in items:
+            if (item[0][0] in node_dict) and (item[0][1] in node_dict) and item[1] <= self.max_duration:
                 edge_dict[item[0]] = {'cost': item[1]}
         
         return node_dict, edge_dict, index_dict
@@ -0,0 +1,302 @@
+import csv
+import math
+
+import numpy as np
+
+from ...solve_context import SolveContext
+from ...placement_terms import get_term_arrays, decode_selection
+from ...instrumentation import stage
+
+
+def read_profiles(file_path):
+    """
+    Reads the ridership of every station in every period from a csv file with the station name in the first column
+    and one column per period, e.g. NTAName,0,1,...,23 for hourly profiles
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the csv file
+
+    Returns
+    -------
+    profiles : dict
+        A dictionary of ridership dictionaries, with the period as key and the name of the station as inner key,
+        in the order of the columns
+    """
+    with open(file_path, 'r') as csv_file:
+        reader = csv.reader(csv_file)
+        periods = next(reader)[1:]
+        profiles = {period: {} for period in periods}
+        for row in reader:
+            for period, value in zip(periods, row[1:]):
+                if value != "":
+                    profiles[period][row[0]] = float(value)
+    return profiles
+
+
+def period_costs(names, profiles: dict, features: dict, cost_weights=(5, 3, 0.3)):
+    """
+    Computes the node cost c = Cf + Dg + Eh of every station in every period, normalizing every input over the
+    stations like Graph does. Only the ridership f changes from one period to the next
+
+    Parameters
+    ----------
+    names : list
+        The name of the station of every node
+    profiles : dict
+        The raw ridership of every period, see read_profiles. A station missing from a period has no riders in it
+    features : dict
+        The raw inputs shared by all periods, {"g": metro distance, "h": delay}, each a dictionary with the name of the
+        station as key
+    cost_weights : tuple
+        The weights C, D, E of the node cost
+
+    Returns
+    -------
+    costs : numpy.ndarray
+        The (periods, nodes) costs
+    """
+    def normalize(values):
+        spread = values.max(axis=-1, keepdims=True) - values.min(axis=-1, keepdims=True)
+        spread[spread == 0] = 1.0
+        return (values - values.min(axis=-1, keepdims=True)) / spread
+
+    C, D, E = cost_weights
+    f = np.array([[profile.get(name, 0.0) for name in names] for profile in profiles.values()], dtype=float)
+    g, h = (np.array([features[key][name] for name in names], dtype=float) for key in "gh")
+
+    return C * normalize(f) + D * normalize(g) + E * normalize(h)
+
+
+class BatchedAnnealer:
+    def __init__(self, edges, weights, costs, stations, coefficients=(100, 100, 100), robustness=0.0):
+        """
+        Simulated annealing of the placement problems of many periods in a single run. The periods share the graph
+        and the H_1 weights and only differ in their H_2 costs, so every read of every period is one row of the same
+        arrays and one step proposes a swap in all of them at once. Like SwapAnnealer, a move swaps a selected and an
+        unselected node, so every period keeps exactly `stations` nodes and H_3 is never built
+
+        With robustness > 0 the periods of a read are coupled by robustness * the number of nodes selected in one
+        period and not in the next or the other way round, which pulls the placements of neighbouring periods together
+
+        The weights are kept as a dense (n, n) matrix, for graphs of up to a few thousand nodes
+
+        Parameters
+        ----------
+        edges : numpy.ndarray
+            An (m, 2) array of the node indices of every edge
+        weights : numpy.ndarray
+            The normalized H_1 weight of every edge
+        costs : numpy.ndarray
+            The (periods, nodes) H_2 costs, see period_costs
+        stations : int
+            The number of nodes to select
+        coefficients : tuple
+            The coefficients A, B, C of the Hamiltonian, C is unused
+        robustness : float
+            The weight of the coupling between consecutive periods
+        """
+        A, B = coefficients[0], coefficients[1]
+
+        self.linear = B * np.atleast_2d(np.asarray(costs, dtype=float))
+        self.periods, self.n = self.linear.shape
+        self.stations = stations
+        self.robustness = robustness
+
+        if not 0 < stations < self.n:
+            raise ValueError("stations must be between 1 and the number of nodes - 1, got %d" % stations)
+
+        # parallel edges merged, the pair weight of a swap is one lookup
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.weights = np.zeros((self.n, self.n))
+        np.add.at(self.weights, (edges[:, 0], edges[:, 1]), A * np.asarray(weights, dtype=float))
+        self.weights += self.weights.T
+
+    def energy(self, x):
+        """
+        Evaluates A * H_1 + B * H_2 of every period for a batch of shape (reads, periods, n)
+
+        Returns
+        -------
+        energies : numpy.ndarray
+            The (reads, periods) energies, without the coupling
+        """
+        x = np.asarray(x, dtype=float)
+        unselected = 1 - x
+        # every unselected edge is counted from both of its nodes
+        h_1 = 0.5 * np.einsum("rti,ij,rtj->rt", unselected, self.weights, unselected)
+        return h_1 + np.einsum("rti,ti->rt", x, self.linear)
+
+    def coupling(self, x):
+        """
+        Returns the number of nodes that change between consecutive periods of every read, of shape (reads,)
+        """
+        return np.sum(x[:, 1:] != x[:, :-1], axis=(1, 2))
+
+    def default_beta_range(self):
+        """
+        Hot temperature accepts the largest possible swap with probability 1/2, cold temperature rejects the smallest term with probability 0.99
+        """
+        largest = 2 * np.max(self.weights.sum(axis=1) + np.abs(self.linear).max(axis=0)) + 4 * self.robustness
+        if largest == 0:
+            largest = 1.0
+
+        terms = np.concatenate((self.weights[self.weights > 0], np.abs(self.linear).ravel(), [self.robustness]))
+        terms = terms[terms > 0]
+        smallest = np.min(terms) if len(terms) else 1.0
+
+        return math.log(2) / largest, math.log(100) / smallest
+
+    def sample(self, num_reads=8, num_sweeps=256, beta_range=None, seed=None):
+        """
+        Runs the annealer
+
+        Parameters
+        ----------
+        num_reads : int
+            The number of independent runs of all periods
+        num_sweeps : int
+            The number of sweeps per run, a sweep being n proposed swaps in every period
+        beta_range : tuple
+            The hot and cold inverse temperatures of the geometric schedule, derived from the coefficients if None
+        seed : int or numpy.random.Generator
+            The seed of the run
+
+        Returns
+        -------
+        samples : numpy.ndarray
+            The best placements of every run, of shape (num_reads, periods, n)
+        energies : numpy.ndarray
+            Their (num_reads, periods) energies, without the coupling
+        """
+        context = SolveContext(seed)
+        rng = context.rng
+        n, k, T = self.n, self.stations, self.periods
+        W = self.weights
+
+        if beta_range is None:
+            beta_range = self.default_beta_range()
+        betas = np.geomspace(beta_range[0], beta_range[1], num_sweeps)
+
+        # one row per read and period, rows of the same read next to each other
+        rows = num_reads * T
+        period = np.tile(np.arange(T), num_reads)
+        linear = self.linear[period]
+        order = np.argsort(rng.random((rows, n)), axis=1)
+        selected, others = order[:, :k].copy(), order[:, k:].copy()
+        x = np.zeros((rows, n), dtype=np.int8)
+        np.put_along_axis(x, selected, 1, axis=1)
+
+        # zero[r, i] is the H_1 weight between node i and its unselected neighbours in row r
+        zero = (1 - x) @ W
+        energy = 0.5 * np.sum((1 - x) * zero, axis=1) + np.sum(x * linear, axis=1)
+
+        # a coupled period only sees its neighbours' current placements if they do not move in the same step
+        coupled = self.robustness > 0 and T > 1
+        if coupled:
+            groups = [np.flatnonzero(period % 2 == parity) for parity in (0, 1)]
+        else:
+            groups = [np.arange(rows)]
+        neighbors = [(np.maximum(g - 1, 0), period[g] > 0, np.minimum(g + 1, rows - 1), period[g] < T - 1) for g in groups]
+
+        best_x = x.reshape(num_reads, T, n).copy()
+        best_total = np.full(num_reads, np.inf)
+
+        for beta in betas.tolist():
+            for g, (before, has_before, after, has_after) in zip(groups, neighbors):
+                thresholds = np.log(rng.random((n, len(g))))
+                outs = rng.integers(k, size=(n, len(g)))
+                ins = rng.integers(n - k, size=(n, len(g)))
+                for step in range(n):
+                    a, b = outs[step], ins[step]
+                    i, j = selected[g, a], others[g, b]
+
+                    # removing i unselects its edges to unselected nodes, adding j selects j's, the edge i-j stays unselected on one side
+                    delta = (zero[g, i] - linear[g, i]) + (linear[g, j] - zero[g, j]) - W[i, j]
+                    change = delta
+                    if coupled:
+                        # against a neighbouring period, i stops or starts matching it and so does j
+                        mismatch = has_before * (x[before, i] - x[before, j]) + has_after * (x[after, i] - x[after, j])
+                        change = delta + 2 * self.robustness * mismatch
+
+                    accept = -beta * change >= thresholds[step]
+                    if not accept.any():
+                        continue
+                    r, a, b, i, j = g[accept], a[accept], b[accept], i[accept], j[accept]
+                    x[r, i], x[r, j] = 0, 1
+                    selected[r, a], others[r, b] = j, i
+                    zero[r] += W[i] - W[j]
+                    energy[r] += delta[accept]
+
+            # every read is judged by all of its periods together, coupling included
+            total = energy.reshape(num_reads, T).sum(axis=1)
+            if coupled:
+                total = total + self.robustness * self.coupling(x.reshape(num_reads, T, n))
+            improved = total < best_total
+            best_total[improved] = total[improved]
+            best_x[improved] = x.reshape(num_reads, T, n)[improved]
+
+        return best_x, self.energy(best_x)
+
+
+class MultiPeriodPlanner:
+    def __init__(self, qubo, profiles: dict, features: dict, cost_weights=(5, 3, 0.3), robustness=0.0):
+        """
+        Places stations for every period of a demand profile, e.g. every hour of the day, in one batched annealing
+        run over the graph and H_1 of a placement problem, see BatchedAnnealer
+
+        Parameters
+        ----------
+        qubo : QUBO
+            The placement problem, its graph, centrality, stations and coefficients are shared by all periods
+        profiles : dict
+            The raw ridership of every period, see read_profiles
+        features : dict
+            The raw inputs shared by all periods, {"g": metro distance, "h": delay}
+        cost_weights : tuple
+            The weights C, D, E of the node cost c = Cf + Dg + Eh, as given to Graph
+        robustness : float
+            The weight of the coupling between consecutive periods, 0 to place every period on its own
+        """
+        self.qubo = qubo
+        self.names = qubo.names
+        self.periods = list(profiles)
+        self.costs = period_costs(self.names, profiles, features, cost_weights)
+
+        edges, weights, _ = get_term_arrays(qubo.graph, qubo.bw_centrality)
+        self.annealer = BatchedAnnealer(edges, weights, self.costs, qubo.stations, qubo.coefficients, robustness)
+
+    def solve(self, num_reads=8, num_sweeps=256, seed=None):
+        """
+        Places the stations of every period and summarizes how stable the placements are across periods
+
+        Returns
+        -------
+        result : dict
+            The periods, the solution, placed stations and energy of every period, how many periods placed every
+            station, and the consensus placement of the stations placed most often with its energy in every period
+        """
+        with stage("multiperiod.solve", periods=len(self.periods), nodes=self.annealer.n) as span:
+            samples, energies = self.annealer.sample(num_reads=num_reads, num_sweeps=num_sweeps, seed=seed)
+            coupled = energies.sum(axis=1) + self.annealer.robustness * self.annealer.coupling(samples)
+            best = int(np.argmin(coupled))
+            x, energies = samples[best], energies[best]
+            span.set(num_reads=num_reads, num_sweeps=num_sweeps)
+
+        frequency = x.sum(axis=0)
+        # the stations placed in the most periods, lower total cost first among equals
+        order = np.lexsort((self.costs.sum(axis=0), -frequency))
+        consensus = np.zeros(self.annealer.n, dtype=np.int8)
+        consensus[order[:self.qubo.stations]] = 1
+        consensus_energies = self.annealer.energy(np.broadcast_to(consensus, x.shape)[None])[0]
+
+        return {
+            "periods": self.periods,
+            "solutions": [decode_selection(row) for row in x],
+            "stations": [[self.names[i] for i in np.flatnonzero(row)] for row in x],
+            "energies": energies.tolist(),
+            "frequency": dict(zip(self.names, frequency.tolist())),
+            "consensus": [self.names[i] for i in np.flatnonzero(consensus)],
+            "consensus_energies": consensus_energies.tolist(),
+        }
@@ -0,0 +1,297 @@
+import argparse
+import csv
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from ...solve_context import SolveContext
+from ...placement_terms import get_term_arrays
+from ...swap_search import SwapAnnealer
+from ...instrumentation import stage
+
+# the analyzer of a pool worker, set once per process by _init_worker
+_WORKER_ANALYZER = None
+
+
+def _init_worker(analyzer):
+    global _WORKER_ANALYZER
+    _WORKER_ANALYZER = analyzer
+
+
+def _analyze_in_worker(task):
+    station, seed = task
+    return _WORKER_ANALYZER.analyze(station, seed=seed)
+
+
+def dependencies(adjacency, sources, removed=None):
+    """
+    Runs Brandes' accumulation from many sources at once, one breadth-first level at a time as sparse products
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse.csr_matrix
+        The symmetric (n, n) number of edges between every two nodes, parallel edges counting as separate paths
+        like in rustworkx
+    sources : numpy.ndarray
+        The source nodes
+    removed : int
+        A node treated as absent from the graph, if given
+
+    Returns
+    -------
+    dependency : numpy.ndarray
+        The summed dependency of the sources on every node, the betweenness of every node if the sources are all of
+        them, counting both directions of every pair
+    """
+    n = adjacency.shape[0]
+    sources = np.asarray(sources, dtype=np.int64)
+    rows = np.arange(len(sources))
+
+    sigma = np.zeros((len(sources), n))
+    sigma[rows, sources] = 1
+    reached = sigma > 0
+    frontier = sigma.copy()
+    levels = [reached.copy()]
+
+    while True:
+        paths = np.asarray(adjacency @ frontier.T).T
+        paths[reached] = 0
+        if removed is not None:
+            paths[:, removed] = 0
+        new = paths > 0
+        if not new.any():
+            break
+        sigma[new] = paths[new]
+        reached |= new
+        frontier = np.where(new, paths, 0)
+        levels.append(new)
+
+    # every node passes 1 + its own dependency back to its parents, in proportion to their shortest paths
+    delta = np.zeros((len(sources), n))
+    for level in range(len(levels) - 1, 0, -1):
+        share = np.where(levels[level], (1 + delta) / np.where(sigma > 0, sigma, 1), 0)
+        back = np.asarray(adjacency @ share.T).T
+        delta += np.where(levels[level - 1], sigma * back, 0)
+    delta[rows, sources] = 0
+
+    return delta.sum(axis=0)
+
+
+class OutageAnalyzer:
+    def __init__(self, graph, bw_centrality, stations, coefficients=(100, 100, 100), names=None, pivots=64, seed=None):
+        """
+        Evaluates how a placement changes when single stations close, without rebuilding the problem per station
+
+        Every outage starts from the baseline: its betweenness is the baseline's plus the change the closure causes,
+        estimated from the same `pivots` sources before and after, and exact when the pivots are every node. The
+        H_1 weights and H_2 costs are patched from the baseline arrays, and the solve is a short swap anneal started
+        from the baseline placement
+
+        Parameters
+        ----------
+        graph : rustworkx.PyGraph
+            The placement graph, every node carrying its cost "c", from Graph.make_graph or make_graph
+        bw_centrality : rustworkx.CentralityMapping
+            The betweenness centrality of every node, as rustworkx computes it with its defaults
+        stations : int
+            The number of stations to place
+        coefficients : tuple
+            The coefficients A, B, C of the Hamiltonian, C is unused
+        names : list
+            The name of the station of every node, the node index if None
+        pivots : int
+            The number of sources the changes in betweenness are estimated from
+        seed : int or numpy.random.Generator
+            The seed of the pivots and of the baseline solve
+        """
+        self.stations = stations
+        self.coefficients = coefficients
+        self.n = graph.num_nodes()
+        self.names = list(names) if names is not None else list(range(self.n))
+
+        self.edges, _, self.costs = get_term_arrays(graph, bw_centrality)
+        ones = np.ones(2 * len(self.edges))
+        self.adjacency = sparse.csr_matrix((ones, (np.concatenate((self.edges[:, 0], self.edges[:, 1])),
+                                                   np.concatenate((self.edges[:, 1], self.edges[:, 0])))),
+                                           shape=(self.n, self.n))
+
+        # rustworkx normalizes by (n - 1)(n - 2), the dependencies count both directions of every pair
+        scale = (self.n - 1) * (self.n - 2) if self.n > 2 else 1.0
+        self.dependency = np.array([bw_centrality[i] for i in range(self.n)], dtype=float) * scale
+
+        context = SolveContext(seed)
+        self.pivots = np.sort(context.rng.choice(self.n, min(pivots, self.n), replace=False))
+        self.pivot_dependency = dependencies(self.adjacency, self.pivots)
+
+        with stage("outage.baseline", nodes=self.n, edges=len(self.edges)):
+            annealer = SwapAnnealer(self.edges, self.weights(self.dependency), self.costs, stations, coefficients)
+            samples, energies = annealer.sample(num_reads=10, num_sweeps=100, seed=context.rng)
+            self.placement = samples[np.argmin(energies)]
+            self.energy = float(np.min(energies))
+
+    def weights(self, dependency, keep=None):
+        """
+        Returns the H_1 weight of every kept edge from the betweenness of its nodes, normalized like get_term_arrays
+        """
+        edges = self.edges if keep is None else self.edges[keep]
+        weights = dependency[edges[:, 0]] + dependency[edges[:, 1]]
+        if len(weights) and weights.max() > 0:
+            weights = weights / weights.max()
+        return weights
+
+    def outage_dependency(self, station):
+        """
+        Estimates the betweenness of every node once `station` is closed, in the unnormalized units of dependencies
+
+        The pivots other than the station are run before and after the closure and their difference, scaled up to
+        every other source, is added to the exact baseline. The station's own dependency as a source is removed exactly
+        """
+        pivots = self.pivots[self.pivots != station]
+        if len(pivots) == self.n - 1:
+            # every other node is a pivot, the betweenness is recomputed exactly
+            return dependencies(self.adjacency, pivots, station)
+
+        before = self.pivot_dependency if len(pivots) == len(self.pivots) else dependencies(self.adjacency, pivots)
+        after = dependencies(self.adjacency, pivots, station)
+        own = dependencies(self.adjacency, [station])
+        return np.maximum(self.dependency - own + (after - before) * ((self.n - 1) / len(pivots)), 0)
+
+    def analyze(self, station, num_reads=4, num_sweeps=50, seed=None):
+        """
+        Places the stations with one station closed
+
+        Parameters
+        ----------
+        station : int
+            The node index of the closed station
+        num_reads : int
+            The number of annealing reads, all started from the baseline placement
+        num_sweeps : int
+            The number of sweeps per read
+        seed : int or numpy.random.Generator
+            The seed of the annealer
+
+        Returns
+        -------
+        row : dict
+            The closed station, whether the baseline placed it, the new energy and its change, the stations added
+            and removed, the largest change in betweenness and the station it happened at
+        """
+        context = SolveContext(seed)
+        keep_nodes = np.flatnonzero(np.arange(self.n) != station)
+        position = np.full(self.n, -1)
+        position[keep_nodes] = np.arange(len(keep_nodes))
+
+        dependency = self.outage_dependency(station)
+        keep = (self.edges[:, 0] != station) & (self.edges[:, 1] != station)
+        edges = position[self.edges[keep]]
+        weights = self.weights(dependency, keep)
+        costs = self.costs[keep_nodes]
+
+        stations = min(self.stations, len(keep_nodes) - 1)
+        annealer = SwapAnnealer(edges, weights, costs, stations, self.coefficients)
+
+        # the baseline placement, with a closed placed station replaced by the best unplaced one
+        start = self.placement[keep_nodes].copy()
+        while start.sum() > stations:
+            start[np.flatnonzero(start)[-1]] = 0
+        if start.sum() < stations:
+            candidates = np.flatnonzero(start == 0)
+            gains = []
+            for i in candidates:
+                trial = start.copy()
+                trial[i] = 1
+                gains.append(annealer.energy(trial))
+            start[candidates[np.argsort(gains)[:stations - start.sum()]]] = 1
+
+        # start half way down the schedule, so that the anneal repairs the baseline placement instead of forgetting it
+        hot, cold = annealer.default_beta_range()
+        samples, energies = annealer.sample(num_reads=num_reads, num_sweeps=num_sweeps, beta_range=(math.sqrt(hot * cold), cold),
+                                            initial_states=start[None, :], seed=context.rng)
+        placement = samples[np.argmin(energies)]
+        energy = float(np.min(energies))
+
+        before = self.placement[keep_nodes]
+        shift = dependency[keep_nodes] / max(dependency.max(), 1e-12) - self.dependency[keep_nodes] / max(self.dependency.max(), 1e-12)
+        most = int(np.argmax(np.abs(shift))) if len(shift) else None
+
+        return {
+            "station": self.names[station],
+            "placed": bool(self.placement[station]),
+            "energy": energy,
+            "energy_change": energy - self.energy,
+            "added": [self.names[keep_nodes[i]] for i in np.flatnonzero((placement == 1) & (before == 0))],
+            "removed": [self.names[keep_nodes[i]] for i in np.flatnonzero((placement == 0) & (before == 1))],
+            "centrality_shift": float(np.abs(shift[most])) if most is not None else 0.0,
+            "most_shifted": self.names[keep_nodes[most]] if most is not None else None,
+        }
+
+    def run(self, stations=None, processes=None, seed=None):
+        """
+        Analyzes the closure of every listed station on a process pool
+
+        Parameters
+        ----------
+        stations : list
+            The node indices of the stations to close, every station if None
+        processes : int
+            The number of worker processes, the number of CPUs if None. 0 analyzes in this process
+        seed : int or numpy.random.Generator
+            The seed of every solve
+
+        Returns
+        -------
+        table : list
+            One row per closed station, see analyze, the largest energy change first
+        """
+        context = SolveContext(seed)
+        stations = range(self.n) if stations is None else stations
+        tasks = [(int(station), context.child_seed()) for station in stations]
+
+        with stage("outage.run", stations=len(tasks), pivots=len(self.pivots)):
+            if processes == 0:
+                table = [self.analyze(station, seed=task_seed) for station, task_seed in tasks]
+            else:
+                with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(self,)) as pool:
+                    table = list(pool.map(_analyze_in_worker, tasks, chunksize=max(1, len(tasks) // 64)))
+
+        return sorted(table, key=lambda row: -row["energy_change"])
+
+
+def write_table(table, file_path):
+    """
+    Writes the impact table as a csv file, the added and removed stations joined by semicolons
+    """
+    with open(file_path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["station", "placed", "energy", "energy_change", "added", "removed", "centrality_shift", "most_shifted"])
+        for row in table:
+            writer.writerow([row["station"], int(row["placed"]), row["energy"], row["energy_change"], ";".join(row["added"]),
+                             ";".join(row["removed"]), row["centrality_shift"], row["most_shifted"]])
+
+
+def main(argv=None):
+    from .batch import DEFAULT_SCENARIO, load_data, get_problem
+
+    parser = argparse.ArgumentParser(description="Place the bus stations once per closed station and write the impact table")
+    parser.add_argument("output", help="the csv file to write")
+    parser.add_argument("--scenario", default="{}", help="a json scenario, see batch.DEFAULT_SCENARIO")
+    parser.add_argument("--stations", nargs="*", help="the names of the stations to close, every station if not given")
+    parser.add_argument("--pivots", type=int, default=64, help="the number of sources the betweenness changes are estimated from")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="the number of worker processes, 0 for none")
+    args = parser.parse_args(argv)
+
+    scenario = {**DEFAULT_SCENARIO, **json.loads(args.scenario), "solver": "swap"}
+    graph, qubo = get_problem(scenario, load_data(scenario["data_dir"]))
+
+    analyzer = OutageAnalyzer(qubo.graph, qubo.bw_centrality, qubo.stations, qubo.coefficients, qubo.names, args.pivots,
+                              seed=scenario["seed"])
+    stations = None if not args.stations else [qubo.names.index(name) for name in args.stations]
+    write_table(analyzer.run(stations, args.processes, seed=scenario["seed"]), args.output)
+
+
+if __name__ == "__main__":
+    main()
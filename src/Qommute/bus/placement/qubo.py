@@ -5,10 +5,8 @@ import neal
 
 import json
 
-from qiskit.utils import algorithm_globals
 from qiskit.algorithms.minimum_eigensolvers import QAOA, NumPyMinimumEigensolver
 from qiskit.algorithms.optimizers import COBYLA
-from qiskit.primitives import Sampler
 from qiskit_optimization.algorithms import (
     MinimumEigenOptimizer,
     RecursiveMinimumEigenOptimizer,
@@ -23,19 +21,57 @@ import numpy as np
 from qiskit_optimization.translators import from_docplex_mp
 from docplex.mp.model import Model
 
+from ...angle_cache import AngleCache
+from ...solve_context import SolveContext
+from ...placement_terms import get_term_arrays, decode_selection
+from ...swap_search import SwapAnnealer
+from ...multilevel import MultilevelSolver
+from ...sample_processing import get_variable_order, postprocess, postprocess_arrays
+from ...anneal_tuning import AnnealTuner
+from ...instrumentation import stage
+
 class QUBO:
-    def __init__(self, graph, rw_graph, bw_centrality):
+    def __init__(self, graph, rw_graph, bw_centrality, stations=4, coefficients=(100, 100, 100), constrained=False):
         self.graph = rw_graph
         self.bw_centrality = bw_centrality
         self.node_dict = graph.node_dict
         self.index_dict = graph.index_dict
-        self.H = self.get_hamiltonian(self.node_dict, self.index_dict, self.bw_centrality, self.graph)
-        self.model = self.H.compile()
+        self.stations = stations
+        self.coefficients = coefficients
+        self.constrained = constrained
+        self.nodes = len(self.node_dict)
 
-        self.qubo, self.offset = self.model.to_qubo()
-        self.bqm = self.model.to_bqm()
+        # inverse of index_dict, the station name of every node index
+        self.names = [None] * self.nodes
+        for name, index in self.index_dict.items():
+            self.names[index] = name
 
-        self.nodes = len(self.node_dict)
+        # in constrained mode the cardinality is kept by the swap annealer, so the dense penalty model is only built
+        # if a penalty solver (neal, QAOA, create_problem) asks for it, see _ensure_compiled
+        self.H = self.model = self.qubo = self.offset = self.bqm = None
+        if not constrained:
+            self.compile()
+
+    def compile(self):
+        """
+        Builds the penalty model A * H_1 + B * H_2 + C * H_3 and sets H, model, qubo, offset and bqm
+        """
+        with stage("qubo.hamiltonian", nodes=self.nodes, edges=self.graph.num_edges()):
+            self.H = self.get_hamiltonian(self.node_dict, self.index_dict, self.bw_centrality, self.graph)
+        with stage("qubo.compile", qubits=self.nodes):
+            self.model = self.H.compile()
+
+        with stage("qubo.to_qubo", qubits=self.nodes) as span:
+            self.qubo, self.offset = self.model.to_qubo()
+            span.set(nnz=len(self.qubo))
+        with stage("qubo.to_bqm") as span:
+            self.bqm = self.model.to_bqm()
+            span.set(qubits=self.bqm.num_variables, interactions=self.bqm.num_interactions)
+
+    def _ensure_compiled(self):
+        # the penalty model of a constrained QUBO is built on its first use
+        if self.bqm is None:
+            self.compile()
 
     def get_hamiltonian(self, node_dict: dict, index_dict: dict, bw_centrality, graph):
         """
@@ -60,19 +96,18 @@ class QUBO:
 
         #####calculate H_1#####
         H_1 = 0
-        weight_max = None
 
-        for edge in graph.edge_list():
+        # here weight (cost) is betweenness centrality of nodes in the edge
+        edges = graph.edge_list()
+        weights = [bw_centrality[edge[0]] + bw_centrality[edge[1]] for edge in edges]
+        weight_max = max(weights, default=0)
 
-            # here weight (cost) is betweenness centrality of nodes in the edge
-            weight = bw_centrality[edge[0]] + bw_centrality[edge[1]]
+        # every edge counts, normalized by the largest weight like get_term_arrays
+        for edge, weight in zip(edges, weights):
+            H_1 += (1-x[edge[0]])*(1-x[edge[1]])*weight
 
-            if weight_max is None or weight > weight_max:
-                weight_max = weight
-
-        H_1 += (1-x[edge[0]])*(1-x[edge[1]])*weight
-
-        H_1 *= 1/weight_max
+        if weight_max > 0:
+            H_1 *= 1/weight_max
 
         #####calculate H_2#####
         H_2 = 0
@@ -85,27 +120,130 @@ class QUBO:
         #####calculate H_3#####
 
         #number of sensors we want to place
-        stations = 4
+        stations = self.stations
         H_3 = (sum(x)-stations)**2
 
         #####Get Hamiltonian function#####
-        A,B,C = 100,100,100 #random coef for now
+        A,B,C = self.coefficients
         H = A*H_1 + B*H_2 + C*H_3
 
         return H
 
-    def get_neal_solution(self):
+    def get_neal_solution(self, seed=None):
         """
         Gets the solution to the problem using neal
+
+        Parameters
+        ----------
+        seed : int or numpy.random.Generator
+            The seed of the annealer
+        """
+        if self.constrained:
+            return self.get_swap_solution(seed=seed)
+
+        solutions = self.get_top_solutions(k=1, seed=seed)
+
+        return solutions[0][0]
+
+    def get_top_solutions(self, k=5, min_distance=2, num_reads=None, polish=True, seed=None, tuner: AnnealTuner = None):
+        """
+        Samples the problem using neal and returns the k best solutions that differ in at least `min_distance` stations.
+        The reads are processed as arrays and only the returned solutions are decoded
+
+        Parameters
+        ----------
+        k : int
+            The number of solutions to return
+        min_distance : int
+            The smallest Hamming distance between two returned solutions
+        num_reads : int
+            The number of annealing reads. If None, the schedule, sweeps and reads are tuned to the problem
+            and the tuning report is kept in self.anneal_report
+        polish : bool
+            Whether to polish every read with 1-flip steepest descent
+        seed : int or numpy.random.Generator
+            The seed of the annealer
+        tuner : AnnealTuner
+            The tuner used when num_reads is None, a default one if None
+
+        Returns
+        -------
+        solutions : list
+            A list of (sample, energy) tuples, lowest energy first
+        """
+        self._ensure_compiled()
+        variables = get_variable_order(self.nodes)
+
+        with stage("qubo.neal", qubits=self.nodes) as span:
+            if num_reads is None:
+                tuner = tuner or AnnealTuner()
+                samples, energies, self.anneal_report = tuner.sample(self.bqm, variables, seed=seed)
+                samples, energies = postprocess_arrays(samples, energies, self.bqm, variables, k, min_distance, polish)
+                span.set(num_reads=self.anneal_report["num_reads"], num_sweeps=self.anneal_report["num_sweeps"])
+            else:
+                context = SolveContext(seed)
+                sa = neal.SimulatedAnnealingSampler()
+                sampleset = sa.sample(self.bqm, num_reads=num_reads, seed=context.child_seed())
+                samples, energies = postprocess(sampleset, self.bqm, variables, k, min_distance, polish)
+                span.set(num_reads=num_reads)
+
+        return [(decode_selection(x), float(energy)) for x, energy in zip(samples, energies)]
+
+    def get_swap_solution(self, num_reads=10, num_sweeps=100, seed=None):
+        """
+        Gets the solution to the problem with exactly `stations` nodes selected, using swap moves only
+
+        Parameters
+        ----------
+        num_reads : int
+            The number of annealing runs
+        num_sweeps : int
+            The number of sweeps per run
+        seed : int or numpy.random.Generator
+            The seed of the annealer
+        """
+        edges, weights, costs = get_term_arrays(self.graph, self.bw_centrality)
+        annealer = SwapAnnealer(edges, weights, costs, self.stations, self.coefficients)
+        samples, energies = annealer.sample(num_reads=num_reads, num_sweeps=num_sweeps, seed=seed)
+
+        return decode_selection(samples[np.argmin(energies)])
+
+    def get_multilevel_solution(self, coarse_nodes=None, seed=None, **options):
         """
-        sa = neal.SimulatedAnnealingSampler()
-        sampleset = sa.sample(self.bqm, num_reads=10)
+        Gets the solution to the problem with exactly `stations` nodes selected by coarsening the graph along its
+        shortest travel times, solving the coarse problem and refining back, see MultilevelSolver
 
-        decoded_samples = self.model.decode_sampleset(sampleset)
+        Parameters
+        ----------
+        coarse_nodes : int
+            The number of nodes the coarsening stops at
+        seed : int or numpy.random.Generator
+            The seed of the annealers
+        options : dict
+            The reads, sweeps and exact_limit of MultilevelSolver.solve
+        """
+        edges, weights, costs = get_term_arrays(self.graph, self.bw_centrality)
+        durations = np.array(self.graph.edges(), dtype=float)
+        solver = MultilevelSolver(edges, weights, costs, durations, self.stations, self.coefficients, coarse_nodes)
+        x, _ = solver.solve(seed=seed, **options)
+
+        return decode_selection(x)
+
+    def get_selected_stations(self, solution):
+        """
+        Decodes a solution into the names of the placed stations
 
-        best_sample = min(decoded_samples, key=lambda x: x.energy)
+        Parameters
+        ----------
+        solution : dict
+            A dictionary with "x[i]" as key and 0 or 1 as value
 
-        return best_sample.sample
+        Returns
+        -------
+        stations : list
+            The names of the placed stations, in node index order
+        """
+        return [self.names[i] for i in range(self.nodes) if solution["x[%d]" % i] == 1]
 
     def save_solution_to_json(self, coordinates, solution, file_path):
         """
@@ -113,30 +251,22 @@ class QUBO:
 
         Parameters
         ----------
+        coordinates : dict
+            A dictionary with the name of the station as key and a tuple of latitude and longitude as value
         solution : dict
-            A dictionary of solutions with the name of the city as key and a tuple of latitude and longitude as value
+            A dictionary with "x[i]" as key and 0 or 1 as value
         file_path : str
             The path to the json file
         """
-        # extract the node information from the best sample
-        selected_nodes = []
-        index = 0
-        for key, value in solution.items():
-            if value == 1:
-                selected_nodes.append(index)
-            index += 1
-
-        # extracting the name and coordinates of the selected nodes into a dictionary then to a json file
         selected_nodes_dic = {"depots": []}
-        for i in selected_nodes:
-            for key, value in self.index_dict.items():
-                if value == i:
-                    selected_nodes_dic["depots"].append({"lat": coordinates[key][0], "lon": coordinates[key][1]})
+        for name in self.get_selected_stations(solution):
+            selected_nodes_dic["depots"].append({"lat": coordinates[name][0], "lon": coordinates[name][1]})
 
         with open(file_path, 'w') as fp:
             json.dump(selected_nodes_dic, fp)
     
     def create_problem(self) -> QuadraticProgram:
+        self._ensure_compiled()
         result = []
         mdl = Model()
 
@@ -160,16 +290,43 @@ class QUBO:
 
         return qp
     
-    def run_qaoa(self, qubo: QuadraticProgram):
-        algorithm_globals.random_seed = 10598
-        qaoa_mes = QAOA(sampler=Sampler(), optimizer=COBYLA(), initial_point=[0.0, 0.0])
-        result = MinimumEigenOptimizer(qaoa_mes).solve(qubo)
+    def run_qaoa(self, qubo: QuadraticProgram, reps: int = 1, angle_cache: AngleCache = None, seed=10598):
+        """
+        Solves the problem with QAOA
+
+        Parameters
+        ----------
+        qubo : QuadraticProgram
+            The problem to solve
+        reps : int
+            The QAOA depth
+        angle_cache : AngleCache
+            If given, the run starts from the nearest cached angles and its optimized angles are added to the cache
+        seed : int or numpy.random.Generator
+            The seed of the sampler
+        """
+        self._ensure_compiled()
+        context = SolveContext(seed)
+        if angle_cache is None:
+            initial_point = [0.0] * 2 * reps
+        else:
+            initial_point = angle_cache.initial_point(qubo, reps)
+
+        qaoa_mes = QAOA(sampler=context.sampler(), optimizer=COBYLA(), reps=reps, initial_point=initial_point)
+        with stage("qubo.qaoa", qubits=qubo.get_num_vars(), reps=reps) as span:
+            result = MinimumEigenOptimizer(qaoa_mes).solve(qubo)
+            span.set(evals=result.min_eigen_solver_result.cost_function_evals)
+
+        if angle_cache is not None:
+            eigen_result = result.min_eigen_solver_result
+            angle_cache.store(qubo, reps, eigen_result.optimal_point, eigen_result.cost_function_evals)
 
         return result
     
     def run_exact(self, qubo: QuadraticProgram):
-        algorithm_globals.random_seed = 10598
+        # the exact eigensolver is deterministic and needs no seed
         exact_mes = NumPyMinimumEigensolver()
-        result = MinimumEigenOptimizer(exact_mes).solve(qubo)
+        with stage("qubo.exact", qubits=qubo.get_num_vars()):
+            result = MinimumEigenOptimizer(exact_mes).solve(qubo)
 
         return result
\ No newline at end of file
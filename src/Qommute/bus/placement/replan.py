@@ -0,0 +1,160 @@
+import math
+
+import numpy as np
+import neal
+
+from ...solve_context import SolveContext
+from ...placement_terms import decode_selection
+from ...sample_processing import get_variable_order, bqm_to_arrays, sampleset_to_arrays, postprocess_arrays
+from ...anneal_tuning import AnnealTuner
+
+
+class IncrementalPlanner:
+    def __init__(self, qubo, features: dict, placement: dict = None, cost_weights=(5, 3, 0.3), stations=None, seed=None):
+        """
+        Keeps a compiled placement problem in memory and re-plans it when station inputs change.
+        Only the linear H_2 terms of the affected stations are patched: H_1 depends on the travel times
+        and their betweenness centrality alone, so ridership and delay changes leave it untouched
+
+        Parameters
+        ----------
+        qubo : QUBO
+            The compiled placement problem, in penalty mode
+        features : dict
+            The raw station inputs before normalization, {"f": population, "g": metro distance, "h": delay},
+            each a dictionary with the name of the station as key
+        placement : dict
+            The deployed solution, as returned by QUBO.get_neal_solution. Solved once if None
+        cost_weights : tuple
+            The weights C, D, E of the node cost c = Cf + Dg + Eh, as given to Graph
+        stations : iterable
+            The names of the stations the inputs were normalized over when the graph was built, the selected
+            candidates of the pipeline, which can be more than the graph's nodes. Every station in features if None
+        seed : int or numpy.random.Generator
+            The seed of the first solve when no placement is given
+        """
+        self.qubo = qubo
+        # the planner patches the penalty model in place, which a constrained QUBO has not built yet
+        if qubo.bqm is None:
+            qubo.compile()
+        self.variables = get_variable_order(qubo.nodes)
+        self.weights = dict(zip("fgh", cost_weights))
+
+        self.names = qubo.names
+
+        # the raw inputs of every station of the normalization, which sets the range the graph's costs were scaled by
+        stations = set(stations) if stations is not None else None
+        self.features = {key: {name: float(value) for name, value in features[key].items()
+                               if stations is None or name in stations} for key in "fgh"}
+
+        # the deployed costs are the graph's own, every change is applied against them
+        self.costs = np.array([qubo.graph[i]["c"] for i in range(qubo.nodes)], dtype=float)
+
+        if placement is None:
+            placement = qubo.get_neal_solution(seed=seed)
+        self.placement = np.array([placement[v] for v in self.variables], dtype=np.int8)
+
+    def get_costs(self):
+        """
+        Returns the node cost of every node from the current raw inputs, each normalized over the stations of the
+        normalization like GetterFunctions.normalize
+        """
+        costs = np.zeros(len(self.names))
+        for key, values in self.features.items():
+            low, high = min(values.values()), max(values.values())
+            node_values = np.array([values[name] for name in self.names], dtype=float)
+            if high > low:
+                costs += self.weights[key] * (node_values - low) / (high - low)
+        return costs
+
+    def update(self, changes: dict):
+        """
+        Applies changed station inputs to the problem
+
+        Parameters
+        ----------
+        changes : dict
+            The new raw inputs, e.g. {"h": {"Jamaica": 12}}. A station of the normalization that is not a node only
+            moves the range of its input, stations outside the normalization are ignored
+
+        Returns
+        -------
+        affected : list
+            The names of the stations whose H_2 term changed
+        """
+        for key, values in changes.items():
+            for name, value in values.items():
+                if name in self.features[key]:
+                    self.features[key][name] = float(value)
+
+        # a change of the smallest or largest input renormalizes every station, which the vector difference picks up
+        costs = self.get_costs()
+        delta = costs - self.costs
+        affected = np.flatnonzero(np.abs(delta) > 1e-12)
+
+        B = self.qubo.coefficients[1]
+        for i in affected:
+            variable = self.variables[i]
+            self.qubo.bqm.add_linear(variable, B * delta[i])
+            self.qubo.qubo[(variable, variable)] = self.qubo.qubo.get((variable, variable), 0.0) + B * delta[i]
+            self.qubo.graph[i]["c"] += delta[i]
+
+        self.costs = costs
+
+        return [self.names[i] for i in affected]
+
+    def replan(self, changes: dict, num_reads=16, num_sweeps=256, seed=None):
+        """
+        Applies changed station inputs and re-solves, starting the annealer from the deployed placement
+
+        Parameters
+        ----------
+        changes : dict
+            The new raw inputs, e.g. {"f": {"Jamaica": 1830.0}, "h": {"Bensonhurst": 7}}
+        num_reads : int
+            The number of annealing reads
+        num_sweeps : int
+            The number of sweeps per read
+        seed : int or numpy.random.Generator
+            The seed of the annealer
+
+        Returns
+        -------
+        result : dict
+            The new solution and its energy, the stations added to and removed from the deployed placement,
+            and the stations whose inputs changed the problem
+        """
+        affected = self.update(changes)
+
+        context = SolveContext(seed)
+        bqm = self.qubo.bqm
+        linear, coupling, _ = bqm_to_arrays(bqm, self.variables)
+
+        # start half way down the schedule so the anneal refines the deployed placement instead of forgetting it
+        hot, cold = AnnealTuner().beta_range(linear, coupling)
+        beta_range = (math.sqrt(hot * cold), cold)
+
+        sa = neal.SimulatedAnnealingSampler()
+        sampleset = sa.sample(bqm, num_reads=num_reads, num_sweeps=num_sweeps, beta_range=beta_range,
+                              initial_states=(self.placement[None, :], self.variables),
+                              initial_states_generator="tile", seed=context.child_seed())
+
+        # the deployed placement itself stays a candidate
+        samples, energies = sampleset_to_arrays(sampleset, self.variables)
+        samples = np.vstack((samples, self.placement))
+        energies = np.append(energies, bqm.energy(dict(zip(self.variables, self.placement.tolist()))))
+
+        best, energy = postprocess_arrays(samples, energies, bqm, self.variables, k=1)
+        best = best[0]
+
+        added = [self.names[i] for i in np.flatnonzero((best == 1) & (self.placement == 0))]
+        removed = [self.names[i] for i in np.flatnonzero((best == 0) & (self.placement == 1))]
+        self.placement = best
+
+        return {
+            "solution": decode_selection(best),
+            "energy": float(energy[0]),
+            "added": added,
+            "removed": removed,
+            "affected": affected,
+        }
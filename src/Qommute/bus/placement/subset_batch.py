@@ -0,0 +1,236 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rustworkx
+import dimod
+import neal
+
+from ...solve_context import SolveContext
+from ...placement_terms import get_qubo_matrix
+from ...swap_search import SwapAnnealer
+
+# the evaluator of a pool worker, set once per process by _init_worker
+_WORKER_EVALUATOR = None
+
+
+def _init_worker(evaluator):
+    global _WORKER_EVALUATOR
+    _WORKER_EVALUATOR = evaluator
+
+
+def _solve_in_worker(task):
+    indices, seed = task
+    return _WORKER_EVALUATOR.solve_subset(indices, seed=seed)
+
+
+class SubsetEvaluator:
+    def __init__(self, getter, start=1, end=20, lat=40.76903, lon=-73.969649, cost_weights=(5, 3, 0.3),
+                 max_duration=25, stations=4, coefficients=(100, 100, 100), solver="swap"):
+        """
+        Precomputes the city-wide station features and travel time matrix once, so that many random subsets
+        of stations can be placed by slicing them instead of rerunning the whole pipeline
+
+        Parameters
+        ----------
+        getter : GetterFunctions
+            The loaded data, its coordinates and station distances are used for every station
+        start : int
+            The start distance from the center of the map, as in get_selected_locations
+        end : int
+            The end distance from the center of the map, as in get_selected_locations
+        lat : float
+            The latitude of the center of the map
+        lon : float
+            The longitude of the center of the map
+        cost_weights : tuple
+            The weights C, D, E of the node cost c = Cf + Dg + Eh
+        max_duration : float
+            The longest travel time in minutes that still makes an edge
+        stations : int
+            The number of stations to place in every subset
+        coefficients : tuple
+            The coefficients A, B, C of the Hamiltonian
+        solver : str
+            "swap" for the cardinality-preserving annealer, "neal" for the penalty QUBO
+        """
+        self.cost_weights = np.array(cost_weights, dtype=float)
+        self.max_duration = max_duration
+        self.stations = stations
+        self.coefficients = coefficients
+        self.solver = solver
+
+        # the candidate stations, the same ring get_selected_locations samples from
+        candidates = {}
+        for name, (station_lat, station_lon) in getter.coordinates.items():
+            distance = (station_lat - lat)**2 + (station_lon - lon)**2
+            if start / 100 <= distance <= end / 100:
+                candidates[name] = distance
+
+        self.names = list(candidates)
+        self.ring_distance = np.array([candidates[name] for name in self.names])
+        position = {name: index for index, name in enumerate(self.names)}
+
+        # raw features, NaN where a station has no data, in which case the pipeline drops it
+        everything = dict(getter.coordinates)
+        sources = [
+            getter.get_no_of_people_at_station(everything),
+            getter.get_distance_from_farthest_metro(everything),
+            getter.get_delay_from_nearest_station(everything),
+        ]
+        self.features = np.array([[source.get(name, np.nan) for source in sources] for name in self.names], dtype=float)
+
+        self.durations = np.full((len(self.names), len(self.names)), np.inf)
+        for (start_name, end_name), duration in getter.station_distances.items():
+            if start_name in position and end_name in position:
+                self.durations[position[start_name], position[end_name]] = duration
+
+    def sample_subsets(self, num_subsets, n=20, stratified=False, strata=4, seed=None):
+        """
+        Draws random subsets of candidate stations
+
+        Parameters
+        ----------
+        num_subsets : int
+            The number of subsets
+        n : int
+            The number of stations in every subset
+        stratified : bool
+            If True, every subset takes from each ring around the center in proportion to the ring's size
+        strata : int
+            The number of rings
+        seed : int or numpy.random.Generator
+            The seed of the draw
+
+        Returns
+        -------
+        subsets : list
+            A list of arrays of candidate indices
+        """
+        rng = SolveContext(seed).rng
+
+        if not stratified:
+            return [rng.choice(len(self.names), n, replace=False) for _ in range(num_subsets)]
+
+        edges = np.quantile(self.ring_distance, np.linspace(0, 1, strata + 1))
+        rings = np.clip(np.searchsorted(edges, self.ring_distance, side="right") - 1, 0, strata - 1)
+        members = [np.flatnonzero(rings == ring) for ring in range(strata)]
+
+        # largest remainder apportionment of the n stations over the rings
+        shares = n * np.array([len(m) for m in members]) / len(self.names)
+        counts = np.floor(shares).astype(int)
+        counts[np.argsort(counts - shares)[:n - counts.sum()]] += 1
+
+        return [np.concatenate([rng.choice(m, c, replace=False) for m, c in zip(members, counts)])
+                for _ in range(num_subsets)]
+
+    def usable(self, indices):
+        """
+        Returns the indices of a subset whose features are all known, the stations that can reach its problem
+        """
+        indices = np.asarray(indices)
+        return indices[~np.isnan(self.features[indices]).any(axis=1)]
+
+    def solve_subset(self, indices, num_reads=10, num_sweeps=100, seed=None):
+        """
+        Places stations within one subset, using submatrices of the precomputed data
+
+        Parameters
+        ----------
+        indices : numpy.ndarray
+            The candidate indices of the subset
+        num_reads : int
+            The number of annealing reads
+        num_sweeps : int
+            The number of sweeps per read
+        seed : int or numpy.random.Generator
+            The seed of the annealer
+
+        Returns
+        -------
+        selected : numpy.ndarray
+            The candidate indices of the placed stations
+        """
+        indices = self.usable(indices)
+        if len(indices) <= self.stations:
+            return indices
+
+        # normalize within the subset, like the pipeline does for its selection
+        features = self.features[indices]
+        spread = features.max(axis=0) - features.min(axis=0)
+        spread[spread == 0] = 1.0
+        costs = ((features - features.min(axis=0)) / spread) @ self.cost_weights
+
+        durations = self.durations[np.ix_(indices, indices)]
+        rows, cols = np.nonzero(durations <= self.max_duration)
+        keep = rows != cols
+        edges = np.column_stack((rows[keep], cols[keep]))
+
+        graph = rustworkx.PyGraph()
+        graph.add_nodes_from(range(len(indices)))
+        graph.add_edges_from_no_data([tuple(edge) for edge in edges.tolist()])
+        bw_centrality = rustworkx.betweenness_centrality(graph)
+        centrality = np.array([bw_centrality[i] for i in range(len(indices))])
+
+        weights = centrality[edges[:, 0]] + centrality[edges[:, 1]]
+        if len(weights) and weights.max() > 0:
+            weights = weights / weights.max()
+
+        context = SolveContext(seed)
+        if self.solver == "swap":
+            annealer = SwapAnnealer(edges, weights, costs, self.stations, self.coefficients)
+            samples, energies = annealer.sample(num_reads=num_reads, num_sweeps=num_sweeps, seed=context.rng)
+        else:
+            Q, offset = get_qubo_matrix(edges, weights, costs, self.stations, self.coefficients)
+            bqm = dimod.BinaryQuadraticModel(Q, "BINARY")
+            sampleset = neal.SimulatedAnnealingSampler().sample(bqm, num_reads=num_reads, num_sweeps=num_sweeps,
+                                                                seed=context.child_seed())
+            samples = sampleset.record.sample[:, [sampleset.variables.index(i) for i in range(len(indices))]]
+            energies = sampleset.record.energy
+
+        return indices[samples[np.argmin(energies)] == 1]
+
+    def run(self, num_subsets=200, n=20, stratified=False, processes=None, seed=None):
+        """
+        Places stations in many random subsets on a process pool and counts how often every station is picked
+
+        Parameters
+        ----------
+        num_subsets : int
+            The number of subsets
+        n : int
+            The number of stations in every subset
+        stratified : bool
+            Whether to draw stratified subsets
+        processes : int
+            The number of worker processes, the number of CPUs if None. 0 solves in this process
+        seed : int or numpy.random.Generator
+            The seed of the draw and of every solve
+
+        Returns
+        -------
+        frequencies : dict
+            For every candidate station, how often it was sampled into a problem, how often it was placed and the
+            ratio of the two
+        """
+        context = SolveContext(seed)
+        subsets = self.sample_subsets(num_subsets, n, stratified, seed=context.rng)
+        tasks = [(subset, context.child_seed()) for subset in subsets]
+
+        if processes == 0:
+            results = [self.solve_subset(indices, seed=task_seed) for indices, task_seed in tasks]
+        else:
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(self,)) as pool:
+                results = list(pool.map(_solve_in_worker, tasks, chunksize=max(1, len(tasks) // 64)))
+
+        sampled = np.zeros(len(self.names), dtype=int)
+        selected = np.zeros(len(self.names), dtype=int)
+        for subset, chosen in zip(subsets, results):
+            # a station without all of its features never reaches the problem, so it does not count as sampled
+            np.add.at(sampled, self.usable(subset), 1)
+            np.add.at(selected, chosen, 1)
+
+        return {
+            name: {"sampled": int(sampled[i]), "selected": int(selected[i]),
+                   "frequency": selected[i] / sampled[i] if sampled[i] else 0.0}
+            for i, name in enumerate(self.names)
+        }
@@ -1 +1 @@
-from bus_routing import QuantumOptimizer, BusRoutingInstance, visualize_solution
\ No newline at end of file
+from .bus_routing import QuantumOptimizer, BusRoutingInstance, visualize_solution
\ No newline at end of file
@@ -1,17 +1,18 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 import json
 
-from qiskit.utils import algorithm_globals
 from qiskit.algorithms.minimum_eigensolvers import SamplingVQE
-from qiskit.algorithms.optimizers import SPSA
 from qiskit.circuit.library import RealAmplitudes
-from qiskit.primitives import Sampler
 
 from qiskit_optimization import QuadraticProgram
 from qiskit_optimization.algorithms import MinimumEigenOptimizer
 
+from ...angle_cache import AngleCache
+from ...solve_context import SolveContext
+from ...instrumentation import stage
+from ...rendering import decode_routes, render_routes
+
 # Received from the Qiskit Vehicle Routing tutorial: https://qiskit.org/ecosystem/optimization/tutorials/07_examples_vehicle_routing.html
 class QuantumOptimizer:
     def __init__(self, instance, n, K):
@@ -92,53 +93,63 @@ class QuantumOptimizer:
         qp.objective.constant = c
         return qp
 
-    def solve_problem(self, qp):
-        algorithm_globals.random_seed = 10598
-        vqe = SamplingVQE(sampler=Sampler(), optimizer=SPSA(), ansatz=RealAmplitudes())
+    def solve_problem(self, qp, angle_cache: AngleCache = None, seed=10598):
+        context = SolveContext(seed)
+        ansatz = RealAmplitudes(qp.get_num_vars())
+
+        # seed the ansatz from a cached run with the same number of parameters if there is one
+        initial_point = None
+        if angle_cache is not None:
+            initial_point = angle_cache.lookup(qp, ansatz.reps, num_parameters=ansatz.num_parameters)
+        if initial_point is None:
+            initial_point = context.initial_point(ansatz)
+
+        # the starting point, the SPSA perturbations and the shots all come from the context, no global state is read
+        vqe = SamplingVQE(sampler=context.sampler(), optimizer=context.spsa(), ansatz=ansatz, initial_point=initial_point)
         optimizer = MinimumEigenOptimizer(min_eigen_solver=vqe)
-        result = optimizer.solve(qp)
+
+        with stage("routing.vqe", qubits=qp.get_num_vars(), parameters=ansatz.num_parameters) as span:
+            result = optimizer.solve(qp)
+            span.set(evals=result.min_eigen_solver_result.cost_function_evals)
+
+        if angle_cache is not None:
+            eigen_result = result.min_eigen_solver_result
+            angle_cache.store(qp, ansatz.reps, eigen_result.optimal_point, eigen_result.cost_function_evals)
+
         # compute cost of the obtained result
         _, _, _, level = self.binary_representation(x_sol=result.x)
         return result.x, level
     
 # Visualize the solution
-def visualize_solution(xc, yc, x, C, n, K, title_str):
-    # Put the solution in a way that is compatible with the classical variables
-    x_quantum = np.zeros(n**2)
-    kk = 0
-    for ii in range(n**2):
-        if ii // n != ii % n:
-            x_quantum[ii] = x[kk]
-            kk += 1
-
-    plt.figure()
-    plt.scatter(xc, yc, s=200)
-    for i in range(len(xc)):
-        plt.annotate(i, (xc[i] + 0.015, yc[i]), size=16, color="r")
-    plt.plot(xc[0], yc[0], "r*", ms=20)
-
-    plt.grid()
-
-    for ii in range(0, n**2):
-
-        if x_quantum[ii] > 0:
-            ix = ii // n
-            iy = ii % n
-            plt.arrow(
-                xc[ix],
-                yc[ix],
-                xc[iy] - xc[ix],
-                yc[iy] - yc[ix],
-                length_includes_head=True,
-                head_width=0.03,
-            )
-
-    plt.title(title_str + " cost = " + str(int(C * 100) / 100.0))
-
-    # save the visualization into a file
-    plt.savefig('./bus_routing.png')
-
-    plt.show()
+def visualize_solution(xc, yc, x, C, n, K, title_str, file_path='./bus_routing.png'):
+    """
+    Draws the routes of a solution and saves them into a file, without a display and without blocking
+
+    Parameters
+    ----------
+    xc, yc : numpy.ndarray
+        The coordinates of the nodes, the depot first
+    x : numpy.ndarray
+        The routing variables of every ordered pair of distinct nodes
+    C : float
+        The cost of the solution
+    n : int
+        The number of nodes
+    K : int
+        The number of vehicles
+    title_str : str
+        The start of the title
+    file_path : str
+        The png file to write
+
+    Returns
+    -------
+    figure : matplotlib.figure.Figure
+        The figure, e.g. to show it in a notebook
+    """
+    edges = decode_routes(x, n)
+    return render_routes(np.column_stack((xc, yc)), edges, depot=0, file_path=file_path,
+                         title=title_str + " cost = " + str(int(C * 100) / 100.0))
 
 class BusRoutingInstance:
     def __init__(self, n):
@@ -146,26 +157,20 @@ class BusRoutingInstance:
 
     def generate_instance(self, depot_locations):
 
-        n = self.n
-
-        # np.random.seed(33)
-        np.random.seed(1543)
+        # the depots as written by save_solution_to_json, older files spell the longitude "lng"
+        coordinates = np.array([[depot["lat"], depot.get("lon", depot.get("lng"))] for depot in depot_locations[:self.n]])
 
-        # Generate the coordinates of the depots
-        xc = np.zeros(n)
-        yc = np.zeros(n)
+        return self.generate_instance_from_coordinates(coordinates)
 
-        for ii in range(0, n):
-            xc[ii] = depot_locations[ii]["lat"] * 10 # multiply by 10 to get a better visualization
-            yc[ii] = depot_locations[ii]["lng"] * 10 # multiply by 10 to get a better visualization
+    def generate_instance_from_coordinates(self, coordinates):
+        """
+        Builds the instance straight from an (n, 2) array of latitudes and longitudes, without any json file in between
+        """
+        coordinates = np.asarray(coordinates, dtype=float)[:self.n] * 10 # multiply by 10 to get a better visualization
+        xc = coordinates[:, 0]
+        yc = coordinates[:, 1]
 
-        instance = np.zeros([n, n])
-        for ii in range(0, n):
-            for jj in range(ii + 1, n):
-                instance[ii, jj] = (xc[ii] - xc[jj]) ** 2 + (yc[ii] - yc[jj]) ** 2 # Euclidean distance
-                instance[jj, ii] = instance[ii, jj]
+        # squared Euclidean distance between every pair of depots
+        instance = (xc[:, None] - xc[None, :]) ** 2 + (yc[:, None] - yc[None, :]) ** 2
 
         return xc, yc, instance
-
-
-
@@ -1,6 +1,11 @@
 import json
+import os
 
-from bus_routing import QuantumOptimizer, BusRoutingInstance, visualize_solution
+from .bus_routing import QuantumOptimizer, BusRoutingInstance, visualize_solution
+from .incremental import IncrementalRouter, depot_changes
+
+# the depot file shipped next to this module
+DEPOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bus_depot_locations.json")
 
 # get the location of the depots from a JSON file
 def get_depots(file_name, no_of_depots=2):
@@ -9,34 +14,40 @@ def get_depots(file_name, no_of_depots=2):
         depots = data["depots"]
         return depots[:no_of_depots]
 
-depot_locations = get_depots("./bus_depot_locations.json", no_of_depots=3) # depot locations refer to where the buses visit to pick up passengers
+def main(file_name=DEPOT_FILE, no_of_depots=3, K=2):
+    depot_locations = get_depots(file_name, no_of_depots=no_of_depots) # depot locations refer to where the buses visit to pick up passengers
+
+    # defining the parameters of the problem
+    n = len(depot_locations) # number of depots
+    # K is the number of buses
 
-# defining the parameters of the problem
-n = len(depot_locations) # number of depots
-K = 2 # number of buses
+    init = BusRoutingInstance(n)
+    xcoor, ycoor, instance = init.generate_instance(depot_locations)
 
-init = BusRoutingInstance(n)
-xcoor, ycoor, instance = init.generate_instance(depot_locations)
+    # Instantiate the quantum optimizer class with parameters:
+    optim = QuantumOptimizer(instance, n, K)
 
-# Instantiate the quantum optimizer class with parameters:
-optim = QuantumOptimizer(instance, n, K)
+    # Get the binary representation of the problem
+    Q, g, c, binary_cost = optim.binary_representation()
 
-# Get the binary representation of the problem
-Q, g, c, binary_cost = optim.binary_representation()
+    # Construct the problem
+    qp = optim.construct_problem(Q, g, c, n)
 
-# Construct the problem
-qp = optim.construct_problem(Q, g, c, n)
+    # Solve the problem
+    x, cost = optim.solve_problem(qp)
 
-# Solve the problem
-x, cost = optim.solve_problem(qp)
+    # Print the solution
+    print("Quantum Solution: ", x)
+    print("Quantum Solution Cost: ", cost)
 
-# Visualize the solution
-visualize_solution(xcoor, ycoor, x, cost, n, K, "Quantum Solution")
+    # Visualize the solution, which also saves it into a file
+    visualize_solution(xcoor, ycoor, x, cost, n, K, "Quantum Solution")
 
-# Print the solution
-print("Quantum Solution: ", x)
-print("Quantum Solution Cost: ", cost)
+# update the routes of a router after the depot file changed, instead of solving them again from scratch.
+# no_of_depots must be the one the routes were solved for, so that the depots beyond it are not taken as added
+def update_routes(router: IncrementalRouter, old_depots, file_name=DEPOT_FILE, no_of_depots=3):
+    new_depots = get_depots(file_name, no_of_depots=no_of_depots)
+    return router.apply(depot_changes(old_depots, new_depots)), new_depots
 
-# save the visualization into a file
-import matplotlib.pyplot as plt
-plt.savefig('./bus_routing.png')
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import time
+
+import numpy as np
+
+from .bus_routing import QuantumOptimizer, BusRoutingInstance
+from ...instrumentation import stage
+from ...rendering import decode_routes, decode_tours
+
+
+def encode_routes(tours, n):
+    """
+    Encodes tours into the routing variables x_ij of every ordered pair i != j, the inverse of decode_routes
+
+    Parameters
+    ----------
+    tours : list
+        Lists of nodes from the depot back to it
+    n : int
+        The number of nodes
+
+    Returns
+    -------
+    x : numpy.ndarray
+        The n * (n - 1) binary variables in row-major order without the diagonal
+    """
+    x = np.zeros(n * (n - 1))
+    for tour in tours:
+        for i, j in zip(tour[:-1], tour[1:]):
+            x[i * (n - 1) + j - (j > i)] = 1
+    return x
+
+
+def tour_cost(instance, tour):
+    """
+    Returns the length of a tour in the units of the routing instance
+    """
+    tour = np.asarray(tour, dtype=np.int64)
+    return float(instance[tour[:-1], tour[1:]].sum())
+
+
+def insertion_costs(instance, tour, node):
+    """
+    Returns the added length of inserting node after every position of a tour but the last
+    """
+    tour = np.asarray(tour, dtype=np.int64)
+    before, after = tour[:-1], tour[1:]
+    return instance[before, node] + instance[node, after] - instance[before, after]
+
+
+def cheapest_insertion(instance, tours, node):
+    """
+    Finds where a node adds the least length to a set of tours
+
+    Returns
+    -------
+    tour : int
+        The index of the tour
+    position : int
+        The index the node takes in that tour
+    cost : float
+        The added length
+    """
+    best = (None, None, np.inf)
+    for t, tour in enumerate(tours):
+        costs = insertion_costs(instance, tour, node)
+        i = int(np.argmin(costs))
+        if costs[i] < best[2]:
+            best = (t, i + 1, float(costs[i]))
+    return best
+
+
+def improve_tour(instance, tour, eps=1e-12):
+    """
+    Shortens a single tour with 2-opt and relocate moves until neither finds an improvement, keeping its depot ends
+
+    Parameters
+    ----------
+    instance : numpy.ndarray
+        The (n, n) distances of the routing instance
+    tour : list
+        The nodes from the depot back to it
+
+    Returns
+    -------
+    tour : list
+        The improved tour
+    """
+    route = list(tour)
+    improved = True
+    while improved:
+        improved = False
+
+        # 2-opt, reversing route[i:j + 1] replaces the edges (i - 1, i) and (j, j + 1)
+        for i in range(1, len(route) - 2):
+            a, b = route[i - 1], route[i]
+            c = np.asarray(route[i + 1:-1])
+            d = np.asarray(route[i + 2:])
+            gains = instance[a, c] + instance[b, d] - instance[a, b] - instance[c, d]
+            j = int(np.argmin(gains))
+            if gains[j] < -eps:
+                route[i:i + j + 2] = route[i:i + j + 2][::-1]
+                improved = True
+                break
+        if improved:
+            continue
+
+        # relocate, one node moved to the cheapest other position of the same tour
+        for i in range(1, len(route) - 1):
+            p, v, q = route[i - 1], route[i], route[i + 1]
+            saving = instance[p, v] + instance[v, q] - instance[p, q]
+            rest = route[:i] + route[i + 1:]
+            costs = insertion_costs(instance, rest, v)
+            j = int(np.argmin(costs))
+            if costs[j] < saving - eps:
+                rest.insert(j + 1, v)
+                route = rest
+                improved = True
+                break
+
+    return route
+
+
+def construct_tours(instance, buses):
+    """
+    Builds tours from scratch, every bus starting at one of the stops farthest from the depot and every other stop
+    inserted where it adds the least length, the farthest first, each tour improved afterwards
+
+    Parameters
+    ----------
+    instance : numpy.ndarray
+        The (n, n) distances of the routing instance, node 0 being the depot
+    buses : int
+        The number of tours
+
+    Returns
+    -------
+    tours : list
+        One list of nodes per bus, from the depot back to it
+    """
+    order = 1 + np.argsort(-instance[0, 1:], kind="stable")
+    tours = [[0, int(node), 0] for node in order[:buses]]
+    for node in order[buses:]:
+        t, position, _ = cheapest_insertion(instance, tours, int(node))
+        tours[t].insert(position, int(node))
+    return [improve_tour(instance, tour) for tour in tours]
+
+
+def is_feasible(tours, n, buses):
+    """
+    Checks that there are `buses` closed tours from the depot that visit every other node exactly once
+    """
+    if len(tours) != buses or any(len(tour) < 3 or tour[0] != 0 or tour[-1] != 0 for tour in tours):
+        return False
+    stops = sorted(node for tour in tours for node in tour[1:-1])
+    return stops == list(range(1, n))
+
+
+def solve_full(coordinates, buses, seed=10598):
+    """
+    Solves the routing QUBO of the given stations from scratch with the VQE, as get_bus_route does
+
+    Returns
+    -------
+    tours : list
+        The tours the solution decodes into, which need not be feasible
+    """
+    n = len(coordinates)
+    _, _, instance = BusRoutingInstance(n).generate_instance_from_coordinates(coordinates)
+    optim = QuantumOptimizer(instance, n, buses)
+    Q, g, c, _ = optim.binary_representation()
+    x, _ = optim.solve_problem(optim.construct_problem(Q, g, c, n), seed=seed)
+    return decode_tours(decode_routes(x, n), n)
+
+
+def _key(depot):
+    # depots are matched by position, older files spell the longitude "lng"
+    return round(depot["lat"], 6), round(depot.get("lon", depot.get("lng")), 6)
+
+
+def depot_changes(old_depots, new_depots):
+    """
+    Compares two versions of the depot list, as get_depots reads them
+
+    Returns
+    -------
+    changes : dict
+        "remove", the indices of the old depots that are gone, and "add", the (lat, lon) of the new ones in order
+    """
+    new_keys = {_key(depot) for depot in new_depots}
+    old_keys = {_key(depot) for depot in old_depots}
+    return {
+        "remove": [i for i, depot in enumerate(old_depots) if _key(depot) not in new_keys],
+        "add": [list(_key(depot)) for depot in new_depots if _key(depot) not in old_keys],
+    }
+
+
+class IncrementalRouter:
+    def __init__(self, coordinates, tours, buses, tolerance=0.1, solver=solve_full, seed=10598):
+        """
+        Keeps bus routes up to date as stations are added and removed, without solving the routing problem again
+
+        A new station goes where it adds the least length and a removed one is cut out of its tour, then only the
+        tours that changed are improved with 2-opt and relocate moves, so the other buses keep their tours. The
+        routes are solved from scratch when the change cannot be made locally, e.g. the depot is removed or a bus
+        loses its last stop and no new station takes its place, or when they grow longer than (1 + tolerance) times
+        tours built from scratch by construct_tours
+
+        Parameters
+        ----------
+        coordinates : numpy.ndarray
+            An (n, 2) array of the latitudes and longitudes of the stations, the first one is the depot
+        tours : list
+            One list of station indices per bus, from the depot back to it, see decode_tours
+        buses : int
+            The number of buses K
+        tolerance : float
+            The share by which the routes may be longer than the reference before they are solved from scratch
+        solver : callable
+            Called as solver(coordinates, buses, seed) for a full solve, returns tours, see solve_full
+        seed : int
+            The seed of the full solves
+        """
+        self.coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        self.tours = [list(map(int, tour)) for tour in tours]
+        self.buses = buses
+        self.tolerance = tolerance
+        self.solver = solver
+        self.seed = seed
+        self.instance = self.make_instance(self.coordinates)
+
+        if not is_feasible(self.tours, len(self.coordinates), buses):
+            raise ValueError("the tours must be %d closed tours from the depot visiting every station once" % buses)
+
+    @classmethod
+    def from_solution(cls, coordinates, x, buses, **kwargs):
+        """
+        Starts from the binary solution of the routing QUBO, as QuantumOptimizer.solve_problem returns it
+        """
+        n = len(coordinates)
+        return cls(coordinates, decode_tours(decode_routes(x, n), n), buses, **kwargs)
+
+    @staticmethod
+    def make_instance(coordinates):
+        _, _, instance = BusRoutingInstance(len(coordinates)).generate_instance_from_coordinates(coordinates)
+        return instance
+
+    @property
+    def cost(self):
+        return sum(tour_cost(self.instance, tour) for tour in self.tours)
+
+    @property
+    def x(self):
+        return encode_routes(self.tours, len(self.coordinates))
+
+    def apply(self, changes):
+        """
+        Removes and adds stations and updates the routes
+
+        Parameters
+        ----------
+        changes : dict
+            "remove", the indices of the stations to remove, and "add", the (lat, lon) of the stations to add, see
+            depot_changes. Added stations are appended after the remaining ones, which keep their order
+
+        Returns
+        -------
+        result : dict
+            The tours, their cost and binary solution, the indices of the tours that changed, whether the routes were
+            solved from scratch, the reference cost and the update time
+        """
+        start = time.perf_counter()
+        removed = sorted(set(int(i) for i in changes.get("remove", [])))
+        added = np.asarray(changes.get("add", []), dtype=float).reshape(-1, 2)
+        n = len(self.coordinates)
+
+        if any(not 0 <= i < n for i in removed):
+            raise ValueError("no station to remove among %s" % removed)
+
+        keep = np.setdiff1d(np.arange(n), removed)
+        coordinates = np.concatenate((self.coordinates[keep], added))
+        instance = self.make_instance(coordinates)
+
+        with stage("routing.incremental", removed=len(removed), added=len(added)) as span:
+            # every remaining station moves down by the removed stations before it
+            index = np.full(n, -1)
+            index[keep] = np.arange(len(keep))
+            tours = [[int(index[node]) for node in tour if index[node] >= 0] for tour in self.tours]
+            affected = {t for t, tour in enumerate(self.tours) if any(node in removed for node in tour[1:-1])}
+
+            local = 0 not in removed and len(coordinates) > self.buses
+            if local:
+                for node in range(len(keep), len(coordinates)):
+                    # a bus that lost all of its stops takes the new stations first
+                    empty = [t for t, tour in enumerate(tours) if len(tour) == 2]
+                    candidates = empty or range(len(tours))
+                    t, position, _ = cheapest_insertion(instance, [tours[t] for t in candidates], node)
+                    t = candidates[t]
+                    tours[t].insert(position, node)
+                    affected.add(t)
+                local = all(len(tour) > 2 for tour in tours)
+
+            if local:
+                for t in affected:
+                    tours[t] = improve_tour(instance, tours[t])
+
+                cost = sum(tour_cost(instance, tour) for tour in tours)
+                reference = sum(tour_cost(instance, tour) for tour in construct_tours(instance, self.buses))
+                local = cost <= (1 + self.tolerance) * reference
+
+            if not local:
+                tours, reference = self.solve(coordinates, instance)
+                affected = set(range(self.buses))
+                cost = sum(tour_cost(instance, tour) for tour in tours)
+            span.set(full_solve=not local, affected=len(affected))
+
+        self.coordinates, self.instance, self.tours = coordinates, instance, tours
+
+        return {
+            "tours": tours,
+            "cost": cost,
+            "x": self.x,
+            "affected": sorted(affected),
+            "full_solve": not local,
+            "reference_cost": reference,
+            "time": time.perf_counter() - start,
+        }
+
+    def solve(self, coordinates, instance):
+        """
+        Solves the routes from scratch, keeping the better of the solver's tours, if feasible, and construct_tours
+
+        Returns
+        -------
+        tours : list
+            The tours
+        reference : float
+            The cost of the tours of construct_tours
+        """
+        if len(coordinates) <= self.buses:
+            raise ValueError("%d buses need at least %d stations besides the depot" % (self.buses, self.buses))
+
+        tours = construct_tours(instance, self.buses)
+        reference = sum(tour_cost(instance, tour) for tour in tours)
+
+        solved = self.solver(coordinates, self.buses, seed=self.seed) if self.solver is not None else None
+        if solved is not None and is_feasible(solved, len(coordinates), self.buses):
+            solved = [improve_tour(instance, list(map(int, tour))) for tour in solved]
+            if sum(tour_cost(instance, tour) for tour in solved) < reference:
+                tours = solved
+        return tours, reference
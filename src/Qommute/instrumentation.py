@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS is then left out
+    resource = None
+
+
+class Span:
+    def __init__(self, name, trace_id, span_id, parent_id, attributes):
+        """
+        One timed stage, shaped like an OpenTelemetry span so that a sink file can be loaded by span tooling
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = None
+
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def set(self, **attributes):
+        """
+        Records problem sizes or any other attribute of the stage, e.g. span.set(nodes=20, edges=87)
+        """
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.end_time_unix_nano = time.time_ns()
+        self.attributes["wall_seconds"] = time.perf_counter() - self._wall
+        self.attributes["cpu_seconds"] = time.process_time() - self._cpu
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux, the peak of the whole process up to the end of the stage
+            self.attributes["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_time_unix_nano,
+            "end_time_unix_nano": self.end_time_unix_nano,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """
+    Stands in for both the context manager and the span of a disabled profiler, so a disabled stage allocates nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    def __init__(self, enabled=True, sink=None, max_spans=10000):
+        """
+        Records the wall time, CPU time, peak RSS and problem sizes of every instrumented stage
+
+        Parameters
+        ----------
+        enabled : bool
+            If False every stage costs one attribute check and nothing is recorded
+        sink : str
+            A jsonl file every finished span is appended to, if given
+        max_spans : int
+            The number of most recent spans kept in memory for the report, the totals count every span and the sink
+            receives every span, so a long-lived process profiles in bounded memory
+        """
+        self.enabled = enabled
+        self.sink = sink
+        self.spans = deque(maxlen=max_spans)
+        self.totals = {}
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # opened on the first span and kept open, see close
+        self._sink_file = None
+
+    def stage(self, name, **attributes):
+        """
+        Times the body of a with statement as one stage, nested stages become child spans
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage, e.g. "qubo.compile"
+        attributes : dict
+            Attributes known before the stage runs
+
+        Returns
+        -------
+        context : context manager
+            Entering it gives the Span, which takes the attributes known once the stage ran through span.set
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, attributes)
+
+    @contextmanager
+    def _span(self, name, attributes):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        parent = stack[-1] if stack else None
+        trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        span = Span(name, trace_id, os.urandom(8).hex(), parent.span_id if parent else None, attributes)
+
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.end()
+            self._record(span)
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+            total = self.totals.setdefault(span.name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            total["calls"] += 1
+            total["wall_seconds"] += span.attributes["wall_seconds"]
+            total["cpu_seconds"] += span.attributes["cpu_seconds"]
+
+            if self.sink is not None:
+                if self._sink_file is None:
+                    self._sink_file = open(self.sink, 'a')
+                # flushed per span so the file is complete up to the last finished stage if the process dies
+                self._sink_file.write(json.dumps(span.to_dict()) + "\n")
+                self._sink_file.flush()
+
+    def report(self):
+        """
+        Returns the recorded stages in the order they finished, and the totals of every stage name
+
+        Returns
+        -------
+        report : dict
+            "stages" lists the last max_spans spans, "totals" sums the wall and CPU time and counts the calls of
+            every stage name over all spans
+        """
+        with self._lock:
+            return {"stages": [span.to_dict() for span in self.spans],
+                    "totals": {name: dict(total) for name, total in self.totals.items()}}
+
+    def save(self, file_path):
+        """
+        Writes the report to a json file
+        """
+        with open(file_path, 'w') as fp:
+            json.dump(self.report(), fp, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.totals = {}
+
+    def close(self):
+        """
+        Closes the sink file, the next span opens it again
+        """
+        with self._lock:
+            if self._sink_file is not None:
+                self._sink_file.close()
+                self._sink_file = None
+
+
+# the profiler every instrumented stage reports to, disabled until enable is called
+_PROFILER = Profiler(enabled=False)
+
+
+def get_profiler():
+    return _PROFILER
+
+
+def enable(sink=None):
+    """
+    Starts recording stages into a new profiler and returns it
+
+    Parameters
+    ----------
+    sink : str
+        A jsonl file every finished span is appended to, if given
+    """
+    global _PROFILER
+    _PROFILER.close()
+    _PROFILER = Profiler(enabled=True, sink=sink)
+    return _PROFILER
+
+
+def disable():
+    global _PROFILER
+    _PROFILER.close()
+    _PROFILER = Profiler(enabled=False)
+
+
+def stage(name, **attributes):
+    """
+    Times a stage with the current profiler, see Profiler.stage
+    """
+    return _PROFILER.stage(name, **attributes)
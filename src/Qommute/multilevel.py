@@ -0,0 +1,262 @@
+import itertools
+import math
+
+import numpy as np
+
+from .solve_context import SolveContext
+from .swap_search import SwapAnnealer
+from .instrumentation import stage
+
+
+def match_heavy_edges(n, edges, durations, rounds=4):
+    """
+    Pairs up nodes along their shortest travel times
+
+    In every round each free node proposes to its free neighbour with the shortest travel time, and nodes that
+    propose to each other are matched. Ties go to the lower index, so the matching is deterministic
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes
+    edges : numpy.ndarray
+        An (m, 2) array of the node indices of every edge
+    durations : numpy.ndarray
+        The travel time of every edge
+    rounds : int
+        The number of proposal rounds
+
+    Returns
+    -------
+    mate : numpy.ndarray
+        The node every node is matched with, -1 for unmatched nodes
+    """
+    mate = np.full(n, -1, dtype=np.int64)
+    for _ in range(rounds):
+        free = (mate[edges[:, 0]] < 0) & (mate[edges[:, 1]] < 0) & (edges[:, 0] != edges[:, 1])
+        if not free.any():
+            break
+
+        # both directions of every free edge, the shortest first for every node
+        source = np.concatenate((edges[free, 0], edges[free, 1]))
+        target = np.concatenate((edges[free, 1], edges[free, 0]))
+        duration = np.concatenate((durations[free], durations[free]))
+        order = np.lexsort((target, duration, source))
+        source, target = source[order], target[order]
+        first = np.r_[True, source[1:] != source[:-1]]
+
+        proposal = np.full(n, -1, dtype=np.int64)
+        proposal[source[first]] = target[first]
+        proposing = np.flatnonzero(proposal >= 0)
+        mutual = proposing[proposal[proposal[proposing]] == proposing]
+        if not len(mutual):
+            break
+        mate[mutual] = proposal[mutual]
+    return mate
+
+
+def coarsen(edges, weights, linear, durations, mate):
+    """
+    Merges matched nodes into one node of a coarser problem
+
+    Choosing a coarse node stands for choosing one of its members. Its linear term is the mean of theirs, minus the
+    weight of the edges inside it, which a chosen member covers. Parallel edges between two coarse nodes are merged,
+    their weights summed so that the coarse node carries the centrality of all of its members, and their travel time
+    is the shortest, which the next matching compares
+
+    Parameters
+    ----------
+    edges : numpy.ndarray
+        An (m, 2) array of the node indices of every edge
+    weights : numpy.ndarray
+        The scaled H_1 weight A * w of every edge
+    linear : numpy.ndarray
+        The scaled linear term of every node, B * c at the finest level
+    durations : numpy.ndarray
+        The travel time of every edge
+    mate : numpy.ndarray
+        The matching, see match_heavy_edges
+
+    Returns
+    -------
+    groups : numpy.ndarray
+        The coarse node of every node
+    coarse : tuple
+        The edges, weights, linear terms and durations of the coarse problem
+    """
+    n = len(linear)
+    representative = np.where(mate >= 0, np.minimum(np.arange(n), mate), np.arange(n))
+    _, groups = np.unique(representative, return_inverse=True)
+    size = groups.max() + 1 if n else 0
+
+    a, b = groups[edges[:, 0]], groups[edges[:, 1]]
+    inside = a == b
+    members = np.bincount(groups, minlength=size)
+    coarse_linear = np.bincount(groups, linear, minlength=size) / members
+    coarse_linear -= np.bincount(a[inside], weights[inside], minlength=size)
+
+    low, high = np.minimum(a[~inside], b[~inside]), np.maximum(a[~inside], b[~inside])
+    keys, position = np.unique(low * size + high, return_inverse=True)
+    coarse_edges = np.column_stack((keys // size, keys % size))
+    coarse_weights = np.bincount(position, weights[~inside], minlength=len(keys))
+    coarse_durations = np.full(len(keys), np.inf)
+    np.minimum.at(coarse_durations, position, durations[~inside])
+
+    return groups, (coarse_edges, coarse_weights, coarse_linear, coarse_durations)
+
+
+class MultilevelSolver:
+    def __init__(self, edges, weights, costs, durations, stations, coefficients=(100, 100, 100), coarse_nodes=None,
+                 min_shrink=0.1):
+        """
+        Places stations by coarsening the graph, solving the small coarse problem and refining the solution back
+        level by level, so that the annealer never has to explore the whole graph at once
+
+        The graph is coarsened by matching the nodes joined by the shortest travel times until at most coarse_nodes
+        are left, see match_heavy_edges and coarsen. Every sample keeps exactly `stations` nodes selected, like the
+        swap annealer, so the energy is A * H_1 + B * H_2
+
+        Parameters
+        ----------
+        edges : numpy.ndarray
+            An (m, 2) array of the node indices of every edge
+        weights : numpy.ndarray
+            The normalized H_1 weight of every edge
+        costs : numpy.ndarray
+            The H_2 cost of every node
+        durations : numpy.ndarray
+            The travel time of every edge, the payloads of the placement graph's edges
+        stations : int
+            The number of nodes to select
+        coefficients : tuple
+            The coefficients A, B, C of the Hamiltonian, C is unused
+        coarse_nodes : int
+            The number of nodes the coarsening stops at, 4 * stations and at least 40 if None
+        min_shrink : float
+            The coarsening also stops at a level that removes less than this share of the nodes
+        """
+        A, B = coefficients[0], coefficients[1]
+
+        self.stations = stations
+        self.coarse_nodes = coarse_nodes or max(4 * stations, 40)
+
+        # every level holds the scaled terms of its problem, and the groups mapping its nodes to the next level's
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        level = (edges, A * np.asarray(weights, dtype=float), B * np.asarray(costs, dtype=float),
+                 np.asarray(durations, dtype=float))
+        self.levels = [level]
+        self.groups = []
+
+        with stage("multilevel.coarsen", nodes=len(costs), edges=len(edges)) as span:
+            while len(level[2]) > self.coarse_nodes:
+                mate = match_heavy_edges(len(level[2]), level[0], level[3])
+                groups, coarse = coarsen(*level, mate)
+                size = len(coarse[2])
+                if size <= stations or size > (1 - min_shrink) * len(level[2]):
+                    break
+                self.groups.append(groups)
+                self.levels.append(coarse)
+                level = coarse
+            span.set(levels=len(self.levels), coarse_nodes=len(level[2]))
+
+    def annealer(self, level):
+        """
+        Returns the swap annealer of a level's problem, whose terms are already scaled by the coefficients
+        """
+        edges, weights, linear, _ = self.levels[level]
+        return SwapAnnealer(edges, weights, linear, self.stations, (1, 1, 0))
+
+    def solve_exact(self, annealer, batch=4096):
+        """
+        Enumerates every selection of `stations` nodes of a small problem
+
+        Returns
+        -------
+        x : numpy.ndarray
+            The best selection
+        energy : float
+            Its energy
+        """
+        best_x, best_energy = None, np.inf
+        combinations = itertools.combinations(range(annealer.n), self.stations)
+        while True:
+            chunk = np.array(list(itertools.islice(combinations, batch)), dtype=np.int64).reshape(-1, self.stations)
+            if not len(chunk):
+                break
+            x = np.zeros((len(chunk), annealer.n), dtype=np.int8)
+            np.put_along_axis(x, chunk, 1, axis=1)
+            energies = annealer.energy(x)
+            index = int(np.argmin(energies))
+            if energies[index] < best_energy:
+                best_x, best_energy = x[index], float(energies[index])
+        return best_x, best_energy
+
+    def project(self, level, x):
+        """
+        Turns a selection of a level's nodes into one of the next finer level's nodes, choosing in every selected
+        group the member whose selection alone lowers the energy the most
+        """
+        edges, weights, linear, _ = self.levels[level - 1]
+        groups = self.groups[level - 1]
+
+        covered = np.bincount(edges[:, 0], weights, minlength=len(linear)) + np.bincount(edges[:, 1], weights, minlength=len(linear))
+        score = linear - covered
+        order = np.lexsort((score, groups))
+        first = order[np.r_[True, groups[order][1:] != groups[order][:-1]]]
+
+        fine = np.zeros(len(linear), dtype=np.int8)
+        fine[first[x[groups[first]] == 1]] = 1
+        return fine
+
+    def solve(self, coarse_reads=20, coarse_sweeps=200, refine_reads=2, refine_sweeps=20, exact_limit=20000, seed=None):
+        """
+        Solves the coarsest problem and refines its solution on every finer level
+
+        Parameters
+        ----------
+        coarse_reads : int
+            The number of annealing reads of the coarsest problem
+        coarse_sweeps : int
+            The number of sweeps per read of the coarsest problem
+        refine_reads : int
+            The number of refining reads per level, all started from the projected solution
+        refine_sweeps : int
+            The number of sweeps per refining read
+        exact_limit : int
+            The coarsest problem is solved by enumeration when it has at most this many selections
+        seed : int or numpy.random.Generator
+            The seed of the annealers
+
+        Returns
+        -------
+        x : numpy.ndarray
+            The selection vector of the original nodes
+        energy : float
+            Its energy A * H_1 + B * H_2
+        """
+        context = SolveContext(seed)
+        top = len(self.levels) - 1
+
+        with stage("multilevel.solve_coarse", nodes=len(self.levels[top][2])) as span:
+            annealer = self.annealer(top)
+            exact = math.comb(annealer.n, self.stations) <= exact_limit
+            if exact:
+                x, energy = self.solve_exact(annealer)
+            else:
+                samples, energies = annealer.sample(num_reads=coarse_reads, num_sweeps=coarse_sweeps, seed=context.rng)
+                x, energy = samples[np.argmin(energies)], float(np.min(energies))
+            span.set(exact=exact)
+
+        for level in range(top, 0, -1):
+            with stage("multilevel.refine", level=level - 1, nodes=len(self.levels[level - 1][2])):
+                x = self.project(level, x)
+                annealer = self.annealer(level - 1)
+
+                # start half way down the schedule, so that the anneal refines the projected solution
+                hot, cold = annealer.default_beta_range()
+                samples, energies = annealer.sample(num_reads=refine_reads, num_sweeps=refine_sweeps,
+                                                    beta_range=(math.sqrt(hot * cold), cold), initial_states=x[None, :],
+                                                    seed=context.rng)
+                x, energy = samples[np.argmin(energies)], float(np.min(energies))
+
+        return x, energy
@@ -0,0 +1,138 @@
+import numpy as np
+
+
+def get_term_arrays(graph, bw_centrality):
+    """
+    Takes the placement graph and its betweenness centrality as input and returns the sparse terms of the Hamiltonian as arrays
+
+    Parameters
+    ----------
+    graph : rustworkx.PyGraph
+        The placement graph, every node carrying its cost "c"
+    bw_centrality : rustworkx.CentralityMapping
+        The betweenness centrality of every node
+
+    Returns
+    -------
+    edges : numpy.ndarray
+        An (m, 2) array of the node indices of every edge
+    weights : numpy.ndarray
+        The H_1 weight of every edge, the summed centrality of its nodes divided by the largest such sum
+    costs : numpy.ndarray
+        The H_2 cost c of every node
+    """
+    n = graph.num_nodes()
+
+    edges = np.array(graph.edge_list(), dtype=np.int64).reshape(-1, 2)
+    centrality = np.array([bw_centrality[i] for i in range(n)], dtype=float)
+
+    weights = centrality[edges[:, 0]] + centrality[edges[:, 1]]
+    if len(weights) and weights.max() > 0:
+        weights = weights / weights.max()
+
+    costs = np.array([graph[i]["c"] for i in range(n)], dtype=float)
+
+    return edges, weights, costs
+
+
+def decode_selection(x):
+    """
+    Turns a 0/1 selection vector into a sample dictionary keyed like the pyqubo variables
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        The selection vector, indexed like the graph nodes
+
+    Returns
+    -------
+    sample : dict
+        A dictionary with "x[i]" as key and 0 or 1 as value
+    """
+    return {"x[%d]" % i: int(v) for i, v in enumerate(x)}
+
+
+def get_qubo_matrix(edges, weights, costs, stations, coefficients=(100, 100, 100)):
+    """
+    Builds the full placement QUBO A * H_1 + B * H_2 + C * H_3 as a dense matrix, without pyqubo
+
+    Parameters
+    ----------
+    edges : numpy.ndarray
+        An (m, 2) array of the node indices of every edge
+    weights : numpy.ndarray
+        The normalized H_1 weight of every edge
+    costs : numpy.ndarray
+        The H_2 cost of every node
+    stations : int
+        The number of nodes to select
+    coefficients : tuple
+        The coefficients A, B, C of the Hamiltonian
+
+    Returns
+    -------
+    Q : numpy.ndarray
+        An upper triangular (n, n) matrix with the linear terms on the diagonal
+    offset : float
+        The constant of the Hamiltonian
+    """
+    A, B, C = coefficients
+    n = len(costs)
+    edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+
+    Q = np.zeros((n, n))
+
+    # H_1 = sum over edges of w (1 - x_i)(1 - x_j) = w (1 - x_i - x_j + x_i x_j)
+    np.add.at(Q, (edges[:, 0], edges[:, 1]), A * weights)
+    np.add.at(Q, (edges[:, 0], edges[:, 0]), -A * weights)
+    np.add.at(Q, (edges[:, 1], edges[:, 1]), -A * weights)
+
+    # H_2 = sum of c x
+    Q[np.diag_indices(n)] += B * np.asarray(costs, dtype=float)
+
+    # H_3 = (sum of x - k)^2 = (1 - 2k) sum of x + 2 sum over pairs of x_i x_j + k^2
+    Q[np.triu_indices(n, k=1)] += 2 * C
+    Q[np.diag_indices(n)] += C * (1 - 2 * stations)
+
+    offset = A * np.sum(weights) + C * stations**2
+
+    return Q, offset
+
+
+def cardinality_penalty(edges, weights, costs, coefficients=(100, 100), margin=1.1):
+    """
+    Sizes the coefficient C of H_3 so that the optimum of the full QUBO places exactly the requested number of stations
+
+    A selection with d stations too many or too few is d flips away from one with the right number, every flip
+    changing A * H_1 + B * H_2 by at most the largest single-flip gain, while H_3 adds C * d^2. Any C above that gain
+    therefore makes every wrong count cost more than the best right one
+
+    Parameters
+    ----------
+    edges : numpy.ndarray
+        An (m, 2) array of the node indices of every edge
+    weights : numpy.ndarray
+        The normalized H_1 weight of every edge
+    costs : numpy.ndarray
+        The H_2 cost of every node
+    coefficients : tuple
+        The coefficients A, B of the Hamiltonian, a third one is ignored
+    margin : float
+        The factor C is set above the largest gain by
+
+    Returns
+    -------
+    C : float
+        The coefficient of H_3
+    """
+    A, B = coefficients[0], coefficients[1]
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    costs = np.asarray(costs, dtype=float)
+
+    # a flip of node i changes H_1 by at most the weight of its edges and H_2 by its cost
+    gain = B * np.abs(costs)
+    np.add.at(gain, edges[:, 0], A * np.asarray(weights, dtype=float))
+    np.add.at(gain, edges[:, 1], A * np.asarray(weights, dtype=float))
+
+    largest = gain.max() if len(gain) else 0.0
+    return margin * largest if largest > 0 else 1.0
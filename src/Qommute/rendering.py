@@ -0,0 +1,346 @@
+import json
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+from .instrumentation import stage
+
+
+def decode_routes(x, n):
+    """
+    Decodes the routing variables x_ij of every ordered pair i != j, as QuantumOptimizer returns them, into edges
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        The n * (n - 1) binary variables in row-major order without the diagonal
+    n : int
+        The number of nodes
+
+    Returns
+    -------
+    edges : numpy.ndarray
+        An array of shape (m, 2) of the (from, to) node of every traveled edge
+    """
+    adjacency = np.zeros((n, n), dtype=bool)
+    adjacency[~np.eye(n, dtype=bool)] = np.asarray(x)[:n * (n - 1)] > 0.5
+    return np.argwhere(adjacency)
+
+
+def decode_tours(edges, n, depot=0):
+    """
+    Follows the traveled edges from the depot into tours
+
+    Parameters
+    ----------
+    edges : numpy.ndarray
+        The (from, to) node of every traveled edge, see decode_routes
+    n : int
+        The number of nodes
+    depot : int
+        The node every tour starts and ends at
+
+    Returns
+    -------
+    tours : list
+        One list of nodes per edge leaving the depot, from the depot back to it, or as far as the edges go
+    """
+    successor = np.full(n, -1)
+    successor[edges[:, 0]] = edges[:, 1]
+
+    tours = []
+    for first in edges[edges[:, 0] == depot, 1]:
+        tour, node = [depot], first
+        while node != -1 and node != depot and len(tour) <= n:
+            tour.append(int(node))
+            node = successor[node]
+        tours.append(tour + [depot] if node == depot else tour)
+    return tours
+
+
+def decode_selection(solution, n):
+    """
+    Decodes a placement solution into the indices of the selected nodes
+
+    Parameters
+    ----------
+    solution : dict or numpy.ndarray
+        A sample keyed by "x[i]" as the annealers return it, or an array of n binary values
+    n : int
+        The number of nodes
+
+    Returns
+    -------
+    selected : numpy.ndarray
+        The sorted indices of the selected nodes
+    """
+    if isinstance(solution, dict):
+        values = np.zeros(n)
+        for key, value in solution.items():
+            if key.startswith("x["):
+                values[int(key[2:-1])] = value
+        solution = values
+    return np.flatnonzero(np.asarray(solution)[:n] > 0.5)
+
+
+def thin_edges(segments, weights=None, resolution=1000, max_edges=20000):
+    """
+    Drops the edges a picture of the given resolution cannot show apart, so that drawing time stays bounded
+
+    Endpoints are snapped to a resolution x resolution grid over the bounding box. Edges shorter than one cell go,
+    edges joining the same two cells are kept once, and if more than max_edges are left the heaviest are kept
+
+    Parameters
+    ----------
+    segments : numpy.ndarray
+        An array of shape (m, 2, 2) of the two (x, y) endpoints of every edge
+    weights : numpy.ndarray
+        The importance of every edge, the kept duplicate and the kept edges beyond max_edges are the heaviest
+    resolution : int
+        The number of grid cells along each axis
+    max_edges : int
+        The largest number of edges kept
+
+    Returns
+    -------
+    keep : numpy.ndarray
+        The indices of the kept edges
+    """
+    m = len(segments)
+    if m == 0:
+        return np.zeros(0, dtype=np.int64)
+    weights = np.ones(m) if weights is None else np.asarray(weights, dtype=float)
+
+    points = segments.reshape(-1, 2)
+    low = points.min(axis=0)
+    span = np.maximum(points.max(axis=0) - low, 1e-12)
+    cells = np.minimum((resolution * (segments - low) / span).astype(np.int64), resolution - 1)
+    cells = cells[:, :, 0] * resolution + cells[:, :, 1]
+
+    # one key per unordered pair of cells, self-loops are edges shorter than a cell
+    key = np.minimum(cells[:, 0], cells[:, 1]) * resolution**2 + np.maximum(cells[:, 0], cells[:, 1])
+    candidates = np.flatnonzero(cells[:, 0] != cells[:, 1])
+
+    # heaviest first, so that the first edge of every key is the one kept
+    order = candidates[np.lexsort((-weights[candidates], key[candidates]))]
+    _, first = np.unique(key[order], return_index=True)
+    keep = order[first]
+
+    if len(keep) > max_edges:
+        keep = keep[np.argsort(-weights[keep], kind="stable")[:max_edges]]
+    return np.sort(keep)
+
+
+def _figure(size, title):
+    # a figure outside pyplot draws on its own Agg canvas, with no display and no global state
+    figure = Figure(figsize=size)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    ax.set_aspect("equal", adjustable="datalim")
+    if title:
+        ax.set_title(title)
+    return figure, ax
+
+
+def render_graph(positions, edges, node_values=None, edge_weights=None, file_path=None, title=None, size=(15, 10),
+                 dpi=100, max_edges=20000, labels=None):
+    """
+    Draws a graph with one LineCollection for the edges and one scatter for the nodes
+
+    Parameters
+    ----------
+    positions : numpy.ndarray
+        The (x, y) of every node, e.g. longitude and latitude
+    edges : numpy.ndarray
+        An array of shape (m, 2) of node indices
+    node_values : numpy.ndarray
+        The colors of the nodes, e.g. their betweenness centrality, with a colorbar if given
+    edge_weights : numpy.ndarray
+        The importance of every edge for thinning, see thin_edges
+    file_path : str
+        The png file to write, if given
+    title : str
+        The title of the picture
+    size : tuple
+        The size of the figure in inches
+    dpi : int
+        The dots per inch of the png
+    max_edges : int
+        The largest number of edges drawn
+    labels : list
+        A label per node, only drawn for graphs of at most 100 nodes
+
+    Returns
+    -------
+    figure : matplotlib.figure.Figure
+        The figure, e.g. to show it in a notebook
+    """
+    positions = np.asarray(positions, dtype=float)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+    with stage("render.graph", nodes=len(positions), edges=len(edges)) as span:
+        figure, ax = _figure(size, title)
+
+        segments = positions[edges]
+        keep = thin_edges(segments, edge_weights, resolution=int(max(size) * dpi), max_edges=max_edges)
+        ax.add_collection(LineCollection(segments[keep], colors="0.6", linewidths=0.5, zorder=1))
+        span.set(drawn_edges=len(keep))
+
+        points = ax.scatter(positions[:, 0], positions[:, 1], c=node_values, s=max(2, 2000 / max(len(positions), 1)),
+                            cmap="viridis", zorder=2)
+        if node_values is not None:
+            figure.colorbar(points, ax=ax)
+        if labels is not None and len(labels) <= 100:
+            for label, (x, y) in zip(labels, positions):
+                ax.annotate(str(label), (x, y), size=8)
+
+        ax.autoscale_view()
+        if file_path is not None:
+            figure.savefig(file_path, dpi=dpi)
+
+    return figure
+
+
+def render_routes(positions, edges, depot=0, file_path=None, title=None, size=(8, 8), dpi=100):
+    """
+    Draws the traveled edges of a routing solution as arrows from one quiver call
+
+    Parameters
+    ----------
+    positions : numpy.ndarray
+        The (x, y) of every node
+    edges : numpy.ndarray
+        The (from, to) node of every traveled edge, see decode_routes
+    depot : int
+        The node drawn as the depot
+    file_path : str
+        The png file to write, if given
+    title : str
+        The title of the picture
+    size : tuple
+        The size of the figure in inches
+    dpi : int
+        The dots per inch of the png
+
+    Returns
+    -------
+    figure : matplotlib.figure.Figure
+        The figure
+    """
+    positions = np.asarray(positions, dtype=float)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+    with stage("render.routes", nodes=len(positions), edges=len(edges)):
+        figure, ax = _figure(size, title)
+        ax.grid()
+        ax.scatter(positions[:, 0], positions[:, 1], s=200 if len(positions) <= 50 else 10)
+        ax.plot(positions[depot, 0], positions[depot, 1], "r*", ms=20)
+        if len(positions) <= 50:
+            for i, (x, y) in enumerate(positions):
+                ax.annotate(i, (x + 0.015, y), size=16, color="r")
+
+        start, end = positions[edges[:, 0]], positions[edges[:, 1]]
+        ax.quiver(start[:, 0], start[:, 1], end[:, 0] - start[:, 0], end[:, 1] - start[:, 1],
+                  angles="xy", scale_units="xy", scale=1, width=0.003)
+
+        if file_path is not None:
+            figure.savefig(file_path, dpi=dpi)
+
+    return figure
+
+
+def to_features(coordinates, names=None, properties=None, edges=None, edge_properties=None, tours=None):
+    """
+    Builds GeoJSON features from stations, edges and tours
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        The latitude and longitude of every station
+    names : list
+        The name of every station
+    properties : dict
+        Per-station values, e.g. {"selected": [...], "centrality": [...]}, one list per property
+    edges : numpy.ndarray
+        An array of shape (m, 2) of station indices, written as LineStrings
+    edge_properties : dict
+        Per-edge values, one list per property
+    tours : list
+        Lists of station indices, written as one LineString per tour
+
+    Returns
+    -------
+    features : list
+        The GeoJSON features, in longitude-latitude order
+    """
+    lonlat = np.asarray(coordinates, dtype=float)[:, ::-1].round(6).tolist()
+    properties = properties or {}
+    edge_properties = edge_properties or {}
+
+    columns = {key: np.asarray(values).tolist() for key, values in properties.items()}
+    features = []
+    for i, point in enumerate(lonlat):
+        attributes = {key: values[i] for key, values in columns.items()}
+        if names is not None:
+            attributes["name"] = names[i]
+        features.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": point}, "properties": attributes})
+
+    if edges is not None:
+        edge_columns = {key: np.asarray(values).tolist() for key, values in edge_properties.items()}
+        for j, (a, b) in enumerate(np.asarray(edges, dtype=np.int64).reshape(-1, 2).tolist()):
+            attributes = {key: values[j] for key, values in edge_columns.items()}
+            attributes.update({"kind": "edge", "from": a, "to": b})
+            features.append({"type": "Feature", "geometry": {"type": "LineString", "coordinates": [lonlat[a], lonlat[b]]},
+                             "properties": attributes})
+
+    for t, tour in enumerate(tours or []):
+        features.append({"type": "Feature", "geometry": {"type": "LineString", "coordinates": [lonlat[i] for i in tour]},
+                         "properties": {"kind": "tour", "tour": t, "stops": len(tour)}})
+
+    return features
+
+
+def export(file_path, features):
+    """
+    Writes features for map tools, as GeoJSON, or as FlatGeobuf when the file ends in .fgb
+
+    FlatGeobuf needs fiona, which is only imported when such a file is asked for. A FlatGeobuf file holds one
+    geometry type, so the stations go to file_path and the edges and tours to the same name ending in _lines.fgb
+
+    Parameters
+    ----------
+    file_path : str
+        The .geojson, .json or .fgb file to write
+    features : list
+        The features, see to_features
+    """
+    with stage("render.export", features=len(features)):
+        if not file_path.endswith(".fgb"):
+            with open(file_path, 'w') as fp:
+                json.dump({"type": "FeatureCollection", "features": features}, fp)
+            return
+
+        import fiona
+
+        layers = {file_path: [f for f in features if f["geometry"]["type"] == "Point"],
+                  file_path[:-len(".fgb")] + "_lines.fgb": [f for f in features if f["geometry"]["type"] == "LineString"]}
+        for layer_path, layer_features in layers.items():
+            if not layer_features:
+                continue
+            keys = sorted({key for feature in layer_features for key in feature["properties"]})
+            schema = {"geometry": layer_features[0]["geometry"]["type"],
+                      "properties": {key: _fiona_type(layer_features, key) for key in keys}}
+            with fiona.open(layer_path, 'w', driver="FlatGeobuf", schema=schema, crs="EPSG:4326") as sink:
+                sink.writerecords({"geometry": f["geometry"], "properties": {key: f["properties"].get(key) for key in keys}}
+                                  for f in layer_features)
+
+
+def _fiona_type(features, key):
+    values = [f["properties"][key] for f in features if f["properties"].get(key) is not None]
+    if values and all(isinstance(value, bool) or isinstance(value, int) for value in values):
+        return "int"
+    if values and all(isinstance(value, (int, float)) for value in values):
+        return "float"
+    return "str"
@@ -0,0 +1,207 @@
+import numpy as np
+
+
+def get_variable_order(nodes):
+    """
+    Returns the pyqubo labels of the placement variables in node index order
+    """
+    return ["x[%d]" % i for i in range(nodes)]
+
+
+def bqm_to_arrays(bqm, variables):
+    """
+    Takes a binary quadratic model as input and returns its coefficients as dense arrays
+
+    Parameters
+    ----------
+    bqm : dimod.BinaryQuadraticModel
+        The model, with binary variables
+    variables : list
+        The variable labels, in the order of the returned arrays
+
+    Returns
+    -------
+    linear : numpy.ndarray
+        The linear coefficients
+    coupling : numpy.ndarray
+        The symmetric (n, n) matrix of quadratic coefficients with a zero diagonal, so that
+        the energy is offset + linear @ x + x @ coupling @ x / 2
+    offset : float
+        The constant of the model
+    """
+    linear, (rows, cols, values), offset = bqm.to_numpy_vectors(variable_order=variables)
+
+    coupling = np.zeros((len(variables), len(variables)))
+    np.add.at(coupling, (rows, cols), values)
+    np.add.at(coupling, (cols, rows), values)
+
+    return np.asarray(linear, dtype=float), coupling, float(offset)
+
+
+def sampleset_to_arrays(sampleset, variables):
+    """
+    Takes a sample set as input and returns its raw samples and energies, without decoding them
+
+    Parameters
+    ----------
+    sampleset : dimod.SampleSet
+        The sample set returned by the sampler
+    variables : list
+        The variable labels, in the order of the returned columns
+
+    Returns
+    -------
+    samples : numpy.ndarray
+        An (reads, n) array of 0/1 values
+    energies : numpy.ndarray
+        The energy of every read
+    """
+    columns = [sampleset.variables.index(v) for v in variables]
+    samples = np.asarray(sampleset.record.sample[:, columns], dtype=np.int8)
+    energies = np.asarray(sampleset.record.energy, dtype=float)
+
+    # reads aggregated by the sampler are expanded back into single reads
+    occurrences = sampleset.record.num_occurrences
+    if np.any(occurrences != 1):
+        samples = np.repeat(samples, occurrences, axis=0)
+        energies = np.repeat(energies, occurrences)
+
+    return samples, energies
+
+
+def deduplicate(samples, energies):
+    """
+    Keeps one copy of every distinct sample
+    """
+    samples, index = np.unique(samples, axis=0, return_index=True)
+    return samples, energies[index]
+
+
+def steepest_descent(samples, energies, linear, coupling):
+    """
+    Polishes every sample with 1-flip steepest descent until no single flip lowers its energy.
+    All samples are updated at once, one flip per sample per step
+
+    Parameters
+    ----------
+    samples : numpy.ndarray
+        An (reads, n) array of 0/1 values
+    energies : numpy.ndarray
+        Their energies
+    linear : numpy.ndarray
+        The linear coefficients
+    coupling : numpy.ndarray
+        The symmetric quadratic coefficients with a zero diagonal
+
+    Returns
+    -------
+    samples : numpy.ndarray
+        The polished samples
+    energies : numpy.ndarray
+        Their energies
+    """
+    samples = samples.copy()
+    energies = energies.copy()
+
+    # the energy change of flipping x_i is (1 - 2 x_i) * (linear_i + sum_j coupling_ij x_j)
+    fields = linear + samples @ coupling
+    rows = np.arange(len(samples))
+
+    while True:
+        deltas = (1 - 2 * samples) * fields
+        flips = np.argmin(deltas, axis=1)
+        gains = deltas[rows, flips]
+
+        improving = gains < -1e-9
+        if not np.any(improving):
+            break
+
+        r, i = rows[improving], flips[improving]
+        signs = 1 - 2 * samples[r, i]
+        samples[r, i] ^= 1
+        fields[r] += signs[:, None] * coupling[i]
+        energies[r] += gains[improving]
+
+    return samples, energies
+
+
+def top_k_diverse(samples, energies, k=1, min_distance=1):
+    """
+    Picks the k lowest energy samples that are at least `min_distance` flips away from each other
+
+    Parameters
+    ----------
+    samples : numpy.ndarray
+        An (reads, n) array of 0/1 values
+    energies : numpy.ndarray
+        Their energies
+    k : int
+        The number of samples to return
+    min_distance : int
+        The smallest Hamming distance between two returned samples
+
+    Returns
+    -------
+    samples : numpy.ndarray
+        Up to k samples, lowest energy first
+    energies : numpy.ndarray
+        Their energies
+    """
+    order = np.argsort(energies, kind="stable")
+    chosen = []
+
+    for index in order:
+        if chosen:
+            distances = np.count_nonzero(samples[chosen] != samples[index], axis=1)
+            if np.min(distances) < min_distance:
+                continue
+        chosen.append(index)
+        if len(chosen) == k:
+            break
+
+    return samples[chosen], energies[chosen]
+
+
+def postprocess(sampleset, bqm, variables, k=1, min_distance=1, polish=True):
+    """
+    Deduplicates the reads of a sample set, polishes them and returns the best diverse ones, all on raw arrays
+
+    Parameters
+    ----------
+    sampleset : dimod.SampleSet
+        The sample set returned by the sampler
+    bqm : dimod.BinaryQuadraticModel
+        The model that was sampled
+    variables : list
+        The variable labels, in the order of the returned columns
+    k : int
+        The number of solutions to return
+    min_distance : int
+        The smallest Hamming distance between two returned solutions
+    polish : bool
+        Whether to run steepest descent on the samples
+
+    Returns
+    -------
+    samples : numpy.ndarray
+        Up to k solutions, lowest energy first
+    energies : numpy.ndarray
+        Their energies
+    """
+    samples, energies = sampleset_to_arrays(sampleset, variables)
+
+    return postprocess_arrays(samples, energies, bqm, variables, k, min_distance, polish)
+
+
+def postprocess_arrays(samples, energies, bqm, variables, k=1, min_distance=1, polish=True):
+    """
+    Same as postprocess, for reads that are already arrays
+    """
+    samples, energies = deduplicate(samples, energies)
+
+    if polish:
+        linear, coupling, _ = bqm_to_arrays(bqm, variables)
+        samples, energies = steepest_descent(samples, energies, linear, coupling)
+        samples, energies = deduplicate(samples, energies)
+
+    return top_k_diverse(samples, energies, k, min_distance)
@@ -0,0 +1,453 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .bike_placement.bike_tutorial import bikeStationPlanner
+from .bike_placement.qubo import QUBOPlacement
+from .stage_cache import StageCache
+from .bus.pipeline import Pipeline
+from .bus.placement.batch import DEFAULT_SCENARIO, PROBLEM_CACHE_SIZE, load_data, run_scenario
+from .bus.placement.getter_functions import DATA_DIR
+from .rendering import decode_routes, decode_tours
+
+# the keys every endpoint accepts, with the value a request leaves out. The data directory is the server's
+BUS_PLACE_DEFAULTS = {key: value for key, value in DEFAULT_SCENARIO.items() if key != "data_dir"}
+BIKE_PLACE_DEFAULTS = {"docks": 2, "coefficients": [100, 100, 100], "solver": "swap", "num_reads": 10, "num_sweeps": 100,
+                       "seed": 42}
+BUS_ROUTE_DEFAULTS = {"coordinates": None, "buses": 2, "seed": 10598}
+
+BUS_SOLVERS = ("swap", "multilevel", "neal", "qaoa", "exact")
+BIKE_SOLVERS = ("swap", "neal")
+
+# the largest request body read, in bytes
+MAX_BODY = 1 << 20
+
+# the warm state of a worker process, see _init_worker
+_BIKE = {}
+
+# the most recently used bike placements of a worker process with their compiled problems, see _bike_problem
+_BIKE_PROBLEMS = OrderedDict()
+
+
+def _init_worker(warm):
+    # runs once in every worker, so that the first request a worker takes does not pay for loading the data
+    if "bus" in warm:
+        load_data(DATA_DIR)
+    if "bike" in warm:
+        _bike_planner()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _bike_planner():
+    if "planner" not in _BIKE:
+        _BIKE["planner"] = bikeStationPlanner(cache=StageCache())
+    return _BIKE["planner"]
+
+
+def _bike_problem(docks, coefficients):
+    # the placement keeps its penalty model and term arrays once built, so requests differing only in their solver,
+    # reads or seed reuse them, like the problems of batch.get_problem
+    key = json.dumps([docks, coefficients])
+    if key in _BIKE_PROBLEMS:
+        _BIKE_PROBLEMS.move_to_end(key)
+        return _BIKE_PROBLEMS[key]
+
+    planner = _bike_planner()
+    qubo = QUBOPlacement(planner.graph, planner.bw_centrality, planner.node_dic, planner.index_dic,
+                         docks=docks, coefficients=tuple(coefficients))
+    _BIKE_PROBLEMS[key] = qubo
+    if len(_BIKE_PROBLEMS) > PROBLEM_CACHE_SIZE:
+        _BIKE_PROBLEMS.popitem(last=False)
+    return qubo
+
+
+def place_bus(request: dict):
+    """
+    Places bus stations for a scenario with the data and problems the worker keeps, see batch.run_scenario
+    """
+    result = run_scenario({**request, "data_dir": DATA_DIR})
+    del result["scenario"]["data_dir"]
+    return result
+
+
+def place_bike(request: dict):
+    """
+    Places bike docks among the subway stations of the planner the worker keeps, reusing the problem of an earlier
+    request with the same docks and coefficients
+
+    Parameters
+    ----------
+    request : dict
+        The docks to place, the coefficients A, B, C, the solver, "swap" or "neal", the annealing reads and sweeps
+        and the seed
+
+    Returns
+    -------
+    result : dict
+        The request, the placed stations with their coordinates, the solve time and the worker's pid
+    """
+    planner = _bike_planner()
+    qubo = _bike_problem(request["docks"], request["coefficients"])
+
+    start = time.perf_counter()
+    if request["solver"] == "swap":
+        sample = qubo.get_constrained_sample(num_reads=request["num_reads"], num_sweeps=request["num_sweeps"],
+                                             seed=request["seed"])
+    elif request["solver"] == "neal":
+        sample, _ = qubo.get_top_samples(k=1, num_reads=request["num_reads"], seed=request["seed"])[0]
+    else:
+        raise ValueError("unknown solver %s" % request["solver"])
+    solve = time.perf_counter() - start
+
+    stations = planner.get_selected_stations(sample)
+    return {
+        "request": request,
+        "stations": stations,
+        "coordinates": [list(planner.coordinates[name]) for name in stations],
+        "timing": {"solve": solve},
+        "pid": os.getpid(),
+    }
+
+
+def route_bus(request: dict):
+    """
+    Routes the buses between the given stations, the first one being the depot, see Pipeline.route
+
+    Returns
+    -------
+    result : dict
+        The request, the binary solution, its cost and the tours it decodes into
+    """
+    if not request["coordinates"]:
+        raise ValueError("coordinates are required")
+    coordinates = np.asarray(request["coordinates"], dtype=float).reshape(-1, 2)
+    n = len(coordinates)
+
+    start = time.perf_counter()
+    routing = Pipeline(buses=request["buses"]).route(coordinates, seed=request["seed"])
+    solve = time.perf_counter() - start
+
+    x = np.asarray(routing["x"])
+    return {
+        "request": request,
+        "x": x.tolist(),
+        "cost": float(routing["cost"]),
+        "tours": decode_tours(decode_routes(x, n), n),
+        "timing": {"solve": solve},
+        "pid": os.getpid(),
+    }
+
+
+def _integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _positive(value):
+    return _integer(value) and value > 0
+
+
+def _number(value):
+    return _integer(value) or isinstance(value, float)
+
+
+def _numbers(size):
+    return lambda value: isinstance(value, list) and len(value) == size and all(_number(v) for v in value)
+
+
+def _coordinates(value):
+    return (isinstance(value, list) and len(value) >= 2
+            and all(isinstance(point, list) and len(point) == 2 and all(_number(v) for v in point) for point in value))
+
+
+# the check every value of a request must pass, with what it expects, see validate
+BUS_PLACE_TYPES = {
+    "name": (lambda value: value is None or isinstance(value, str), "a string"),
+    "n": (_positive, "a positive integer"),
+    "start": (_integer, "an integer"),
+    "end": (_integer, "an integer"),
+    "max_duration": (_number, "a number"),
+    "cost_weights": (_numbers(3), "a list of 3 numbers"),
+    "coefficients": (_numbers(3), "a list of 3 numbers"),
+    "stations": (_positive, "a positive integer"),
+    "solver": (lambda value: value in BUS_SOLVERS, "one of " + ", ".join(BUS_SOLVERS)),
+    "seed": (_integer, "an integer"),
+}
+BIKE_PLACE_TYPES = {
+    "docks": (_positive, "a positive integer"),
+    "coefficients": (_numbers(3), "a list of 3 numbers"),
+    "solver": (lambda value: value in BIKE_SOLVERS, "one of " + ", ".join(BIKE_SOLVERS)),
+    "num_reads": (_positive, "a positive integer"),
+    "num_sweeps": (_positive, "a positive integer"),
+    "seed": (_integer, "an integer"),
+}
+BUS_ROUTE_TYPES = {
+    "coordinates": (_coordinates, "a list of at least 2 [latitude, longitude] pairs, the depot first"),
+    "buses": (_positive, "a positive integer"),
+    "seed": (_integer, "an integer"),
+}
+
+# the path of every endpoint, with the function its requests run in a worker, the keys they accept and their checks
+ENDPOINTS = {
+    "/bus/place": (place_bus, BUS_PLACE_DEFAULTS, BUS_PLACE_TYPES),
+    "/bike/place": (place_bike, BIKE_PLACE_DEFAULTS, BIKE_PLACE_TYPES),
+    "/bus/route": (route_bus, BUS_ROUTE_DEFAULTS, BUS_ROUTE_TYPES),
+}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def validate(path, request):
+    """
+    Checks the keys and values of a request to an endpoint before it reaches a worker, so that an error raised in a
+    worker is the server's and not the client's
+
+    Parameters
+    ----------
+    path : str
+        The path of the endpoint
+    request : dict
+        The request, keys left out take their default
+
+    Returns
+    -------
+    request : dict
+        The complete request, a RequestError with status 400 is raised for an unknown key or a value of the wrong type
+    """
+    _, defaults, types = ENDPOINTS[path]
+    unknown = set(request) - set(defaults)
+    if unknown:
+        raise RequestError(400, "unknown keys %s" % ", ".join(sorted(unknown)))
+
+    request = {**defaults, **request}
+    for key, value in request.items():
+        check, expected = types[key]
+        if not check(value):
+            raise RequestError(400, "%s must be %s, not %s" % (key, expected, json.dumps(value)))
+    return request
+
+
+class PlanningService:
+    def __init__(self, host="127.0.0.1", port=8080, unix_path=None, processes=None, cache_size=1024, warm=("bus", "bike")):
+        """
+        A long-lived planning server over HTTP/1.1. The datasets, graphs and compiled problems stay in the memory of
+        its worker processes, so that a request only pays for its solve. Identical requests in flight are solved
+        once, and the responses of the last cache_size distinct requests are answered from memory
+
+        Parameters
+        ----------
+        host : str
+            The address to listen on
+        port : int
+            The port to listen on, 0 for any free port
+        unix_path : str
+            Listens on this Unix socket instead of host and port, if given
+        processes : int
+            The number of worker processes, the number of CPUs if None
+        cache_size : int
+            The number of responses kept
+        warm : tuple
+            The data every worker loads when it starts, "bus" and "bike"
+        """
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.processes = processes or os.cpu_count()
+        self.cache_size = cache_size
+        self.warm = tuple(warm)
+        self.stats = {"requests": 0, "hits": 0, "coalesced": 0, "solves": 0, "errors": 0}
+
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._pool = None
+        self._server = None
+        self._handlers = {}
+
+    @staticmethod
+    def request_key(path, request):
+        # the complete request in canonical form, so that key order and left out defaults do not matter
+        return path + json.dumps(request, sort_keys=True, separators=(",", ":"))
+
+    async def call(self, path, request):
+        """
+        Answers a request to an endpoint from the cache, from an identical request in flight or from a worker
+
+        Returns
+        -------
+        data : bytes
+            The json response
+        source : str
+            "hit", "coalesced" or "miss"
+        """
+        function = ENDPOINTS[path][0]
+        request = validate(path, request)
+        key = self.request_key(path, request)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._cache[key], "hit"
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key]), "coalesced"
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.stats["solves"] += 1
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, function, request)
+            data = json.dumps(result).encode()
+        except Exception as error:
+            future.set_exception(error)
+            # retrieved here, so that a request nobody joined does not log an unretrieved exception
+            future.exception()
+            raise
+        else:
+            future.set_result(data)
+        finally:
+            del self._inflight[key]
+            if not future.done():
+                # the request was cancelled, the requests that joined it are too
+                future.cancel()
+
+        self._cache[key] = data
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return data, "miss"
+
+    async def respond(self, method, path, body):
+        """
+        Returns the status, json body and cache source of a request
+        """
+        self.stats["requests"] += 1
+        try:
+            if method == "GET" and path == "/health":
+                return 200, json.dumps({"status": "ok"}).encode(), None
+            if method == "GET" and path == "/stats":
+                stats = {**self.stats, "inflight": len(self._inflight), "cached": len(self._cache)}
+                return 200, json.dumps(stats).encode(), None
+            if path not in ENDPOINTS:
+                raise RequestError(404, "no endpoint %s" % path)
+            if method != "POST":
+                raise RequestError(405, "%s takes POST requests" % path)
+
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError as error:
+                raise RequestError(400, "invalid json: %s" % error) from error
+            if not isinstance(request, dict):
+                raise RequestError(400, "the request must be a json object")
+
+            data, source = await self.call(path, request)
+            return 200, data, source
+        except RequestError as error:
+            self.stats["errors"] += 1
+            return error.status, json.dumps({"error": str(error)}).encode(), None
+        except Exception as error:
+            self.stats["errors"] += 1
+            return 500, json.dumps({"error": repr(error)}).encode(), None
+
+    async def _handle(self, reader, writer):
+        self._handlers[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    status, data, source = 413, json.dumps({"error": "request too large"}).encode(), None
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length)
+                    method, target = request_line.decode("latin-1").split()[:2]
+                    status, data, source = await self.respond(method, target.split("?")[0], body)
+
+                extra = b"X-Cache: %s\r\n" % source.encode() if source else b""
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n%s\r\n"
+                             % (status, b"OK" if status == 200 else b"Error", len(data), extra) + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._handlers.pop(writer, None)
+            writer.close()
+
+    async def start(self):
+        """
+        Starts the worker processes, waits until they have loaded their data and starts listening
+        """
+        self._pool = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self.warm,))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._pool, _ping) for _ in range(self.processes)])
+
+        if self.unix_path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, self.unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        # closing the open connections ends their handlers, which would otherwise wait for the next request
+        self._server.close()
+        handlers = list(self._handlers.values())
+        for writer in list(self._handlers):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self._server.wait_closed()
+        self._pool.shutdown(cancel_futures=True)
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+    @property
+    def url(self):
+        return "unix:" + self.unix_path if self.unix_path is not None else "http://%s:%d" % (self.host, self.port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve bus and bike planning requests from warm worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of host and port")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="the number of worker processes")
+    parser.add_argument("--cache-size", type=int, default=1024, help="the number of responses kept")
+    parser.add_argument("--warm", nargs="*", choices=("bus", "bike"), default=["bus", "bike"],
+                        help="the data every worker loads when it starts")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        service = await PlanningService(args.host, args.port, args.unix, args.processes, args.cache_size, args.warm).start()
+        print("serving on", service.url)
+        try:
+            await service._server.serve_forever()
+        finally:
+            await service.stop()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from qiskit.utils import algorithm_globals
+from qiskit.primitives import Sampler
+from qiskit.algorithms.optimizers import SPSA
+from qiskit.algorithms.optimizers.spsa import powerseries
+
+# one lock for the whole process, since every package shares qiskit's algorithm_globals generator
+_ALGORITHM_GLOBALS_LOCK = threading.Lock()
+
+
+class SeededSPSA(SPSA):
+    def __init__(self, seed=None, **options):
+        """
+        SPSA drawing its random perturbations, those of its calibration included, from its own generator instead of
+        qiskit's process-wide algorithm_globals, so that solves running concurrently need no lock
+
+        It overrides SPSA._point_estimate and repeats the defaults of SPSA.calibrate as they are in qiskit 0.44.1
+        (qiskit-terra 0.25.1), which setup.py pins
+
+        Parameters
+        ----------
+        seed : int or numpy.random.Generator
+            The seed of the perturbations
+        options : dict
+            The options of SPSA, e.g. maxiter
+        """
+        super().__init__(**options)
+        self.rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+    def perturb(self, dim, perturbation_dims=None):
+        # qiskit's bernoulli_perturbation on this optimizer's generator
+        if perturbation_dims is None:
+            return 1 - 2 * self.rng.binomial(1, 0.5, size=dim)
+        result = np.zeros(dim)
+        result[self.rng.choice(dim, size=perturbation_dims, replace=False)] = 1 - 2 * self.rng.binomial(1, 0.5, size=perturbation_dims)
+        return result
+
+    def _point_estimate(self, loss, x, eps, num_samples):
+        deltas1 = [self.perturb(x.size, self.perturbation_dims) for _ in range(num_samples)]
+        deltas2 = [self.perturb(x.size, self.perturbation_dims) if self.second_order else None for _ in range(num_samples)]
+
+        value, gradient, hessian = 0, np.zeros(x.size), np.zeros((x.size, x.size))
+        for delta1, delta2 in zip(deltas1, deltas2):
+            value_sample, gradient_sample, hessian_sample = self._point_sample(loss, x, eps, delta1, delta2)
+            value += value_sample
+            gradient += gradient_sample
+            if self.second_order:
+                hessian += hessian_sample
+
+        return value / num_samples, gradient / num_samples, hessian / num_samples
+
+    def minimize(self, fun, x0, jac=None, bounds=None):
+        if self.learning_rate is not None or self.perturbation is not None:
+            return super().minimize(fun, x0, jac, bounds)
+
+        # SPSA.calibrate with its defaults, the first step is 2 pi / 10 on average over 25 random directions
+        c, target = 0.2, 2 * np.pi / 10
+        x0 = np.asarray(x0, dtype=float)
+        deltas = [self.perturb(x0.size) for _ in range(25)]
+        magnitude = np.mean([abs(fun(x0 + c * delta) - fun(x0 - c * delta)) / (2 * c) for delta in deltas])
+        a = target / magnitude if magnitude > 0 and target / magnitude >= 1e-10 else target
+
+        self.learning_rate, self.perturbation = lambda: powerseries(a, 0.602, 0), lambda: powerseries(c, 0.101)
+        try:
+            return super().minimize(fun, x0, jac, bounds)
+        finally:
+            self.learning_rate = self.perturbation = None
+
+
+class SolveContext:
+    def __init__(self, seed=None):
+        """
+        Holds all the randomness of a single solve, so that solves running concurrently in threads
+        neither interfere with each other nor touch the process-wide random state
+
+        Parameters
+        ----------
+        seed : int or numpy.random.Generator
+            The seed of the solve, or a generator to draw from. None gives a fresh unseeded generator
+        """
+        if isinstance(seed, np.random.Generator):
+            self.rng = seed
+        else:
+            self.rng = np.random.default_rng(seed)
+
+    def child_seed(self):
+        """
+        Draws an integer seed for a component that takes its own seed (neal, qiskit primitives)
+        """
+        return int(self.rng.integers(2**31 - 1))
+
+    def sampler(self):
+        """
+        Returns a qiskit Sampler whose shot sampling is seeded from this context
+        """
+        return Sampler(options={"seed": self.child_seed()})
+
+    def spsa(self, **options):
+        """
+        Returns an SPSA optimizer whose perturbations are seeded from this context, see SeededSPSA
+        """
+        return SeededSPSA(self.child_seed(), **options)
+
+    def initial_point(self, ansatz):
+        """
+        Draws the starting point of a variational ansatz uniformly within its parameter bounds, [-2 pi, 2 pi] for
+        unbounded parameters, like qiskit does when no starting point is given but from this context
+        """
+        bounds = getattr(ansatz, "parameter_bounds", None) or [(None, None)] * ansatz.num_parameters
+        low = [-2 * np.pi if lower is None else lower for lower, _ in bounds]
+        high = [2 * np.pi if upper is None else upper for _, upper in bounds]
+        return self.rng.uniform(low, high)
+
+    @contextmanager
+    def algorithm_globals(self):
+        """
+        Seeds qiskit's algorithm_globals from this context for the duration of the block, for components that
+        read nothing but the global generator. The solvers of this package are seeded without it.
+        The block holds a process-wide lock, so only wrap the parts that actually read the global generator
+        """
+        with _ALGORITHM_GLOBALS_LOCK:
+            algorithm_globals.random_seed = self.child_seed()
+            yield
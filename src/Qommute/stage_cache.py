@@ -0,0 +1,228 @@
+import hashlib
+import inspect
+import os
+import pickle
+import time
+
+from .instrumentation import stage as profile
+
+# the user's cache directory, shared by runs from any working directory and writable wherever the package is installed
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "qommute", "stage_cache")
+
+# the top-level package, whose functions are followed when a stage's code is hashed
+_PACKAGE = __name__.split(".")[0]
+
+
+def _update_with_code(digest, code, namespace=None, seen=None):
+    """
+    Hashes the bytecode and constants of a function, including those of the functions defined inside it and of the
+    functions of this package it calls by their global name, recursively. Methods called through an attribute, e.g.
+    self.load, and code outside this package are not followed, so editing them does not invalidate an output
+    """
+    seen = set() if seen is None else seen
+    if code in seen:
+        return
+    seen.add(code)
+
+    digest.update(code.co_code)
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _update_with_code(digest, const, namespace, seen)
+        else:
+            digest.update(repr(const).encode())
+
+    for name in code.co_names:
+        callee = (namespace or {}).get(name)
+        if inspect.isfunction(callee) and callee.__module__.split(".")[0] == _PACKAGE:
+            _update_with_code(digest, callee.__code__, callee.__globals__, seen)
+
+
+class StageCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_age=7 * 24 * 3600, max_size=256 * 1024**2, enabled=True):
+        """
+        Memoizes the output of every pipeline stage on disk, keyed by a hash of its input files, its parameters
+        and the keys of the stages it depends on, so that a stage whose inputs did not change is loaded instead of rerun
+
+        Parameters
+        ----------
+        cache_dir : str
+            The directory holding one pickle per stage output, $XDG_CACHE_HOME/qommute/stage_cache by default
+        max_age : float
+            Outputs not used for this many seconds are evicted
+        max_size : int
+            The largest total size in bytes of the cache, the least recently used outputs are evicted above it
+        enabled : bool
+            If False every stage is run and nothing is read or written
+        """
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_size = max_size
+        self.enabled = enabled
+
+        # per stage counts of hits and misses and the time spent, for report
+        self.stats = {}
+
+        # content digests of the files seen so far, keyed by path, modification time and size
+        self._digests = {}
+
+    def file_digest(self, file_path):
+        """
+        Returns the sha256 of the content of a file, hashed once per version of the file
+        """
+        stat = os.stat(file_path)
+        version = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+        if version not in self._digests:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as fp:
+                for block in iter(lambda: fp.read(1 << 20), b""):
+                    digest.update(block)
+            self._digests[version] = digest.hexdigest()
+
+        return self._digests[version]
+
+    def key(self, stage, files=(), params=None, inputs=(), func=None):
+        """
+        Returns the content address of a stage output
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage
+        files : tuple
+            The paths of the files the stage reads, hashed by content so that moving or touching them keeps the key
+        params : dict
+            The parameters of the stage, hashed by their repr
+        inputs : tuple
+            The keys of the stages whose outputs are the arguments of this one
+        func : callable
+            The stage itself, its bytecode and that of the package functions it calls are hashed so that editing
+            them invalidates its outputs, see _update_with_code
+
+        Returns
+        -------
+        key : str
+            The hex digest
+        """
+        digest = hashlib.sha256(stage.encode())
+        code = getattr(func, "__code__", None)
+        if code is not None:
+            _update_with_code(digest, code, getattr(func, "__globals__", None))
+        for file_path in files:
+            digest.update(self.file_digest(file_path).encode())
+        digest.update(repr(sorted((params or {}).items())).encode())
+        for key in inputs:
+            digest.update(key.encode())
+        return digest.hexdigest()
+
+    def run(self, stage, func, *args, files=(), params=None, inputs=()):
+        """
+        Returns the output of func(*args, **params), from disk if the same stage ran before on the same inputs
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage
+        func : callable
+            The stage, called with args and then params as keyword arguments
+        files : tuple
+            The paths of the files the stage reads, they must also be among args or params
+        params : dict
+            The keyword arguments of the stage
+        inputs : tuple
+            The keys of the stages that produced args
+
+        Returns
+        -------
+        output : object
+            The output of the stage
+        key : str
+            Its content address, to pass as an input of the stages that depend on it
+        """
+        params = params or {}
+        stats = self.stats.setdefault(stage, {"hits": 0, "misses": 0, "seconds": 0.0})
+        start = time.perf_counter()
+
+        # every stage is also a span of the instrumentation, with whether it came from disk
+        with profile("cache." + stage) as span:
+            key = self.key(stage, files, params, inputs, func) if self.enabled else ""
+            file_path = os.path.join(self.cache_dir, stage + "-" + key[:32] + ".pkl")
+
+            hit = False
+            if self.enabled and os.path.exists(file_path):
+                try:
+                    with open(file_path, 'rb') as fp:
+                        output = pickle.load(fp)
+                    # touched on every hit, so that eviction by age removes the least recently used outputs
+                    os.utime(file_path)
+                    hit = True
+                    stats["hits"] += 1
+                except (OSError, pickle.UnpicklingError, EOFError):
+                    hit = False
+
+            if not hit:
+                output = func(*args, **params)
+                stats["misses"] += 1
+
+                if self.enabled:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+
+                    # written next to the target first, so that a reader never sees half a pickle
+                    temporary = file_path + ".%d.tmp" % os.getpid()
+                    with open(temporary, 'wb') as fp:
+                        pickle.dump(output, fp, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(temporary, file_path)
+
+            stats["seconds"] += time.perf_counter() - start
+            span.set(cache_hit=hit)
+
+        return output, key
+
+    def evict(self):
+        """
+        Removes the outputs older than max_age, then the least recently used ones until the cache fits in max_size.
+        A disabled cache removes nothing, and only the outputs of a cache are ever removed from its directory
+
+        Returns
+        -------
+        removed : int
+            The number of removed outputs
+        """
+        if not self.enabled or not os.path.isdir(self.cache_dir):
+            return 0
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            file_path = os.path.join(self.cache_dir, name)
+            stat = os.stat(file_path)
+            entries.append((stat.st_mtime, stat.st_size, file_path))
+
+        # oldest first
+        entries.sort()
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+
+        for mtime, size, file_path in entries:
+            if now - mtime <= self.max_age and total <= self.max_size:
+                break
+            os.remove(file_path)
+            total -= size
+            removed += 1
+
+        return removed
+
+    def report(self):
+        """
+        Returns the hits, misses and seconds of every stage run so far, and their totals
+        """
+        report = {stage: dict(stats) for stage, stats in self.stats.items()}
+        report["total"] = {
+            "hits": sum(stats["hits"] for stats in self.stats.values()),
+            "misses": sum(stats["misses"] for stats in self.stats.values()),
+            "seconds": sum(stats["seconds"] for stats in self.stats.values()),
+        }
+        return report
@@ -0,0 +1,173 @@
+import math
+
+import numpy as np
+
+from .solve_context import SolveContext
+
+
+class SwapAnnealer:
+    def __init__(self, edges, weights, costs, stations, coefficients=(100, 100, 100)):
+        """
+        Simulated annealing over placements with exactly `stations` selected nodes.
+        Every move swaps a selected and an unselected node, so the cardinality penalty H_3 is never built
+        and every sample is feasible. Only the sparse terms A * H_1 + B * H_2 are kept, in memory linear in the edges.
+
+        Parameters
+        ----------
+        edges : numpy.ndarray
+            An (m, 2) array of the node indices of every edge
+        weights : numpy.ndarray
+            The normalized H_1 weight of every edge
+        costs : numpy.ndarray
+            The H_2 cost of every node
+        stations : int
+            The number of nodes to select
+        coefficients : tuple
+            The coefficients A, B, C of the Hamiltonian, C is unused
+        """
+        A, B = coefficients[0], coefficients[1]
+
+        self.n = len(costs)
+        self.stations = stations
+        self.edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.weights = A * np.asarray(weights, dtype=float)
+        self.linear = B * np.asarray(costs, dtype=float)
+
+        if not 0 < stations < self.n:
+            raise ValueError("stations must be between 1 and the number of nodes - 1, got %d" % stations)
+
+        # adjacency with parallel edges merged, used for the O(degree) updates
+        self.neighbors = [dict() for _ in range(self.n)]
+        for (i, j), w in zip(self.edges.tolist(), self.weights.tolist()):
+            self.neighbors[i][j] = self.neighbors[i].get(j, 0.0) + w
+            self.neighbors[j][i] = self.neighbors[j].get(i, 0.0) + w
+
+    def energy(self, x):
+        """
+        Evaluates A * H_1 + B * H_2 for one or more selection vectors
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            A selection vector of shape (n,) or a batch of shape (reads, n)
+
+        Returns
+        -------
+        energy : float or numpy.ndarray
+        """
+        x = np.asarray(x, dtype=float)
+        unselected = 1 - x
+        h_1 = (unselected[..., self.edges[:, 0]] * unselected[..., self.edges[:, 1]]) @ self.weights
+        return h_1 + x @ self.linear
+
+    def default_beta_range(self):
+        """
+        Hot temperature accepts the largest possible swap with probability 1/2, cold temperature rejects the smallest term with probability 0.99
+        """
+        degree_weight = np.zeros(self.n)
+        np.add.at(degree_weight, self.edges[:, 0], self.weights)
+        np.add.at(degree_weight, self.edges[:, 1], self.weights)
+        largest = 2 * np.max(degree_weight + np.abs(self.linear))
+
+        terms = np.concatenate((self.weights, np.abs(self.linear)))
+        terms = terms[terms > 0]
+        smallest = np.min(terms) if len(terms) else 1.0
+
+        if largest == 0:
+            largest = 1.0
+
+        return math.log(2) / largest, math.log(100) / smallest
+
+    def sample(self, num_reads=10, num_sweeps=100, beta_range=None, initial_states=None, seed=None):
+        """
+        Runs the annealer
+
+        Parameters
+        ----------
+        num_reads : int
+            The number of independent runs
+        num_sweeps : int
+            The number of sweeps per run, a sweep being n proposed swaps
+        beta_range : tuple
+            The hot and cold inverse temperatures of the geometric schedule, derived from the coefficients if None
+        initial_states : numpy.ndarray
+            Feasible starting selections of shape (reads, n), cycled over the reads. Random selections if None
+        seed : int or numpy.random.Generator
+            The seed of the run
+
+        Returns
+        -------
+        samples : numpy.ndarray
+            The best selection found by every run, of shape (num_reads, n)
+        energies : numpy.ndarray
+            Their energies
+        """
+        context = SolveContext(seed)
+        rng = context.rng
+
+        if beta_range is None:
+            beta_range = self.default_beta_range()
+        if initial_states is not None:
+            initial_states = np.atleast_2d(np.asarray(initial_states, dtype=np.int8))
+            if np.any(initial_states.sum(axis=1) != self.stations):
+                raise ValueError("initial states must select exactly %d nodes" % self.stations)
+
+        num_moves = num_sweeps * self.n
+        betas = np.geomspace(beta_range[0], beta_range[1], num_moves)
+
+        samples = np.zeros((num_reads, self.n), dtype=np.int8)
+        energies = np.zeros(num_reads)
+
+        for read in range(num_reads):
+            if initial_states is None:
+                x = np.zeros(self.n, dtype=np.int8)
+                x[rng.choice(self.n, self.stations, replace=False)] = 1
+            else:
+                x = initial_states[read % len(initial_states)].copy()
+
+            samples[read], energies[read] = self._anneal(x, betas, rng)
+
+        return samples, energies
+
+    def _anneal(self, x, betas, rng):
+        neighbors = self.neighbors
+        linear = self.linear.tolist()
+
+        # zero[i] is the H_1 weight between node i and its unselected neighbours
+        unselected = 1 - x.astype(float)
+        zero = np.zeros(self.n)
+        np.add.at(zero, self.edges[:, 0], self.weights * unselected[self.edges[:, 1]])
+        np.add.at(zero, self.edges[:, 1], self.weights * unselected[self.edges[:, 0]])
+        zero = zero.tolist()
+
+        selected = [int(i) for i in np.flatnonzero(x)]
+        others = [int(i) for i in np.flatnonzero(x == 0)]
+
+        energy = float(self.energy(x))
+        best_energy, best_x = energy, x.copy()
+
+        outs = rng.integers(len(selected), size=len(betas)).tolist()
+        ins = rng.integers(len(others), size=len(betas)).tolist()
+        thresholds = np.log(rng.random(len(betas))).tolist()
+
+        for beta, a, b, threshold in zip(betas.tolist(), outs, ins, thresholds):
+            i, j = selected[a], others[b]
+
+            # removing i unselects its edges to unselected nodes, adding j selects j's, the edge i-j itself stays unselected on one side
+            delta = (zero[i] - linear[i]) + (linear[j] - zero[j]) - neighbors[i].get(j, 0.0)
+
+            if delta > 0 and -beta * delta < threshold:
+                continue
+
+            selected[a], others[b] = j, i
+            x[i], x[j] = 0, 1
+            for u, w in neighbors[i].items():
+                zero[u] += w
+            for u, w in neighbors[j].items():
+                zero[u] -= w
+
+            energy += delta
+            if energy < best_energy:
+                best_energy, best_x = energy, x.copy()
+
+        return best_x, best_energy
@@ -0,0 +1,2 @@
+from .builder import TravelTimeBuilder, read_locations, read_travel_times, read_unroutable
+from .providers import Provider, OSRMProvider, MapboxProvider
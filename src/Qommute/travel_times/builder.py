@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import csv
+import os
+import random
+
+from ..instrumentation import stage
+from .client import HTTPClient, HTTPError, RateLimiter
+from .providers import MapboxProvider, OSRMProvider
+
+HEADER = ["start", "end", "duration (mins)", "status"]
+
+# the status of a pair without a duration: the provider found no route, or refused the request for good
+NO_ROUTE, FAILED = "no_route", "failed"
+
+# statuses worth asking again for, anything else is a permanent failure of the pair
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def read_locations(file_path):
+    """
+    Reads station names and coordinates from a csv file shaped like bus_station_location.csv
+
+    Returns
+    -------
+    coordinates : dict
+        The latitude and longitude with the name of the station as key
+    """
+    with open(file_path, 'r') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader)
+        return {row[0]: (float(row[1]), float(row[2])) for row in reader}
+
+
+def _drop_partial_line(file_path):
+    # a build killed mid-write can leave a last line without its newline, whose duration may be cut short
+    with open(file_path, 'rb+') as fp:
+        data = fp.read()
+        if data and not data.endswith(b"\n"):
+            fp.truncate(data.rfind(b"\n") + 1)
+
+
+def read_travel_times(file_path):
+    """
+    Reads a travel time file shaped like station_distance.csv
+
+    Returns
+    -------
+    durations : dict
+        The travel time in minutes with the (start, end) pair as key
+    """
+    durations = {}
+    if not os.path.exists(file_path):
+        return durations
+    _drop_partial_line(file_path)
+
+    with open(file_path, 'r', newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)
+        for row in reader:
+            try:
+                durations[(row[0], row[1])] = float(row[2])
+            except (IndexError, ValueError):
+                continue
+    return durations
+
+
+def read_unroutable(file_path):
+    """
+    Reads the pairs of a travel time file that are marked as without a route or permanently failed, and have no
+    duration in the file
+
+    Returns
+    -------
+    pairs : dict
+        The status of every such (start, end) pair
+    """
+    pairs = {}
+    if not os.path.exists(file_path):
+        return pairs
+    _drop_partial_line(file_path)
+
+    with open(file_path, 'r', newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)
+        for row in reader:
+            if len(row) > 3 and not row[2] and row[3] in (NO_ROUTE, FAILED):
+                pairs[(row[0], row[1])] = row[3]
+    # a pair asked again and answered keeps its duration
+    return {pair: status for pair, status in pairs.items() if pair not in read_travel_times(file_path)}
+
+
+class TravelTimeBuilder:
+    def __init__(self, provider, concurrency=16, rate=None, retries=5, backoff=0.5, seed=0):
+        """
+        Fetches the travel times between stations from a routing provider, many requests at a time
+
+        Parameters
+        ----------
+        provider : Provider
+            The routing service, e.g. OSRMProvider or MapboxProvider
+        concurrency : int
+            The largest number of requests in flight, which is also the size of the connection pool
+        rate : float
+            The largest number of requests per second, None for no limit
+        retries : int
+            The number of times a failed request is sent again
+        backoff : float
+            The seconds waited before the first retry, doubled for every further one
+        seed : int
+            The seed of the retry jitter
+        """
+        self.provider = provider
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self._random = random.Random(seed)
+
+    def missing_pairs(self, coordinates, known):
+        """
+        Returns the ordered pairs of distinct stations whose travel time is not known yet
+
+        Parameters
+        ----------
+        coordinates : dict
+            The latitude and longitude with the name of the station as key
+        known : dict
+            The travel times already fetched, with the (start, end) pair as key
+        """
+        return [(start, end) for start in coordinates for end in coordinates
+                if start != end and (start, end) not in known]
+
+    def build(self, coordinates, file_path, retry_unroutable=False):
+        """
+        Fetches every missing travel time between the stations and appends it to the file as it arrives
+
+        The file is the checkpoint: an interrupted build keeps every row written so far, and the next build only
+        requests the pairs that are still missing. A pair without a route, whose request is refused with a status
+        that is not worth retrying, or whose server could not be reached on any attempt, is written with an empty
+        duration and its status, so that it is not requested again. A pair whose retries ran out on a throttled or
+        failing server is not written and is requested again by the next build
+
+        Parameters
+        ----------
+        coordinates : dict
+            The latitude and longitude with the name of the station as key
+        file_path : str
+            The travel time file, shaped like station_distance.csv
+        retry_unroutable : bool
+            Whether to request the pairs marked as without a route or failed again
+
+        Returns
+        -------
+        summary : dict
+            The number of pairs already known, marked in earlier builds, fetched, without a route, failed for good
+            and left unanswered after every retry
+        """
+        return asyncio.run(self.build_async(coordinates, file_path, retry_unroutable))
+
+    async def build_async(self, coordinates, file_path, retry_unroutable=False):
+        known = read_travel_times(file_path)
+        marked = {} if retry_unroutable else read_unroutable(file_path)
+        missing = [pair for pair in self.missing_pairs(coordinates, known) if pair not in marked]
+
+        # the pairs of one start station go together, so that one table request answers many of them
+        by_start = {}
+        for start, end in missing:
+            by_start.setdefault(start, []).append(end)
+        batches = [(start, ends[i:i + self.provider.batch])
+                   for start, ends in by_start.items() for i in range(0, len(ends), self.provider.batch)]
+
+        summary = {"known": len(known), "marked": len(marked), "fetched": 0, "no_route": 0, "failed": 0, "unanswered": 0}
+        client = HTTPClient(self.provider.base_url, connections=self.concurrency)
+        limiter = RateLimiter(self.rate, burst=self.concurrency)
+        queue = asyncio.Queue()
+        for batch in batches:
+            queue.put_nowait(batch)
+
+        new_file = not os.path.exists(file_path) or os.path.getsize(file_path) == 0
+        with stage("travel_times.build", pairs=len(missing), requests=len(batches)) as span, \
+                open(file_path, 'a', newline='') as fp:
+            writer = csv.writer(fp)
+            if new_file:
+                writer.writerow(HEADER)
+
+            async def worker():
+                while not queue.empty():
+                    start, ends = queue.get_nowait()
+                    durations, status = await self._fetch(client, limiter, coordinates[start], [coordinates[end] for end in ends])
+                    if status is None:
+                        summary["unanswered"] += len(ends)
+                        continue
+
+                    if status == FAILED:
+                        rows = [(start, end, "", FAILED) for end in ends]
+                        summary["failed"] += len(ends)
+                    else:
+                        rows = [(start, end, "", NO_ROUTE) if duration is None else (start, end, duration, "ok")
+                                for end, duration in zip(ends, durations)]
+                        summary["fetched"] += sum(duration is not None for duration in durations)
+                        summary["no_route"] += sum(duration is None for duration in durations)
+                    writer.writerows(rows)
+                    fp.flush()
+
+            try:
+                await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(batches)))))
+            finally:
+                await client.close()
+            span.set(**summary)
+
+        return summary
+
+    async def _fetch(self, client, limiter, start, ends):
+        # returns the durations and "ok", or None and FAILED for a refused request or a server that could not be
+        # reached on any attempt, or None and None once the retries of a throttled or failing server ran out
+        unreachable = False
+        for attempt in range(self.retries + 1):
+            await limiter.wait()
+            try:
+                body = await client.get(self.provider.path(start, ends))
+                return self.provider.parse(body, len(ends)), "ok"
+            except HTTPError as error:
+                if error.status not in RETRY_STATUSES:
+                    return None, FAILED
+                unreachable = False
+            except (OSError, asyncio.TimeoutError):
+                # refused and reset connections, failed name lookups (socket.gaierror) and timeouts
+                unreachable = True
+
+            # exponential backoff with jitter, so that throttled workers do not retry in lockstep
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2**attempt * (0.5 + self._random.random()))
+        return None, FAILED if unreachable else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch the missing travel times between stations from a routing service")
+    parser.add_argument("locations", help="a csv file of station names, latitudes and longitudes like bus_station_location.csv")
+    parser.add_argument("output", help="the travel time file to complete, like station_distance.csv")
+    parser.add_argument("--osrm", default="http://localhost:5000", help="the OSRM or stub server to query")
+    parser.add_argument("--mapbox", action="store_true", help="query Mapbox with the token in MAPBOX_TOKEN instead")
+    parser.add_argument("--profile", default="driving")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, help="the largest number of requests per second")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--retry-unroutable", action="store_true",
+                        help="request the pairs marked as without a route or failed in earlier builds again")
+    args = parser.parse_args(argv)
+
+    if args.mapbox:
+        provider = MapboxProvider(os.environ["MAPBOX_TOKEN"], args.profile)
+    else:
+        provider = OSRMProvider(args.osrm, args.profile)
+
+    builder = TravelTimeBuilder(provider, concurrency=args.concurrency, rate=args.rate, retries=args.retries)
+    summary = builder.build(read_locations(args.locations), args.output, args.retry_unroutable)
+    print("{known} known, {marked} marked before, {fetched} fetched, {no_route} without a route, {failed} failed, "
+          "{unanswered} unanswered".format(**summary))
+
+
+if __name__ == "__main__":
+    main()
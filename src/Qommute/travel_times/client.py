@@ -0,0 +1,143 @@
+import asyncio
+import time
+import urllib.parse
+
+
+class HTTPError(Exception):
+    def __init__(self, status, body=b""):
+        super().__init__("HTTP %d" % status)
+        self.status = status
+        self.body = body
+
+
+class HTTPClient:
+    def __init__(self, base_url, connections=8, timeout=30.0):
+        """
+        A minimal HTTP/1.1 client that keeps a pool of open connections to one host, with the standard library only
+
+        Parameters
+        ----------
+        base_url : str
+            The scheme, host and port of every request, e.g. "http://localhost:5000"
+        connections : int
+            The largest number of connections kept open at once
+        timeout : float
+            The seconds a request may take before it fails
+        """
+        url = urllib.parse.urlsplit(base_url)
+        self.host = url.hostname
+        self.ssl = url.scheme == "https"
+        self.port = url.port or (443 if self.ssl else 80)
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+
+        self._idle = []
+        self._slots = asyncio.Semaphore(connections)
+
+    async def get(self, path):
+        """
+        Sends a GET request on an idle connection, or a new one, and returns the body of a 2xx response
+
+        Parameters
+        ----------
+        path : str
+            The path and query of the request
+
+        Returns
+        -------
+        body : bytes
+            The body of the response, an HTTPError is raised for any other status
+        """
+        async with self._slots:
+            # a connection the server closed while idle fails on first use, so one fresh retry is allowed
+            for fresh in (False, True):
+                reader, writer = self._idle.pop() if self._idle and not fresh else await self._connect()
+                try:
+                    status, keep_alive, body = await asyncio.wait_for(self._request(reader, writer, path), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as error:
+                    writer.close()
+                    if fresh:
+                        raise ConnectionError("connection to %s:%d failed" % (self.host, self.port)) from error
+                    continue
+                except BaseException:
+                    writer.close()
+                    raise
+
+                if keep_alive:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+
+                if not 200 <= status < 300:
+                    raise HTTPError(status, body)
+                return body
+
+    async def _connect(self):
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl or None), self.timeout)
+
+    async def _request(self, reader, writer, path):
+        writer.write(("GET %s%s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\nAccept: application/json\r\n\r\n"
+                      % (self.prefix, path, self.host)).encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            body = b"".join(chunks)
+        else:
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        return status, headers.get("connection", "").lower() != "close", body
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=1):
+        """
+        Spaces out requests to at most rate per second on average, allowing bursts of up to burst requests
+
+        Parameters
+        ----------
+        rate : float
+            The requests per second, None for no limit
+        burst : int
+            The requests that may be sent at once after a pause
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if self.rate is None:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
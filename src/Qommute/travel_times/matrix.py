@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import rustworkx as rw
+
+from ..geo import haversine
+from ..instrumentation import stage
+from .builder import read_locations, read_travel_times
+
+# how every entry of the matrix was obtained, kept in sources.npy
+MEASURED, SHORTEST_PATH, ESTIMATED = 0, 1, 2
+
+
+def minutes_per_km(coordinates, durations):
+    """
+    Fits the travel time per straight-line kilometer from the known durations, the median ratio of the pairs
+
+    Parameters
+    ----------
+    coordinates : dict
+        The latitude and longitude with the name of the station as key
+    durations : dict
+        The known travel times in minutes with the (start, end) pair as key
+
+    Returns
+    -------
+    ratio : float
+        The minutes per kilometer, or 60 / 18 km/h * 1.4 detour if no pair is known
+    """
+    pairs = [(coordinates[start], coordinates[end], minutes) for (start, end), minutes in durations.items()
+             if start in coordinates and end in coordinates]
+    if not pairs:
+        return 60 / 18 * 1.4
+
+    starts, ends, minutes = zip(*pairs)
+    starts, ends = np.array(starts), np.array(ends)
+    km = haversine(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1])
+    keep = km > 0
+    return float(np.median(np.asarray(minutes)[keep] / km[keep])) if keep.any() else 60 / 18 * 1.4
+
+
+def complete(coordinates, durations, directory, ratio=None):
+    """
+    Completes the travel times between every pair of stations and writes them as a memory-mapped matrix
+
+    Known durations are kept. A missing pair takes the shortest path through the known durations, computed by
+    rustworkx's parallel all-pairs Dijkstra, and a pair no path connects takes a haversine estimate
+
+    Parameters
+    ----------
+    coordinates : dict
+        The latitude and longitude with the name of the station as key, their order gives the IDs
+    durations : dict
+        The known travel times in minutes with the (start, end) pair as key
+    directory : str
+        The directory the matrix is written to
+    ratio : float
+        The minutes per straight-line kilometer of the estimates, fitted on the known durations if None
+
+    Returns
+    -------
+    matrix : TravelTimeMatrix
+        The completed matrix, mapped from the directory
+    """
+    names = list(coordinates)
+    index = {name: i for i, name in enumerate(names)}
+    n = len(names)
+
+    os.makedirs(directory, exist_ok=True)
+    matrix = np.lib.format.open_memmap(os.path.join(directory, "durations.npy"), mode='w+', dtype=np.float32, shape=(n, n))
+    sources = np.lib.format.open_memmap(os.path.join(directory, "sources.npy"), mode='w+', dtype=np.int8, shape=(n, n))
+
+    with stage("travel_times.estimate", stations=n):
+        ratio = minutes_per_km(coordinates, durations) if ratio is None else ratio
+        points = np.array([coordinates[name] for name in names])
+        for first in range(0, n, 1024):
+            rows = points[first:first + 1024]
+            matrix[first:first + 1024] = ratio * haversine(rows[:, 0, None], rows[:, 1, None], points[None, :, 0], points[None, :, 1])
+        sources[:] = ESTIMATED
+
+    with stage("travel_times.shortest_paths", stations=n, known=len(durations)):
+        graph = rw.PyDiGraph()
+        graph.add_nodes_from(range(n))
+        known = [(index[start], index[end], minutes) for (start, end), minutes in durations.items()
+                 if start in index and end in index and start != end]
+        graph.add_edges_from(known)
+
+        for start, lengths in rw.all_pairs_dijkstra_path_lengths(graph, float).items():
+            if len(lengths):
+                ends = np.fromiter(lengths.keys(), dtype=np.int64, count=len(lengths))
+                matrix[start, ends] = np.fromiter(lengths.values(), dtype=np.float64, count=len(lengths))
+                sources[start, ends] = SHORTEST_PATH
+
+        if known:
+            starts, ends, minutes = (np.array(column) for column in zip(*known))
+            matrix[starts, ends] = minutes
+            sources[starts, ends] = MEASURED
+        np.fill_diagonal(matrix, 0)
+        np.fill_diagonal(sources, MEASURED)
+
+    matrix.flush()
+    sources.flush()
+    with open(os.path.join(directory, "index.json"), 'w') as fp:
+        json.dump({"names": names, "minutes_per_km": ratio}, fp)
+
+    return TravelTimeMatrix.load(directory)
+
+
+class TravelTimeMatrix:
+    def __init__(self, durations, sources, names):
+        """
+        The travel time between any two stations as one array lookup, see complete and load
+
+        Parameters
+        ----------
+        durations : numpy.ndarray
+            The (n, n) float32 travel times in minutes, usually memory-mapped
+        sources : numpy.ndarray
+            How every travel time was obtained, MEASURED, SHORTEST_PATH or ESTIMATED
+        names : list
+            The name of the station of every ID
+        """
+        self.durations = durations
+        self.sources = sources
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Maps a matrix written by complete, nothing is read from disk until it is used
+        """
+        with open(os.path.join(directory, "index.json")) as fp:
+            names = json.load(fp)["names"]
+        return cls(np.load(os.path.join(directory, "durations.npy"), mmap_mode='r'),
+                   np.load(os.path.join(directory, "sources.npy"), mmap_mode='r'), names)
+
+    def __len__(self):
+        return len(self.names) * (len(self.names) - 1)
+
+    def __contains__(self, pair):
+        return pair[0] in self.index and pair[1] in self.index and pair[0] != pair[1]
+
+    def __getitem__(self, pair):
+        return float(self.durations[self.index[pair[0]], self.index[pair[1]]])
+
+    def get(self, pair, default=None):
+        return self[pair] if pair in self else default
+
+    def ids(self, names):
+        """
+        Returns the IDs of the given station names
+        """
+        return np.array([self.index[name] for name in names], dtype=np.int64)
+
+    def submatrix(self, names):
+        """
+        Returns the travel times between the given stations as a dense (k, k) array, in their order
+        """
+        ids = self.ids(names)
+        return np.asarray(self.durations[np.ix_(ids, ids)])
+
+    def items(self, names=None):
+        """
+        Iterates over ((start, end), duration) like the dictionary of get_distance_between_stations
+
+        Parameters
+        ----------
+        names : list
+            Only the pairs between these stations, every station if None
+        """
+        names = self.names if names is None else [name for name in names if name in self.index]
+        durations = self.submatrix(names)
+        for i, start in enumerate(names):
+            for j, end in enumerate(names):
+                if i != j:
+                    yield (start, end), float(durations[i, j])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Complete the travel times between every pair of stations")
+    parser.add_argument("locations", help="a csv file of station names, latitudes and longitudes like bus_station_location.csv")
+    parser.add_argument("durations", help="the known travel times, like station_distance.csv")
+    parser.add_argument("output", help="the directory the matrix is written to")
+    args = parser.parse_args(argv)
+
+    matrix = complete(read_locations(args.locations), read_travel_times(args.durations), args.output)
+    counts = np.bincount(np.asarray(matrix.sources).ravel(), minlength=3)
+    print("{} stations: {} measured, {} shortest paths, {} estimated".format(len(matrix.names), counts[MEASURED] - len(matrix.names),
+                                                                            counts[SHORTEST_PATH], counts[ESTIMATED]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import json
+
+
+class Provider:
+    """
+    Turns station pairs into routing requests and responses into travel times in minutes
+
+    base_url is the host every request goes to and batch the largest number of end stations one request can
+    answer for a start station
+    """
+    base_url = None
+    batch = 1
+
+    def path(self, start, ends):
+        """
+        Returns the path and query of the request for the travel times from start to every end
+
+        Parameters
+        ----------
+        start : tuple
+            The latitude and longitude of the start station
+        ends : list
+            The latitudes and longitudes of at most batch end stations
+        """
+        raise NotImplementedError
+
+    def parse(self, body, count):
+        """
+        Returns the travel time in minutes to each of the count end stations, None where there is no route
+        """
+        raise NotImplementedError
+
+
+def _coordinates(points):
+    # routing services take longitude first
+    return ";".join("%.6f,%.6f" % (lon, lat) for lat, lon in points)
+
+
+class OSRMProvider(Provider):
+    def __init__(self, base_url="http://localhost:5000", profile="driving", batch=100):
+        """
+        An OSRM server, or the stub server, queried through its table service
+
+        Parameters
+        ----------
+        base_url : str
+            The scheme, host and port of the server
+        profile : str
+            The routing profile, e.g. "driving" or "cycling"
+        batch : int
+            The end stations per request
+        """
+        self.base_url = base_url
+        self.profile = profile
+        self.batch = batch
+
+    def path(self, start, ends):
+        return "/table/v1/%s/%s?sources=0&annotations=duration" % (self.profile, _coordinates([start] + list(ends)))
+
+    def parse(self, body, count):
+        durations = json.loads(body)["durations"][0][1:]
+        return [None if seconds is None else seconds / 60 for seconds in durations[:count]]
+
+
+class MapboxProvider(Provider):
+    base_url = "https://api.mapbox.com"
+
+    def __init__(self, token, profile="driving"):
+        """
+        The Mapbox directions service, one request per pair as the notebooks did
+
+        Parameters
+        ----------
+        token : str
+            The Mapbox access token
+        profile : str
+            The routing profile, "driving" for buses and "cycling" for bikes
+        """
+        self.token = token
+        self.profile = profile
+
+    def path(self, start, ends):
+        return ("/directions/v5/mapbox/%s/%s?alternatives=false&overview=false&steps=false&access_token=%s"
+                % (self.profile, _coordinates([start] + list(ends)), self.token))
+
+    def parse(self, body, count):
+        routes = json.loads(body).get("routes")
+        return [routes[0]["duration"] / 60 if routes else None]
@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import json
+import random
+import urllib.parse
+
+import numpy as np
+
+from ..geo import haversine
+
+
+class StubServer:
+    def __init__(self, host="127.0.0.1", port=5000, speed_kmh=18.0, detour=1.4, latency=0.0, failure_rate=0.0, seed=0):
+        """
+        A local stand-in for an OSRM server answering its route and table services from straight-line distances,
+        so that the travel time builder can be run and tested without network access
+
+        Parameters
+        ----------
+        host : str
+            The address to listen on
+        port : int
+            The port to listen on, 0 for any free port
+        speed_kmh : float
+            The average speed along the street network
+        detour : float
+            The ratio of the street distance to the straight-line distance
+        latency : float
+            The seconds every response is delayed by
+        failure_rate : float
+            The share of requests answered with 503, to exercise retries
+        seed : int
+            The seed of the failures
+        """
+        self.host = host
+        self.port = port
+        self.speed_kmh = speed_kmh
+        self.detour = detour
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+
+        self._random = random.Random(seed)
+        self._server = None
+        self._handlers = {}
+
+    def durations(self, points):
+        """
+        Returns the matrix of travel times in seconds between (longitude, latitude) points
+        """
+        lon, lat = np.asarray(points).T
+        km = haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+        return 3600 * km * self.detour / self.speed_kmh
+
+    def respond(self, path):
+        """
+        Returns the status and json body of a request path
+        """
+        url = urllib.parse.urlsplit(path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 4 or parts[0] not in ("route", "table"):
+            return 400, {"code": "InvalidUrl"}
+
+        try:
+            points = [tuple(map(float, point.split(","))) for point in parts[3].split(";")]
+        except ValueError:
+            return 400, {"code": "InvalidQuery"}
+
+        durations = self.durations(points)
+        if parts[0] == "route":
+            return 200, {"code": "Ok", "routes": [{"duration": float(durations[0, -1])}]}
+
+        sources = urllib.parse.parse_qs(url.query).get("sources", ["all"])[0]
+        rows = list(range(len(points))) if sources == "all" else [int(i) for i in sources.split(";")]
+        return 200, {"code": "Ok", "durations": durations[rows].tolist()}
+
+    async def _handle(self, reader, writer):
+        self._handlers[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                if self._random.random() < self.failure_rate:
+                    status, body = 503, {"code": "Busy"}
+                else:
+                    status, body = self.respond(request_line.split()[1].decode("latin-1"))
+
+                data = json.dumps(body).encode()
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                             % (status, b"OK" if status == 200 else b"Error", len(data)) + data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._handlers.pop(writer, None)
+            writer.close()
+
+    async def start(self):
+        """
+        Starts listening, the port is set to the one bound when 0 was asked for
+        """
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        # closing the open connections ends their handlers, which would otherwise wait for the next request
+        self._server.close()
+        handlers = list(self._handlers.values())
+        for writer in list(self._handlers):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    @property
+    def url(self):
+        return "http://%s:%d" % (self.host, self.port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve OSRM-like travel times from straight-line distances")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = await StubServer(args.host, args.port, latency=args.latency, failure_rate=args.failure_rate).start()
+        print("serving on", server.url)
+        await server._server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import csv
+import os
+
+from Qommute.bus.placement.demand import DATA_DIR, main
+
+
+def test_main_aggregates_bundled_counts_with_defaults(tmp_path):
+    counts = os.path.join(DATA_DIR, "in_n_out.csv")
+    output = str(tmp_path / "station_pop.csv")
+
+    main([counts, output])
+
+    with open(counts) as fp:
+        total = sum(float(row["total people"]) for row in csv.DictReader(fp))
+    with open(output) as fp:
+        rows = list(csv.DictReader(fp))
+
+    assert rows
+    # no row of in_n_out.csv is left out at the default distance, so the NTA totals add up to the whole count
+    assert abs(sum(float(row["total people"]) for row in rows) - total) < 1e-6 * total
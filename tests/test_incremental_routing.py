@@ -0,0 +1,40 @@
+import numpy as np
+
+from Qommute.bus.routing.incremental import improve_tour, tour_cost
+
+
+def distances(points):
+    return np.linalg.norm(points[:, None] - points[None], axis=2)
+
+
+def two_opt_gains(instance, route):
+    # every reversal of route[i:j + 1] that keeps the depot ends, from the tour costs
+    base = tour_cost(instance, route)
+    for i in range(1, len(route) - 2):
+        for j in range(i + 1, len(route) - 1):
+            yield tour_cost(instance, route[:i] + route[i:j + 1][::-1] + route[j + 1:]) - base
+
+
+def test_crossed_tour_is_uncrossed():
+    # the corners of a square visited across its diagonals
+    instance = distances(np.array([[0.0, 0.0], [1.0, 1.0], [1.0, 0.0], [0.0, 1.0]]))
+
+    route = improve_tour(instance, [0, 1, 2, 3, 0])
+
+    assert tour_cost(instance, route) == 4.0
+    assert route[0] == route[-1] == 0
+
+
+def test_improved_tour_has_no_improving_reversal():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        n = int(rng.integers(4, 12))
+        instance = distances(rng.random((n, 2)))
+        tour = [0] + (1 + rng.permutation(n - 1)).tolist() + [0]
+
+        route = improve_tour(instance, tour)
+
+        assert route[0] == route[-1] == 0
+        assert sorted(route[1:-1]) == list(range(1, n))
+        assert tour_cost(instance, route) <= tour_cost(instance, tour) + 1e-12
+        assert min(two_opt_gains(instance, route)) > -1e-9
@@ -0,0 +1,23 @@
+import json
+
+from Qommute.instrumentation import Profiler
+
+
+def test_spans_are_bounded_and_totals_count_every_span(tmp_path):
+    sink = tmp_path / "spans.jsonl"
+    profiler = Profiler(sink=str(sink), max_spans=3)
+
+    for _ in range(10):
+        with profiler.stage("outer"):
+            with profiler.stage("inner"):
+                pass
+    profiler.close()
+
+    report = profiler.report()
+    assert len(report["stages"]) == 3
+    assert report["totals"]["outer"]["calls"] == 10
+    assert report["totals"]["inner"]["calls"] == 10
+
+    lines = [json.loads(line) for line in sink.read_text().splitlines()]
+    assert len(lines) == 20
+    assert lines[0]["name"] == "inner" and lines[1]["parent_span_id"] is None
@@ -0,0 +1,46 @@
+import numpy as np
+
+from Qommute.multilevel import MultilevelSolver, coarsen, match_heavy_edges
+
+
+def test_coarsen_merges_matched_nodes():
+    # a path 0-1-2-3 whose short ends are matched, and a long edge 0-3 parallel to 1-2 once coarsened
+    edges = np.array([[0, 1], [1, 2], [2, 3], [0, 3]])
+    weights = np.array([0.5, 0.2, 0.3, 0.1])
+    linear = np.array([1.0, 2.0, 3.0, 4.0])
+    durations = np.array([1.0, 5.0, 1.0, 7.0])
+
+    mate = match_heavy_edges(4, edges, durations)
+    groups, (coarse_edges, coarse_weights, coarse_linear, coarse_durations) = coarsen(edges, weights, linear, durations, mate)
+
+    np.testing.assert_array_equal(mate, [1, 0, 3, 2])
+    np.testing.assert_array_equal(groups, [0, 0, 1, 1])
+    # the mean of the members minus the weight of the edge inside the group
+    np.testing.assert_allclose(coarse_linear, [1.5 - 0.5, 3.5 - 0.3])
+    np.testing.assert_array_equal(coarse_edges, [[0, 1]])
+    np.testing.assert_allclose(coarse_weights, [0.3])
+    np.testing.assert_allclose(coarse_durations, [5.0])
+
+
+def test_project_picks_the_best_member_of_every_selected_group():
+    rng = np.random.default_rng(0)
+    n = 60
+    edges = np.array([(i, j) for i in range(n) for j in range(i + 1, n) if rng.random() < 0.1])
+    weights, costs, durations = rng.random(len(edges)), rng.random(n), rng.random(len(edges))
+    solver = MultilevelSolver(edges, weights, costs, durations, stations=3, coarse_nodes=10)
+    assert len(solver.levels) > 1
+
+    coarse = solver.levels[1]
+    x = np.zeros(len(coarse[2]), dtype=np.int8)
+    x[[0, 2, 5]] = 1
+
+    fine = solver.project(1, x)
+
+    fine_edges, fine_weights, fine_linear, _ = solver.levels[0]
+    groups = solver.groups[0]
+    covered = np.bincount(fine_edges.ravel(), np.repeat(fine_weights, 2), minlength=n)
+    score = fine_linear - covered
+    assert fine.sum() == 3
+    for group in (0, 2, 5):
+        members = np.flatnonzero(groups == group)
+        assert np.flatnonzero(fine[members]).tolist() == [np.argmin(score[members])]
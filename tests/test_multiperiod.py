@@ -0,0 +1,61 @@
+import itertools
+
+import numpy as np
+
+from Qommute.bus.placement.multiperiod import BatchedAnnealer
+
+
+def small_problem(n=6, periods=3, seed=0):
+    rng = np.random.default_rng(seed)
+    edges = np.array([(i, j) for i in range(n) for j in range(i + 1, n) if rng.random() < 0.6] + [(0, 1)])
+    return edges, rng.random(len(edges)), rng.random((periods, n))
+
+
+def brute_force(annealer):
+    placements = []
+    for chosen in itertools.combinations(range(annealer.n), annealer.stations):
+        x = np.zeros(annealer.n, dtype=np.int8)
+        x[list(chosen)] = 1
+        placements.append(x)
+    best = np.inf
+    for combination in itertools.product(placements, repeat=annealer.periods):
+        x = np.array(combination)[None]
+        total = annealer.energy(x).sum() + annealer.robustness * annealer.coupling(x)[0]
+        best = min(best, total)
+    return best
+
+
+def best_total(annealer, samples, energies):
+    return np.min(energies.sum(axis=1) + annealer.robustness * annealer.coupling(samples))
+
+
+def test_swap_delta_reaches_the_optimum():
+    edges, weights, costs = small_problem()
+    annealer = BatchedAnnealer(edges, weights, costs, stations=2, coefficients=(3, 1, 0))
+
+    samples, energies = annealer.sample(num_reads=4, num_sweeps=100, seed=0)
+
+    assert np.all(samples.sum(axis=2) == 2)
+    np.testing.assert_allclose(energies, annealer.energy(samples))
+    assert np.isclose(best_total(annealer, samples, energies), brute_force(annealer))
+
+
+def test_coupling_delta_reaches_the_optimum():
+    edges, weights, costs = small_problem(seed=1)
+    # strong enough that the coupled optimum keeps some stations that single periods would move
+    annealer = BatchedAnnealer(edges, weights, costs, stations=2, coefficients=(3, 1, 0), robustness=0.3)
+
+    samples, energies = annealer.sample(num_reads=4, num_sweeps=100, seed=0)
+
+    assert np.isclose(best_total(annealer, samples, energies), brute_force(annealer))
+
+
+def test_strong_coupling_keeps_one_placement():
+    edges, weights, costs = small_problem(n=20, periods=4, seed=2)
+    # far above any swap of the periods' own energies, the anneal can only settle on one placement for all periods
+    annealer = BatchedAnnealer(edges, weights, costs, stations=4, coefficients=(3, 1, 0), robustness=2.0)
+
+    samples, energies = annealer.sample(num_reads=2, num_sweeps=30, seed=0)
+
+    totals = energies.sum(axis=1) + annealer.robustness * annealer.coupling(samples)
+    assert annealer.coupling(samples)[np.argmin(totals)] == 0
@@ -0,0 +1,54 @@
+import numpy as np
+import rustworkx as rw
+from scipy import sparse
+
+from Qommute.bus.placement.outage import dependencies
+
+
+def random_graph(n=15, p=0.25, seed=0):
+    rng = np.random.default_rng(seed)
+    graph = rw.PyGraph()
+    graph.add_nodes_from(range(n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            if rng.random() < p:
+                graph.add_edge(i, j, None)
+    # a parallel edge doubles the shortest paths through it, in rustworkx and in the sparse products alike
+    graph.add_edge(0, 1, None)
+    return graph
+
+
+def adjacency(graph):
+    edges = np.array(graph.edge_list())
+    ones = np.ones(2 * len(edges))
+    return sparse.csr_matrix((ones, (np.concatenate((edges[:, 0], edges[:, 1])),
+                                     np.concatenate((edges[:, 1], edges[:, 0])))),
+                             shape=(graph.num_nodes(), graph.num_nodes()))
+
+
+def test_all_sources_give_the_betweenness():
+    graph = random_graph()
+    n = graph.num_nodes()
+
+    dependency = dependencies(adjacency(graph), np.arange(n))
+
+    # rustworkx normalizes the undirected betweenness by (n - 1)(n - 2), the dependencies count both directions
+    centrality = rw.betweenness_centrality(graph)
+    expected = np.array([centrality[i] for i in range(n)]) * (n - 1) * (n - 2)
+    np.testing.assert_allclose(dependency, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_removed_node_gives_the_betweenness_without_it():
+    graph = random_graph(seed=1)
+    n = graph.num_nodes()
+    removed = 3
+    others = np.array([i for i in range(n) if i != removed])
+
+    dependency = dependencies(adjacency(graph), others, removed)
+
+    closed = graph.copy()
+    closed.remove_node(removed)
+    centrality = rw.betweenness_centrality(closed)
+    expected = np.array([centrality[i] for i in others]) * (n - 2) * (n - 3)
+    np.testing.assert_allclose(dependency[others], expected, rtol=1e-9, atol=1e-9)
+    assert dependency[removed] == 0
@@ -0,0 +1,24 @@
+import pytest
+
+from Qommute.service import BIKE_PLACE_DEFAULTS, RequestError, validate
+
+
+def test_validate_fills_defaults():
+    assert validate("/bike/place", {"docks": 3}) == {**BIKE_PLACE_DEFAULTS, "docks": 3}
+
+
+@pytest.mark.parametrize("path, request_", [
+    ("/bike/place", {"docks": "2"}),
+    ("/bike/place", {"docks": True}),
+    ("/bike/place", {"docks": 0}),
+    ("/bike/place", {"coefficients": [100, 100]}),
+    ("/bike/place", {"solver": "qaoa"}),
+    ("/bike/place", {"unknown": 1}),
+    ("/bus/place", {"stations": 2.5}),
+    ("/bus/route", {}),
+    ("/bus/route", {"coordinates": [[40.7, -74.0], [40.8]]}),
+])
+def test_validate_rejects_bad_requests(path, request_):
+    with pytest.raises(RequestError) as error:
+        validate(path, request_)
+    assert error.value.status == 400
@@ -0,0 +1,38 @@
+import numpy as np
+from qiskit.utils import algorithm_globals
+
+from Qommute.bus.routing.bus_routing import BusRoutingInstance, QuantumOptimizer
+from Qommute.solve_context import SeededSPSA
+
+
+def loss(x):
+    return float(np.sum((x - np.arange(len(x))) ** 2) + np.sum(np.sin(3 * x)))
+
+
+def test_seeded_spsa_ignores_the_global_generator():
+    results = []
+    for global_seed in (1, 2):
+        algorithm_globals.random_seed = global_seed
+        results.append(SeededSPSA(7, maxiter=30).minimize(loss, np.zeros(4)))
+
+    np.testing.assert_array_equal(results[0].x, results[1].x)
+    assert results[0].fun == results[1].fun
+
+    other = SeededSPSA(8, maxiter=30).minimize(loss, np.zeros(4))
+    assert not np.array_equal(other.x, results[0].x)
+
+
+def test_routing_solves_with_the_same_seed_match():
+    coordinates = np.array([[40.7, -73.9], [40.75, -73.95], [40.8, -73.92]])
+    _, _, instance = BusRoutingInstance(3).generate_instance_from_coordinates(coordinates)
+    optimizer = QuantumOptimizer(instance, 3, 2)
+    Q, g, c, _ = optimizer.binary_representation()
+    qp = optimizer.construct_problem(Q, g, c, 3)
+
+    solutions = []
+    for global_seed in (1, 2):
+        algorithm_globals.random_seed = global_seed
+        solutions.append(optimizer.solve_problem(qp, seed=5))
+
+    np.testing.assert_array_equal(solutions[0][0], solutions[1][0])
+    assert solutions[0][1] == solutions[1][1]
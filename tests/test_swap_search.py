@@ -0,0 +1,34 @@
+import numpy as np
+
+from Qommute.swap_search import SwapAnnealer
+
+
+def random_problem(n=12, m=30, seed=0):
+    rng = np.random.default_rng(seed)
+    edges = rng.integers(n, size=(m, 2))
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    # a repeated edge checks that parallel edges are merged in the swap delta
+    edges = np.vstack((edges, edges[:1]))
+    return edges, rng.random(len(edges)), rng.random(n)
+
+
+def test_tracked_energy_matches_recomputed():
+    edges, weights, costs = random_problem()
+    annealer = SwapAnnealer(edges, weights, costs, stations=4)
+
+    # a hot schedule accepts most swaps, so the energy is carried through many deltas
+    samples, energies = annealer.sample(num_reads=5, num_sweeps=20, beta_range=(1e-4, 1e-2), seed=1)
+
+    assert np.all(samples.sum(axis=1) == 4)
+    np.testing.assert_allclose(energies, annealer.energy(samples), rtol=0, atol=1e-9)
+
+
+def test_tracked_energy_from_initial_states():
+    edges, weights, costs = random_problem(seed=3)
+    annealer = SwapAnnealer(edges, weights, costs, stations=3, coefficients=(7, 2, 0))
+    start = np.zeros(12, dtype=np.int8)
+    start[:3] = 1
+
+    samples, energies = annealer.sample(num_reads=2, num_sweeps=30, initial_states=start, seed=2)
+
+    np.testing.assert_allclose(energies, annealer.energy(samples), rtol=0, atol=1e-9)